@@ -0,0 +1,60 @@
+"""Scaling of utils.dedup.merge_results with batch size
+
+Synthetic batches mix YouTube-style "Artist - Title (Official Video)"
+uploads with Spotify-style tracks of the same songs, so roughly a third of
+each batch are near-duplicates. Time per result should stay flat as the
+batch grows (MinHash buckets instead of comparing every pair).
+
+Usage: python benchmarks/bench_dedup.py [--sizes 10,100,1000,10000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.dedup import merge_results  # noqa: E402
+
+ARTISTS = ['محسن یگانه', 'شادمهر عقیلی', 'همایون شجریان', 'سیاوش قمیشی', 'Mohsen Yeganeh', 'Ebi', 'Googoosh']
+WORDS = ['دیره', 'عشق', 'باران', 'شب', 'دریا', 'ستاره', 'خاطره', 'تنهایی', 'Dire', 'Baran', 'Eshgh', 'Shab']
+LABELS = ['', ' (Official Video)', ' | موزیک ویدیو', ' [HD]', ' - آهنگ جدید']
+
+
+def make_batch(size: int, rng: random.Random) -> List[Dict]:
+    batch = []
+    while len(batch) < size:
+        artist = rng.choice(ARTISTS)
+        title = ' '.join(rng.sample(WORDS, 2)) + f' {rng.randint(1, 10 ** 6)}'
+        batch.append({'title': f'{artist} - {title}{rng.choice(LABELS)}', 'artist': 'Persian Music',
+                      'url': f'https://www.youtube.com/watch?v={len(batch)}', 'source': 'YouTube'})
+        if rng.random() < 0.5:
+            batch.append({'title': title, 'artist': artist,
+                          'url': f'https://open.spotify.com/track/{len(batch)}', 'source': 'Spotify'})
+    rng.shuffle(batch)
+    return batch[:size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10,100,1000,10000')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    for size in (int(value) for value in args.sizes.split(',')):
+        batch = make_batch(size, rng)
+        best = float('inf')
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            merged = merge_results(batch)
+            best = min(best, time.perf_counter() - started)
+        multi = sum(1 for result in merged if len(result['sources']) > 1)
+        print(f"{size:6d} results -> {len(merged):6d} merged ({multi} across providers)  "
+              f"{best * 1e3:8.2f} ms  {best / size * 1e6:6.1f} µs/result")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Cold import time of main.py, checked against a budget
+
+Each run imports main in a fresh interpreter with an empty environment, so
+the numbers include every module main pulls in and nothing is configured.
+Fails (exit status 1) when the median is over budget or when one of the
+lazily loaded SDKs was imported anyway.
+
+Usage: python benchmarks/bench_import.py [--runs 5] [--budget-ms 800] [--top 10]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on first use (or in the background after startup), never by the import
+LAZY_MODULES = ('google.generativeai', 'gtts')
+
+PROBE = (
+    "import sys, main; "
+    "print(','.join(name for name in {lazy!r} if name in sys.modules))"
+)
+
+
+def import_once() -> Tuple[int, Dict[str, int], List[str]]:
+    """Import main in a new interpreter
+
+    Returns its cumulative import time and that of each module it imports
+    directly, in microseconds, and the lazily loaded SDKs that got imported.
+    """
+    env = {'PATH': os.environ.get('PATH', ''), 'PYTHONPATH': ROOT}
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE.format(lazy=LAZY_MODULES)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    # Children are reported before their parent, two more spaces of indentation per level
+    children: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, total_us, name = line.split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children[name.strip()] = int(total_us)
+        elif depth == 0:
+            if name.strip() == 'main':
+                loaded = [lazy for lazy in result.stdout.strip().split(',') if lazy]
+                return int(total_us), children, loaded
+            children = {}
+    raise RuntimeError('main was not imported')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=800.0)
+    parser.add_argument('--top', type=int, default=10, help='slowest direct imports of main to list')
+    args = parser.parse_args()
+
+    totals = []
+    slowest: Dict[str, List[int]] = {}
+    loaded = set()
+    for _ in range(args.runs):
+        total_us, children, lazy_loaded = import_once()
+        totals.append(total_us / 1000)
+        loaded.update(lazy_loaded)
+        for name, micros in children.items():
+            slowest.setdefault(name, []).append(micros)
+
+    median = statistics.median(totals)
+    print(f"import main: median {median:.0f} ms, min {min(totals):.0f} ms, max {max(totals):.0f} ms "
+          f"over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    ranked = sorted(((statistics.median(values) / 1000, name) for name, values in slowest.items()), reverse=True)
+    for millis, name in ranked[:args.top]:
+        print(f"  {millis:8.1f} ms  {name}")
+
+    failed = False
+    if loaded:
+        print(f"FAIL: lazily loaded SDKs were imported: {', '.join(sorted(loaded))}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"FAIL: over the import budget by {median - args.budget_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
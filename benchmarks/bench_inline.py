@@ -0,0 +1,111 @@
+"""Inline query autocomplete: keystrokes that reach upstream and answer latency
+
+Simulates users typing inline queries one character at a time against
+utils.inline_search.InlineSearch, with a synthetic local index and a stand-in
+upstream that takes --upstream-ms per search. Answering every keystroke
+upstream would cost one search per character; the report shows how many
+went upstream instead and how fast the answered keystrokes were served.
+
+Usage: python benchmarks/bench_inline.py [--entries 100000] [--users 20] [--upstream-ms 250]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_search_index import FIRST_NAMES, LAST_NAMES, WORDS, write_catalogue  # noqa: E402
+from utils.inline_search import InlineSearch  # noqa: E402
+from utils.search_index import SearchIndex  # noqa: E402
+
+# Typed by the simulated users: artists the index knows and names it does not
+KNOWN = [f'{first} {last}' for first in FIRST_NAMES[:4] for last in LAST_NAMES[:3]]
+UNKNOWN = ['کامران هومن', 'مرتضی پاشایی', 'ماکان بند', 'حامد همایون']
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] if samples else 0.0
+
+
+async def run(args, index: SearchIndex) -> None:
+    upstream_calls = 0
+
+    async def upstream(kind: str, query: str) -> List[Dict]:
+        nonlocal upstream_calls
+        upstream_calls += 1
+        await asyncio.sleep(args.upstream_ms / 1000)
+        results = [{'title': f'{random.choice(WORDS)} {i}', 'artist': query,
+                    'url': f'https://www.youtube.com/watch?v={query}{i}', 'source': 'YouTube'} for i in range(5)]
+        index.add(kind, results)
+        return results
+
+    inline = InlineSearch(upstream, index=index, debounce=args.debounce_ms / 1000)
+    # Answers from the cache or the index come back at once, the others after the debounce
+    latencies: Dict[str, List[float]] = {'immediate': [], 'debounced': []}
+    keystrokes = 0
+
+    async def keystroke(user: int, text: str) -> None:
+        if len(text) < inline.min_chars:
+            return
+        started = time.perf_counter()
+        results = await inline.suggest(user, 'music', text)
+        elapsed = time.perf_counter() - started
+        if results is not None:
+            latencies['immediate' if elapsed < inline.debounce else 'debounced'].append(elapsed)
+
+    async def user(number: int) -> None:
+        nonlocal keystrokes
+        rng = random.Random(number)
+        tasks = []
+        for _ in range(args.queries):
+            query = rng.choice(KNOWN if rng.random() < args.known_ratio else UNKNOWN)
+            for length in range(1, len(query) + 1):
+                keystrokes += 1
+                # Each keystroke is its own update, handled while the next is typed
+                tasks.append(asyncio.ensure_future(keystroke(number, query[:length])))
+                await asyncio.sleep(rng.uniform(0.5, 1.5) * args.typing_ms / 1000)
+            # Pause before typing the next query
+            await asyncio.sleep(1.0)
+        await asyncio.gather(*tasks)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(number) for number in range(args.users)))
+    elapsed = time.perf_counter() - started
+
+    stats = inline.stats()
+    print(f"{keystrokes} keystrokes from {args.users} users in {elapsed:.1f}s: "
+          f"{upstream_calls} upstream searches ({upstream_calls / keystrokes:.1%} of keystrokes), "
+          f"{stats['superseded']} superseded, {stats['cache_hits']} cache hits, {stats['local_hits']} index hits")
+    for source, samples in latencies.items():
+        samples.sort()
+        print(f"  {source:10s} {len(samples):5d} answers  p50 {percentile(samples, 0.5) * 1e3:7.2f} ms  "
+              f"p99 {percentile(samples, 0.99) * 1e3:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=100_000)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--queries', type=int, default=3, help='queries typed by each user')
+    parser.add_argument('--known-ratio', type=float, default=0.7, help='share of queries the index can answer')
+    parser.add_argument('--typing-ms', type=float, default=150, help='mean time between keystrokes')
+    parser.add_argument('--debounce-ms', type=float, default=300)
+    parser.add_argument('--upstream-ms', type=float, default=250)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='inline-search-')
+    catalogue = os.path.join(workdir, 'catalogue.jsonl')
+    write_catalogue(catalogue, args.entries)
+    index = SearchIndex(os.path.join(workdir, 'index.sqlite3'))
+    index.import_jsonl(catalogue)
+    asyncio.run(run(args, index))
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
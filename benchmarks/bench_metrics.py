@@ -0,0 +1,77 @@
+"""Per-call overhead of utils.metrics on the hot paths
+
+Usage: python benchmarks/bench_metrics.py [iterations]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.metrics import MetricsRegistry  # noqa: E402
+
+
+def bench(func, iterations: int, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(iterations)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+async def handler(update, context):
+    return None
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    registry = MetricsRegistry()
+    histogram = registry.histogram('upstream_seconds', provider='YouTube')
+    instrumented = registry.instrument(handler)
+
+    def observe_cached(n):
+        for i in range(n):
+            histogram.observe(0.001 * (i % 1000))
+
+    def observe_by_name(n):
+        for i in range(n):
+            registry.observe('upstream_seconds', 0.001 * (i % 1000), provider='YouTube')
+
+    def inc_by_name(n):
+        for _ in range(n):
+            registry.inc('upstream_errors_total', provider='YouTube')
+
+    def run_handlers(func):
+        def run(n):
+            async def loop():
+                for _ in range(n):
+                    await func(None, None)
+            asyncio.run(loop())
+        return run
+
+    baseline = bench(run_handlers(handler), iterations)
+    cases = (
+        ('Histogram.observe (cached)', bench(observe_cached, iterations)),
+        ('registry.observe (by name)', bench(observe_by_name, iterations)),
+        ('registry.inc (by name)', bench(inc_by_name, iterations)),
+        ('bare handler call', baseline),
+        ('instrumented handler call', bench(run_handlers(instrumented), iterations)),
+    )
+    for name, elapsed in cases:
+        print(f"{name:30s} {elapsed / iterations * 1e9:8.0f} ns/call")
+    overhead = (cases[-1][1] - baseline) / iterations
+    print(f"instrument() overhead: {overhead * 1e9:.0f} ns per handler call")
+
+    # A scrape renders every series; measure it with a realistic number of them
+    for provider in range(20):
+        registry.observe('telegram_request_seconds', 0.1, endpoint=f'endpoint{provider}')
+    start = time.perf_counter()
+    for _ in range(100):
+        body = registry.render()
+    print(f"render(): {(time.perf_counter() - start) / 100 * 1e3:.2f} ms for {len(body):,} bytes")
+
+
+if __name__ == '__main__':
+    main()
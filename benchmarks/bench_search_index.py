@@ -0,0 +1,101 @@
+"""Lookup latency of utils.search_index.SearchIndex at catalogue scale
+
+Builds a synthetic catalogue of songs and movies (default 1M entries),
+bulk-loads it through export-format JSON lines, then times lookups for a
+popular artist (many matches), a specific title (a few) and a miss.
+
+Usage: python benchmarks/bench_search_index.py [--entries 1000000] [--path index.sqlite3]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.search_index import SearchIndex  # noqa: E402
+
+FIRST_NAMES = ['محسن', 'شادمهر', 'همایون', 'سیاوش', 'داریوش', 'ابی', 'گوگوش', 'معین', 'رضا', 'علی', 'مهدی', 'سامی']
+LAST_NAMES = ['یگانه', 'عقیلی', 'شجریان', 'قمیشی', 'اقبالی', 'صادقی', 'بهرامی', 'یراحی', 'زند', 'احمدی']
+WORDS = ['دیره', 'عشق', 'باران', 'شب', 'دریا', 'ستاره', 'خاطره', 'تنهایی', 'بهار', 'پاییز', 'دل', 'آسمان',
+         'سفر', 'رویا', 'نگاه', 'خیال', 'کوچه', 'ماه', 'آتش', 'سکوت', 'فردا', 'دیروز', 'پرواز', 'گل']
+
+
+def make_title(rng: random.Random) -> str:
+    return ' '.join(rng.sample(WORDS, rng.randint(1, 3))) + f' {rng.randint(1, 9999)}'
+
+
+def write_catalogue(path: str, entries: int, seed: int = 1) -> None:
+    rng = random.Random(seed)
+    now = time.time()
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(entries):
+            if i % 3:
+                artist = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+                record = {'kind': 'music', 'updated_at': now, 'result': {
+                    'title': make_title(rng), 'artist': artist,
+                    'url': f'https://www.youtube.com/watch?v=v{i}', 'source': 'YouTube'}}
+            else:
+                record = {'kind': 'movie', 'updated_at': now, 'result': {
+                    'title': make_title(rng), 'release_date': f'{rng.randint(1960, 2024)}-01-01',
+                    'tmdb_id': i, 'overview': '', 'vote_average': 7.0, 'source': 'TMDB'}}
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def timed(func: Callable[[], object], runs: int) -> List[float]:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return sorted(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=1_000_000)
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--path', default='', help='index file (default: a temporary file)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='search-index-')
+    catalogue = os.path.join(workdir, 'catalogue.jsonl')
+    path = args.path or os.path.join(workdir, 'index.sqlite3')
+
+    started = time.perf_counter()
+    write_catalogue(catalogue, args.entries)
+    print(f"generated {args.entries:,} entries in {time.perf_counter() - started:.1f}s")
+
+    index = SearchIndex(path)
+    started = time.perf_counter()
+    index.import_jsonl(catalogue)
+    elapsed = time.perf_counter() - started
+    print(f"imported in {elapsed:.1f}s ({args.entries / elapsed:,.0f} entries/s), "
+          f"index {os.path.getsize(path) / 2 ** 20:.0f} MiB")
+
+    cases = (
+        ('popular artist', 'music', 'محسن یگانه'),
+        ('artist + word', 'music', 'شادمهر عقیلی باران'),
+        ('specific title', 'music', 'ستاره 4242'),
+        ('movie + year', 'movie', 'دریا 1999'),
+        ('miss', 'music', 'کامران هومن'),
+    )
+    for name, kind, query in cases:
+        found = len(index.lookup(kind, query))
+        samples = timed(lambda: index.lookup(kind, query), args.runs)
+        p50 = samples[len(samples) // 2] * 1e3
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e3
+        print(f"{name:15s} {found:3d} results  p50 {p50:7.2f} ms  p99 {p99:7.2f} ms")
+
+    started = time.perf_counter()
+    exported = index.export_jsonl(os.path.join(workdir, 'export.jsonl'))
+    print(f"exported {exported:,} entries in {time.perf_counter() - started:.1f}s")
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Time to first audio for long replies: one gTTS call vs. sentence chunks in parallel
+
+gTTS splits text into pieces of at most 100 characters and requests them
+one after another, so a single call takes longer the longer the reply. A
+stand-in for gTTS sleeps --request-ms per such piece; the benchmark times
+VoiceUtils.text_to_speech_async (the whole reply in one call) against
+VoiceUtils.text_to_speech_parts on the same worker pool.
+
+Usage: python benchmarks/bench_speech_parts.py [--lengths 100,300,1000,2000] [--request-ms 300]
+"""
+import argparse
+import asyncio
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.voice_utils  # noqa: E402
+from utils.tts_pool import TTSWorkerPool  # noqa: E402
+from utils.voice_utils import VoiceUtils  # noqa: E402
+
+SENTENCES = [
+    "سلام بهنوش جان!",
+    "امروز می‌خوام درباره‌ی تاریخ ایران برات بگم.",
+    "ایران یکی از قدیمی‌ترین تمدن‌های جهانه، و تاریخش به هزاران سال پیش برمی‌گرده.",
+    "آیا می‌دونستی کوروش بزرگ منشور حقوق بشر رو نوشت؟",
+    "این منشور امروز توی موزه‌ی بریتانیا نگهداری می‌شه؛ خیلی‌ها برای دیدنش به لندن می‌رن.",
+]
+
+
+class StandInTTS:
+    """Sleeps like gTTS: one request per 100 characters, made one after another"""
+
+    request_seconds = 0.3
+
+    def __init__(self, text: str, lang: str = 'fa', slow: bool = False):
+        self.text = text
+
+    def write_to_fp(self, fp) -> None:
+        time.sleep(self.request_seconds * math.ceil(len(self.text) / 100))
+        fp.write(b'\xff\xfb' + b'\x00' * len(self.text))
+
+
+def reply_of(length: int) -> str:
+    text = ''
+    while len(text) < length:
+        text += SENTENCES[len(text) % len(SENTENCES)] + ' '
+    return text.strip()
+
+
+async def measure(text: str, pool: TTSWorkerPool, args) -> None:
+    started = time.perf_counter()
+    await VoiceUtils.text_to_speech_async(text, pool)
+    single = time.perf_counter() - started
+
+    started = time.perf_counter()
+    parts = []
+    async for _ in VoiceUtils.text_to_speech_parts(text, pool, chunk_chars=args.chunk_chars,
+                                                   first_chunk_chars=args.first_chunk_chars,
+                                                   concurrency=args.concurrency):
+        parts.append(time.perf_counter() - started)
+    print(f"{len(text):5d} chars  one call {single:5.2f}s  "
+          f"parts: first {parts[0]:5.2f}s, all {parts[-1]:5.2f}s ({len(parts)} messages)")
+
+
+async def run(args) -> None:
+    pool = TTSWorkerPool(max_workers=args.workers, max_queue=64, job_timeout=120)
+    try:
+        for length in (int(length) for length in args.lengths.split(',')):
+            await measure(reply_of(length), pool, args)
+    finally:
+        pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lengths', default='100,300,1000,2000', help='reply lengths in characters')
+    parser.add_argument('--request-ms', type=float, default=300, help='gTTS time per 100 characters')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--chunk-chars', type=int, default=200)
+    parser.add_argument('--first-chunk-chars', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=3)
+    args = parser.parse_args()
+
+    StandInTTS.request_seconds = args.request_ms / 1000
+    utils.voice_utils.gTTS = StandInTTS
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
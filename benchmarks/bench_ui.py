@@ -0,0 +1,64 @@
+"""Cost of the main menu reply markup per reply: built per call vs. the UI registry
+
+Measures what python-telegram-bot does with reply_markup before the HTTP
+request (object -> dict -> JSON) for a keyboard built on every call, a
+shared keyboard object and the registry's pre-serialized JSON.
+
+Usage: python benchmarks/bench_ui.py [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup  # noqa: E402
+from telegram.request._requestparameter import RequestParameter  # noqa: E402
+
+from utils.ui_registry import UIRegistry  # noqa: E402
+
+ROWS = [
+    [("🎵 جستجوی موزیک", 'search_music'), ("🎬 جستجوی فیلم", 'search_movie')],
+    [("😂 جک بگو", 'tell_joke'), ("💬 گفتگو", 'start_chat')],
+    [("📋 راهنما", 'show_help'), ("🔄 منوی اصلی", 'main_menu')]
+]
+
+
+def build_markup() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(text, callback_data=data) for text, data in row] for row in ROWS
+    ])
+
+
+def encode(markup) -> str:
+    return RequestParameter.from_input('reply_markup', markup).json_value
+
+
+def bench(func, iterations: int, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return best / iterations
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    ui = UIRegistry()
+    ui.add_keyboard('main_menu', ROWS)
+    ui.freeze()
+    shared = ui.keyboard('main_menu')
+
+    cases = (
+        ('built per call', lambda: encode(build_markup()), encode(build_markup())),
+        ('shared object', lambda: encode(shared), encode(shared)),
+        ('registry JSON', lambda: encode(ui.markup('main_menu')), encode(ui.markup('main_menu'))),
+    )
+    for name, func, payload in cases:
+        print(f"{name:16s} {bench(func, iterations) * 1e6:7.1f} µs/reply  {len(payload.encode()):5d} bytes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Size and encode cost of spoken replies: gTTS MP3 vs. OGG/Opus voice notes
+
+For each clip, reports the bytes per second of speech of the MP3 gTTS
+produced and of its Opus transcode at each bitrate, with the time
+utils.audio_encoder.OpusEncoder takes to encode it. Clips are synthesized
+with gTTS from the bot's jokes, or read from MP3 files given with --input.
+Needs ffmpeg (--ffmpeg) and, without --input, network access for gTTS.
+
+Usage: python benchmarks/bench_voice.py [--bitrates 12,16,24] [--input clip.mp3 ...] [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.audio_encoder import OpusEncoder, ogg_duration  # noqa: E402
+
+
+def synthesize(count: int, lang: str) -> List[Tuple[str, bytes]]:
+    from io import BytesIO
+    from main import JOKES
+    from utils.voice_utils import load_gtts
+
+    clips = []
+    for text in JOKES[:count]:
+        buffer = BytesIO()
+        load_gtts()(text=text, lang=lang).write_to_fp(buffer)
+        clips.append((text[:30], buffer.getvalue()))
+    return clips
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bitrates', default='12,16,24', help='Opus bitrates to compare, in kbps')
+    parser.add_argument('--sample-rate', type=int, default=24000)
+    parser.add_argument('--compression-level', type=int, default=5)
+    parser.add_argument('--ffmpeg', default='ffmpeg')
+    parser.add_argument('--input', nargs='*', default=[], help='MP3 files to use instead of synthesizing')
+    parser.add_argument('--clips', type=int, default=5, help='jokes to synthesize without --input')
+    parser.add_argument('--lang', default='fa')
+    parser.add_argument('--runs', type=int, default=5, help='encodes per clip, the median is reported')
+    args = parser.parse_args()
+
+    if args.input:
+        clips = []
+        for path in args.input:
+            with open(path, 'rb') as f:
+                clips.append((os.path.basename(path), f.read()))
+    else:
+        clips = synthesize(args.clips, args.lang)
+
+    encoders = [OpusEncoder(int(kbps), args.sample_rate, args.compression_level, args.ffmpeg)
+                for kbps in args.bitrates.split(',')]
+    if not encoders[0].available():
+        sys.exit(f"{args.ffmpeg} not found")
+
+    totals = {'mp3': 0, **{encoder.bitrate_kbps: 0 for encoder in encoders}}
+    total_seconds = 0.0
+    encode_ms = {encoder.bitrate_kbps: [] for encoder in encoders}
+    for name, mp3 in clips:
+        seconds = None
+        row = []
+        for encoder in encoders:
+            timings = []
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                opus = encoder.encode(mp3)
+                timings.append(time.perf_counter() - started)
+            if opus is None:
+                sys.exit(f"could not encode {name}")
+            seconds = seconds or ogg_duration(opus)
+            millis = statistics.median(timings) * 1e3
+            encode_ms[encoder.bitrate_kbps].append(millis)
+            totals[encoder.bitrate_kbps] += len(opus)
+            row.append(f"opus {encoder.bitrate_kbps}k {len(opus) / seconds / 1024:5.2f} KiB/s {millis:5.1f} ms")
+        totals['mp3'] += len(mp3)
+        total_seconds += seconds
+        print(f"{name:30s} {seconds:5.1f}s  mp3 {len(mp3) / seconds / 1024:5.2f} KiB/s  " + '  '.join(row))
+
+    print(f"\n{len(clips)} clips, {total_seconds:.1f}s of speech: mp3 {totals['mp3'] / total_seconds / 1024:.2f} KiB/s")
+    clip_seconds = total_seconds / len(clips)
+    for encoder in encoders:
+        size = totals[encoder.bitrate_kbps]
+        millis = statistics.median(encode_ms[encoder.bitrate_kbps])
+        print(f"  opus {encoder.bitrate_kbps:2d}k {size / total_seconds / 1024:5.2f} KiB/s "
+              f"({size / totals['mp3']:.0%} of mp3), encode median {millis:.1f} ms per clip "
+              f"({millis / 1e3 / clip_seconds:.1%} of real time)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+"""Local stand-ins for every upstream the bot talks to, served as one ASGI app
+
+Routes:
+    /bot<token>/<method>        Telegram Bot API (getUpdates is fed by inject())
+    /youtube/v3/search          YouTube Data API search
+    /v1/search                  Spotify search
+    /3/search/movie             TMDB movie search
+    /omdb/                      OMDB search
+    /gemini/generate            Gemini text generation (JSON, or NDJSON when streaming)
+
+Each upstream has a Profile with latency, jitter and an error rate, so load
+tests can reproduce slow or failing providers.
+"""
+import asyncio
+import json
+import random
+import re
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+UPSTREAMS = ('telegram', 'youtube', 'spotify', 'tmdb', 'omdb', 'gemini')
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'LoadTestBot', 'username': 'load_test_bot'}
+
+LOREM_FA = (
+    "امروز هوا خیلی خوبه و می‌شه یه فیلم خوب دید یا یه آهنگ آروم گوش داد. "
+    "اگه دوست داشته باشی می‌تونم چند پیشنهاد دیگه هم بدم. "
+)
+
+
+class Profile:
+    """Latency and failure behaviour of one fake upstream"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, error_status: int = 500):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    async def delay(self) -> None:
+        seconds = self.latency + random.uniform(-self.jitter, self.jitter)
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+def _parse_fields(body: bytes, content_type: str) -> Dict[str, str]:
+    """Decode form, multipart (file parts skipped) or JSON request bodies"""
+    if 'multipart/form-data' in content_type:
+        boundary = content_type.split('boundary=', 1)[1].strip('"').encode()
+        fields = {}
+        for part in body.split(b'--' + boundary):
+            headers, _, value = part.partition(b'\r\n\r\n')
+            match = re.search(rb'name="([^"]+)"', headers)
+            if match and b'filename=' not in headers:
+                fields[match.group(1).decode()] = value.rstrip(b'\r\n').decode('utf-8', 'replace')
+        return fields
+    if 'json' in content_type:
+        return json.loads(body or b'{}')
+    return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+
+class FakeUpstreams:
+    """ASGI app with per-upstream profiles and counters of what the bot sent"""
+
+    def __init__(self, profiles: Optional[Dict[str, Profile]] = None, gemini_chars: int = 400,
+                 gemini_chunk_delay: float = 0.05):
+        self.profiles = {name: Profile() for name in UPSTREAMS}
+        self.profiles.update(profiles or {})
+        self.gemini_chars = gemini_chars
+        self.gemini_chunk_delay = gemini_chunk_delay
+        self.requests: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.uploaded_bytes = 0
+        self._updates: List[Dict] = []
+        self._update_id = 0
+        self._message_id = 1000
+        self._new_updates = asyncio.Event()
+
+    # Telegram update feed
+
+    def inject(self, update: Dict) -> int:
+        """Queue an update for the bot's next getUpdates call and return its update_id"""
+        self._update_id += 1
+        update['update_id'] = self._update_id
+        self._updates.append(update)
+        self._new_updates.set()
+        return self._update_id
+
+    def next_message_id(self) -> int:
+        self._message_id += 1
+        return self._message_id
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http':
+            return
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        headers = dict(scope.get('headers') or [])
+        content_type = headers.get(b'content-type', b'').decode()
+        path = scope['path']
+        query = {key: values[0] for key, values in parse_qs(scope.get('query_string', b'').decode()).items()}
+
+        if path.startswith('/bot'):
+            method = path.rsplit('/', 1)[-1]
+            await self._telegram(method, _parse_fields(body, content_type), len(body), send)
+            return
+
+        routes = {
+            '/youtube/v3/search': ('youtube', self._youtube),
+            '/v1/search': ('spotify', self._spotify),
+            '/3/search/movie': ('tmdb', self._tmdb),
+            '/omdb/': ('omdb', self._omdb),
+            '/gemini/generate': ('gemini', None),
+        }
+        route = routes.get(path)
+        if route is None:
+            await _respond(send, 404, {'error': 'not found'})
+            return
+        name, handler = route
+        self.requests[name] += 1
+        profile = self.profiles[name]
+        await profile.delay()
+        if profile.should_fail():
+            self.errors[name] += 1
+            await _respond(send, profile.error_status, {'error': 'injected failure'})
+            return
+        if name == 'gemini':
+            await self._gemini(json.loads(body or b'{}'), send)
+        else:
+            await _respond(send, 200, handler(query))
+
+    async def _telegram(self, method: str, fields: Dict[str, str], size: int, send) -> None:
+        self.requests[f'telegram.{method}'] += 1
+        if method == 'getUpdates':
+            await self._get_updates(fields, send)
+            return
+
+        profile = self.profiles['telegram']
+        await profile.delay()
+        if profile.should_fail():
+            self.errors['telegram'] += 1
+            await _respond(send, 429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                                       'parameters': {'retry_after': 1}})
+            return
+
+        chat_id = int(fields.get('chat_id', 0) or 0)
+        message = {
+            'message_id': int(fields.get('message_id') or self.next_message_id()),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER
+        }
+        if method == 'getMe':
+            result = BOT_USER
+        elif method in ('sendMessage', 'editMessageText'):
+            result = dict(message, text=fields.get('text', ''))
+        elif method in ('sendAudio', 'sendVoice'):
+            self.uploaded_bytes += size
+            file_id = fields.get('audio') or fields.get('voice') or f'file{message["message_id"]}'
+            media = {'file_id': file_id, 'file_unique_id': file_id, 'duration': 1}
+            result = dict(message, **({'audio': media} if method == 'sendAudio' else {'voice': media}))
+        else:
+            result = True
+        await _respond(send, 200, {'ok': True, 'result': result})
+
+    async def _get_updates(self, fields: Dict[str, str], send) -> None:
+        offset = int(fields.get('offset', 0) or 0)
+        if offset:
+            self._updates = [update for update in self._updates if update['update_id'] >= offset]
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(fields.get('timeout', 0) or 0))
+            except asyncio.TimeoutError:
+                pass
+        limit = int(fields.get('limit', 100) or 100)
+        await _respond(send, 200, {'ok': True, 'result': self._updates[:limit]})
+
+    def _youtube(self, query: Dict[str, str]) -> Dict:
+        q = query.get('q', '')
+        return {'items': [{
+            'id': {'videoId': f'vid{i}{abs(hash(q)) % 10000}'},
+            'snippet': {
+                'title': f'{q} - part {i}',
+                'channelTitle': 'Persian Music',
+                'description': '',
+                'publishedAt': '2023-01-01T00:00:00Z',
+                'thumbnails': {'medium': {'url': 'https://example.com/t.jpg'}}
+            }
+        } for i in range(int(query.get('maxResults', 5)))]}
+
+    def _spotify(self, query: Dict[str, str]) -> Dict:
+        q = query.get('q', '')
+        return {'tracks': {'items': [{
+            'name': f'{q} {i}',
+            'artists': [{'name': 'Artist'}],
+            'album': {'name': 'Album', 'images': []},
+            'external_urls': {'spotify': f'https://open.spotify.com/track/{i}'},
+            'preview_url': None
+        } for i in range(int(query.get('limit', 5)))]}}
+
+    def _tmdb(self, query: Dict[str, str]) -> Dict:
+        q = query.get('query', '')
+        return {'results': [{
+            'id': i,
+            'title': f'{q} {i}',
+            'overview': LOREM_FA,
+            'release_date': '2011-03-16',
+            'vote_average': 7.9,
+            'poster_path': None
+        } for i in range(5)]}
+
+    def _omdb(self, query: Dict[str, str]) -> Dict:
+        q = query.get('s', '')
+        return {'Response': 'True', 'Search': [
+            {'Title': f'{q} {i}', 'Year': '2011', 'imdbID': f'tt{i:07d}', 'Poster': 'N/A'} for i in range(5)
+        ]}
+
+    async def _gemini(self, request: Dict, send) -> None:
+        text = (LOREM_FA * (self.gemini_chars // len(LOREM_FA) + 1))[:self.gemini_chars]
+        if not request.get('stream'):
+            await _respond(send, 200, {'text': text})
+            return
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'application/x-ndjson')]})
+        for start in range(0, len(text), 60):
+            await send({'type': 'http.response.body', 'more_body': True,
+                        'body': json.dumps({'text': text[start:start + 60]}).encode() + b'\n'})
+            await asyncio.sleep(self.gemini_chunk_delay)
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+async def _respond(send, status: int, payload) -> None:
+    body = json.dumps(payload, ensure_ascii=False).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class FakeGeminiModel:
+    """Drop-in for genai.GenerativeModel that calls the fake Gemini endpoint"""
+
+    def __init__(self, base_url: str, http):
+        self.url = f'{base_url}/gemini/generate'
+        self.http = http
+
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        client = self.http.get_client(self.url)
+        if not stream:
+            response = await client.post(self.url, json={'prompt': prompt})
+            response.raise_for_status()
+            return SimpleNamespace(text=response.json()['text'])
+        return _GeminiStream(client, self.url, prompt)
+
+
+class _GeminiStream:
+    def __init__(self, client, url: str, prompt: str):
+        self.client = client
+        self.url = url
+        self.prompt = prompt
+
+    async def __aiter__(self):
+        async with self.client.stream('POST', self.url, json={'prompt': self.prompt, 'stream': True}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line:
+                    yield SimpleNamespace(text=json.loads(line)['text'])
+
+
+class StubTTS:
+    """Stand-in for gTTS: sleeps like a synthesis call and writes MP3-sized bytes"""
+
+    delay = 0.2
+    bytes_per_char = 400
+
+    def __init__(self, text: str, lang: str = 'fa', slow: bool = False):
+        self.text = text
+
+    def write_to_fp(self, fp) -> None:
+        time.sleep(self.delay)
+        fp.write(b'\xff\xfb' + b'\x00' * (len(self.text) * self.bytes_per_char))
@@ -0,0 +1,301 @@
+"""End-to-end load test of main.py against local stand-ins for every upstream
+
+Drives the real Application (scheduler, handlers, caches, TTS pool, rate
+limiter) through long polling against benchmarks/fake_upstreams.py, with
+gTTS replaced by a stub that sleeps like a synthesis call. Updates are
+injected open-loop at a fixed rate; latency is measured from injection until
+the bot has finished processing the update (including every reply it sent).
+
+Usage:
+    python benchmarks/load_test.py --rate 20 --duration 30
+    python benchmarks/load_test.py --latency gemini=1.5,youtube=0.3 --errors youtube=0.2 --json run.json
+
+Memory is the whole process, so it includes the fake servers.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_upstreams import UPSTREAMS, FakeGeminiModel, FakeUpstreams, Profile, StubTTS  # noqa: E402
+
+# Relative frequency of each user action
+DEFAULT_MIX = 'song=3,movie=2,talk=2,text=2,joke=1,start=1,button=1'
+
+SONG_QUERIES = ['محسن یگانه', 'شادمهر عقیلی', 'گوگوش', 'ابی', 'همایون شجریان', 'سیاوش قمیشی', 'معین', 'داریوش']
+MOVIE_QUERIES = ['جدایی نادر از سیمین', 'فروشنده', 'بچه‌های آسمان', 'طعم گیلاس', 'درباره الی', 'قهرمان']
+TALK_PROMPTS = ['یه فیلم خوب معرفی کن', 'حالت چطوره؟', 'یه شعر کوتاه بگو', 'امروز چیکار کنم؟']
+BUTTONS = ['search_music', 'search_movie', 'tell_joke', 'start_chat', 'show_help', 'main_menu']
+
+
+def parse_pairs(text: str, cast=float) -> Dict[str, float]:
+    pairs = {}
+    for item in filter(None, (part.strip() for part in (text or '').split(','))):
+        key, _, value = item.partition('=')
+        pairs[key.strip()] = cast(value)
+    return pairs
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class UpdateFactory:
+    """Builds Telegram update JSON for each kind of user action"""
+
+    def __init__(self, fake: FakeUpstreams, chats: int, unique_ratio: float):
+        self.fake = fake
+        self.chats = chats
+        self.unique_ratio = unique_ratio
+        self.counter = 0
+
+    def _query(self, corpus: List[str]) -> str:
+        query = random.choice(corpus)
+        if random.random() < self.unique_ratio:
+            query = f"{query} {random.randint(1, 10 ** 6)}"
+        return query
+
+    def make(self, kind: str) -> Dict:
+        self.counter += 1
+        chat_id = 10 ** 6 + self.counter % self.chats
+        user = {'id': chat_id, 'is_bot': False, 'first_name': 'بهنوش'}
+        chat = {'id': chat_id, 'type': 'private', 'first_name': 'بهنوش'}
+        if kind == 'button':
+            message = {'message_id': self.fake.next_message_id(), 'date': int(time.time()), 'chat': chat,
+                       'from': {'id': 1, 'is_bot': True, 'first_name': 'bot'}, 'text': 'منو'}
+            return {'callback_query': {'id': str(self.counter), 'from': user, 'chat_instance': str(chat_id),
+                                       'message': message, 'data': random.choice(BUTTONS)}}
+
+        if kind == 'text':
+            text = random.choice(TALK_PROMPTS)
+        else:
+            argument = {
+                'song': lambda: self._query(SONG_QUERIES),
+                'movie': lambda: self._query(MOVIE_QUERIES),
+                'talk': lambda: random.choice(TALK_PROMPTS),
+            }.get(kind, lambda: '')()
+            text = f"/{kind} {argument}".strip()
+        message = {'message_id': self.fake.next_message_id(), 'date': int(time.time()), 'chat': chat,
+                   'from': user, 'text': text}
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split(' ', 1)[0])}]
+        return {'message': message}
+
+
+async def run(args) -> Dict:
+    port = free_port()
+    base = f'http://127.0.0.1:{port}'
+    workdir = tempfile.mkdtemp(prefix='bot-load-')
+    # main.py reads its configuration from the environment in build_application()
+    os.environ.update({
+        'TELEGRAM_TOKEN': '123456:load-test',
+        'GEMINI_API_KEY': 'load-test',
+        'YOUTUBE_API_KEY': 'load-test',
+        'TMDB_API_KEY': 'load-test',
+        'OMDB_API_KEY': 'load-test',
+        'SPOTIFY_TOKEN': 'load-test',
+        'TELEGRAM_API_BASE_URL': f'{base}/bot',
+        'YOUTUBE_API_URL': f'{base}/youtube/v3',
+        'SPOTIFY_API_URL': f'{base}/v1',
+        'TMDB_API_URL': f'{base}/3',
+        'OMDB_API_URL': f'{base}/omdb',
+        'TTS_CACHE_DIR': '',
+        # StubTTS writes MP3-sized filler that ffmpeg could not transcode
+        'VOICE_FORMAT': 'mp3',
+        'TELEGRAM_FILE_ID_DB': os.path.join(workdir, 'file_ids.sqlite3'),
+        'SEARCH_INDEX_PATH': os.path.join(workdir, 'search_index.sqlite3'),
+        'QUOTA_STATE_DIR': os.path.join(workdir, 'quota'),
+        'METRICS_PORT': '0',
+        'SEND_GLOBAL_RATE': str(args.send_rate),
+        'GEMINI_STREAMING': 'true' if args.streaming else 'false',
+        'GEMINI_STREAM_EDIT_INTERVAL': str(args.edit_interval),
+    })
+
+    import uvicorn
+    import utils.voice_utils
+    import main as bot
+
+    # One INFO line per HTTP request would dominate the output
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    latency = parse_pairs(args.latency)
+    errors = parse_pairs(args.errors)
+    profiles = {
+        name: Profile(latency.get(name, 0.0), latency.get(name, 0.0) * args.jitter, errors.get(name, 0.0))
+        for name in UPSTREAMS
+    }
+    fake = FakeUpstreams(profiles, gemini_chars=args.gemini_chars)
+    StubTTS.delay = args.tts_delay
+    utils.voice_utils.gTTS = StubTTS
+    bot.model = FakeGeminiModel(base, bot.http_pool)
+
+    server = uvicorn.Server(uvicorn.Config(fake, host='127.0.0.1', port=port, log_level='warning', lifespan='off'))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    application = bot.build_application()
+    injected_at: Dict[int, float] = {}
+    kinds: Dict[int, str] = {}
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    completed_at: List[float] = []
+    original_process_update = application.process_update
+
+    async def timed_process_update(update):
+        try:
+            await original_process_update(update)
+        finally:
+            update_id = getattr(update, 'update_id', None)
+            if update_id in injected_at:
+                now = time.perf_counter()
+                latencies[kinds[update_id]].append(now - injected_at.pop(update_id))
+                completed_at.append(now)
+
+    # Application looks process_update up on the instance for every update
+    application.process_update = timed_process_update
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    await application.updater.start_polling(poll_interval=0, timeout=10, allowed_updates=None)
+
+    mix = parse_pairs(args.mix, int)
+    population, weights = list(mix), list(mix.values())
+    factory = UpdateFactory(fake, args.chats, args.unique_ratio)
+    total = int(args.rate * args.duration)
+    started = time.perf_counter()
+    for index in range(total):
+        # Open loop: keep the schedule even when the bot falls behind
+        delay = started + index / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        kind = random.choices(population, weights)[0]
+        update_id = fake.inject(factory.make(kind))
+        kinds[update_id] = kind
+        injected_at[update_id] = time.perf_counter()
+    injection_done = time.perf_counter()
+
+    drain_deadline = time.perf_counter() + args.drain_timeout
+    while injected_at and time.perf_counter() < drain_deadline:
+        await asyncio.sleep(0.05)
+    unfinished = len(injected_at)
+
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+    server.should_exit = True
+    await server_task
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    elapsed = (max(completed_at) if completed_at else injection_done) - started
+    handler_errors = bot.metrics.total('handler_errors_total')
+    report = {
+        'offered_rate': args.rate,
+        'injected': total,
+        'completed': len(all_latencies),
+        'unfinished': unfinished,
+        'handler_errors': handler_errors,
+        'throughput': round(len(all_latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        'latency': {
+            'p50': round(percentile(all_latencies, 0.50), 4),
+            'p95': round(percentile(all_latencies, 0.95), 4),
+            'p99': round(percentile(all_latencies, 0.99), 4),
+            'max': round(max(all_latencies, default=0.0), 4)
+        },
+        'by_kind': {
+            kind: {
+                'count': len(values),
+                'p50': round(percentile(values, 0.50), 4),
+                'p95': round(percentile(values, 0.95), 4),
+                'p99': round(percentile(values, 0.99), 4)
+            } for kind, values in sorted(latencies.items())
+        },
+        'upstream_requests': dict(sorted(fake.requests.items())),
+        'injected_errors': dict(fake.errors),
+        'uploaded_bytes': fake.uploaded_bytes,
+        # ru_maxrss is in kilobytes on Linux
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+    if args.tracemalloc:
+        report['python_heap_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        tracemalloc.stop()
+    return report
+
+
+def print_report(report: Dict) -> None:
+    print(f"offered {report['offered_rate']}/s, injected {report['injected']}, "
+          f"completed {report['completed']}, unfinished {report['unfinished']}, "
+          f"handler errors {report['handler_errors']:.0f}")
+    print(f"throughput {report['throughput']} updates/s")
+    lat = report['latency']
+    print(f"latency p50 {lat['p50'] * 1000:.0f} ms  p95 {lat['p95'] * 1000:.0f} ms  "
+          f"p99 {lat['p99'] * 1000:.0f} ms  max {lat['max'] * 1000:.0f} ms")
+    for kind, stats in report['by_kind'].items():
+        print(f"  {kind:8s} n={stats['count']:5d}  p50 {stats['p50'] * 1000:7.0f} ms  "
+              f"p95 {stats['p95'] * 1000:7.0f} ms  p99 {stats['p99'] * 1000:7.0f} ms")
+    print(f"upstream requests: {report['upstream_requests']}")
+    if report['injected_errors']:
+        print(f"injected errors: {report['injected_errors']}")
+    print(f"uploaded {report['uploaded_bytes'] / 2 ** 20:.1f} MiB, max RSS {report['max_rss_mb']} MiB"
+          + (f", Python heap peak {report['python_heap_peak_mb']} MiB" if 'python_heap_peak_mb' in report else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rate', type=float, default=20, help='updates per second')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of injection')
+    parser.add_argument('--chats', type=int, default=1000, help='distinct chats sending updates')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='kind=weight list (song, movie, talk, text, joke, start, button)')
+    parser.add_argument('--unique-ratio', type=float, default=0.2, help='share of searches that miss every cache')
+    parser.add_argument('--latency', default='telegram=0.02,youtube=0.15,spotify=0.1,tmdb=0.15,omdb=0.1,gemini=0.5',
+                        help='upstream=seconds list')
+    parser.add_argument('--jitter', type=float, default=0.3, help='latency jitter as a fraction of latency')
+    parser.add_argument('--errors', default='', help='upstream=error_rate list, e.g. youtube=0.1')
+    parser.add_argument('--tts-delay', type=float, default=0.2, help='seconds per stub synthesis')
+    parser.add_argument('--gemini-chars', type=int, default=400, help='length of fake Gemini answers')
+    parser.add_argument('--streaming', action=argparse.BooleanOptionalAction, default=True,
+                        help='stream Gemini answers into edited messages')
+    parser.add_argument('--edit-interval', type=float, default=0.2, help='seconds between streamed edits')
+    parser.add_argument('--send-rate', type=float, default=30, help='global Telegram send budget per second')
+    parser.add_argument('--drain-timeout', type=float, default=60, help='seconds to wait for in-flight updates')
+    parser.add_argument('--tracemalloc', action='store_true', help='also report the Python heap peak (slower)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write the report to this file as JSON')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fp:
+            json.dump(report, fp, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
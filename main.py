@@ -1,51 +1,343 @@
 
 import os
-import requests
 import json
+import argparse
 import random
 import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
-from gtts import gTTS
-import asyncio
+import threading
+import time
 from io import BytesIO
-import google.generativeai as genai
+from telegram import Update, InlineQueryResultArticle, InputTextMessageContent
+from telegram.error import BadRequest, RetryAfter
+from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler, InlineQueryHandler
+import asyncio
 from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+from utils.audio_cache import AudioCache, DEFAULT_CACHE_DIR
+from utils.audio_encoder import OpusEncoder, ogg_duration
+from utils.chat_scheduler import ChatScheduler
+from utils.circuit_breaker import DEFAULT_QUOTA_STATE_DIR, ProviderUnavailable, provider_guards
+from utils.file_id_store import FileIdStore, DEFAULT_FILE_ID_DB
+from utils.conversation import ConversationStore
+from utils.http_client import http_pool
+from utils.inline_search import InlineSearch
+from utils.message_streamer import MAX_CAPTION_LENGTH, MAX_MESSAGE_LENGTH, ProgressiveMessage
+from utils.metrics import metrics, start_metrics_server
+from utils.result_cache import ResultCache, create_backend
+from utils.search_index import SearchIndex
+from utils.send_limiter import SendRateLimiter
+from utils.single_flight import SingleFlight
+from utils.speech_chunks import split_caption, split_message
+from utils.supervisor import Supervisor
+from utils.tts_pool import TTSWorkerPool
+from utils.ui_registry import UIRegistry
+from utils.voice_utils import VoiceUtils, load_gtts
+from utils.webhook_server import WebhookApp, derive_allowed_updates, run_webhook_server
+from services.movie_service import MovieService
+from services.music_service import MusicService
 
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
-# Bot configuration
-TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
-TMDB_API_KEY = os.getenv("TMDB_API_KEY")
-
-# Check if required tokens are available
-if not TELEGRAM_TOKEN:
-    logger.error("TELEGRAM_TOKEN not found in environment variables")
-    exit(1)
-if not GEMINI_API_KEY:
-    logger.error("GEMINI_API_KEY not found in environment variables")
-    exit(1)
-if not YOUTUBE_API_KEY:
-    logger.error("YOUTUBE_API_KEY not found in environment variables")
-    exit(1)
+class Settings:
+    """Bot configuration, read from the environment when the bot starts rather than at import"""
+    
+    # Without these the bot cannot serve anything
+    REQUIRED = ('TELEGRAM_TOKEN', 'GEMINI_API_KEY', 'YOUTUBE_API_KEY')
+    
+    def __init__(self, env=None):
+        env = os.environ if env is None else env
+        self.env = env
+        
+        # Bot configuration
+        self.telegram_token = env.get("TELEGRAM_TOKEN")
+        self.gemini_api_key = env.get("GEMINI_API_KEY")
+        self.youtube_api_key = env.get("YOUTUBE_API_KEY")
+        self.tmdb_api_key = env.get("TMDB_API_KEY")
+        self.spotify_token = env.get("SPOTIFY_TOKEN", "")
+        self.omdb_api_key = env.get("OMDB_API_KEY", "")
+        
+        # Upstream API roots; overridden only to point the bot at local stand-ins (see benchmarks/load_test.py)
+        self.youtube_api_url = env.get("YOUTUBE_API_URL", "https://www.googleapis.com/youtube/v3")
+        self.spotify_api_url = env.get("SPOTIFY_API_URL", "https://api.spotify.com/v1")
+        self.tmdb_api_url = env.get("TMDB_API_URL", "https://api.themoviedb.org/3")
+        self.omdb_api_url = env.get("OMDB_API_URL", "http://www.omdbapi.com")
+        
+        # Serving configuration: "polling" (default) or "webhook"
+        self.bot_mode = env.get("BOT_MODE", "polling").lower()
+        self.concurrent_updates = int(env.get("CONCURRENT_UPDATES", "16"))
+        self.telegram_api_base_url = env.get("TELEGRAM_API_BASE_URL", "")
+        self.webhook_url = env.get("WEBHOOK_URL", "")
+        self.webhook_path = env.get("WEBHOOK_PATH", "/telegram")
+        self.webhook_listen = env.get("WEBHOOK_LISTEN", "0.0.0.0")
+        self.webhook_port = int(env.get("WEBHOOK_PORT", "8443"))
+        self.webhook_secret = env.get("WEBHOOK_SECRET", "")
+        self.webhook_max_connections = int(env.get("WEBHOOK_MAX_CONNECTIONS", "40"))
+        self.drain_timeout = float(env.get("DRAIN_TIMEOUT", "30"))
+        
+        # Per-chat scheduling: updates of one chat run in order, chats share concurrent_updates fairly
+        self.chat_concurrency = int(env.get("CHAT_CONCURRENCY", "1"))
+        self.chat_max_pending = int(env.get("CHAT_MAX_PENDING", "8"))
+        
+        # Outgoing message limits (messages per second), kept under Telegram's flood limits
+        self.send_global_rate = float(env.get("SEND_GLOBAL_RATE", "30"))
+        self.send_chat_rate = float(env.get("SEND_CHAT_RATE", "1"))
+        self.send_group_rate = float(env.get("SEND_GROUP_RATE", "0.33"))
+        self.send_chat_burst = float(env.get("SEND_CHAT_BURST", "3"))
+        self.send_max_retries = int(env.get("SEND_MAX_RETRIES", "2"))
+        
+        # Prometheus scrape endpoint, off unless a port is set; worker N of a supervisor listens on metrics_port + N
+        self.metrics_host = env.get("METRICS_HOST", "127.0.0.1")
+        self.metrics_port = int(env.get("METRICS_PORT", "0"))
+        
+        # Multi-process mode: >0 polls once and shards updates by chat across workers
+        self.worker_processes = int(env.get("WORKER_PROCESSES", "0"))
+        self.worker_heartbeat_timeout = float(env.get("WORKER_HEARTBEAT_TIMEOUT", "60"))
+        # Set by the supervisor in each worker process
+        self.worker_index = int(env.get("BOT_WORKER_INDEX", "0"))
+        
+        # Import the Gemini and gTTS SDKs in the background right after startup
+        self.preload_sdks = env.get("PRELOAD_SDKS", "true").lower() == "true"
+        
+        # Synthesize the jokes and fixed phrases at startup (python main.py --warm-audio does it offline)
+        self.audio_warmup = env.get("AUDIO_WARMUP", "true").lower() == "true"
+        self.audio_warmup_concurrency = int(env.get("AUDIO_WARMUP_CONCURRENCY", "2"))
+        
+        # Text-to-speech worker pool configuration
+        self.tts_workers = int(env.get("TTS_WORKERS", "4"))
+        self.tts_queue_size = int(env.get("TTS_QUEUE_SIZE", "16"))
+        self.tts_timeout = float(env.get("TTS_TIMEOUT", "15"))
+        self.tts_use_processes = env.get("TTS_USE_PROCESSES", "false").lower() == "true"
+        self.tts_cache_memory_mb = int(env.get("TTS_CACHE_MEMORY_MB", "32"))
+        self.tts_cache_dir = env.get("TTS_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.tts_cache_disk_mb = int(env.get("TTS_CACHE_DISK_MB", "256"))
+        # Long replies are spoken in sentence chunks synthesized in parallel, the first one sent early
+        self.tts_chunk_chars = int(env.get("TTS_CHUNK_CHARS", "200"))
+        self.tts_first_chunk_chars = int(env.get("TTS_FIRST_CHUNK_CHARS", "100"))
+        self.tts_chunk_concurrency = int(env.get("TTS_CHUNK_CONCURRENCY", "3"))
+        # Search results and jokes wait this long for their speech, then go out as text first
+        self.speech_caption_wait = float(env.get("SPEECH_CAPTION_WAIT", "0.5"))
+        self.telegram_file_id_db = env.get("TELEGRAM_FILE_ID_DB", DEFAULT_FILE_ID_DB)
+        
+        # Spoken replies: "opus" sends OGG/Opus voice notes (needs ffmpeg), "mp3" sends gTTS audio as is
+        self.voice_format = env.get("VOICE_FORMAT", "opus").lower()
+        self.voice_bitrate_kbps = int(env.get("VOICE_BITRATE_KBPS", "16"))
+        self.voice_sample_rate = int(env.get("VOICE_SAMPLE_RATE", "24000"))
+        self.voice_compression_level = int(env.get("VOICE_COMPRESSION_LEVEL", "5"))
+        self.ffmpeg_path = env.get("FFMPEG_PATH", "ffmpeg")
+        
+        # Gemini streaming: edit one message as the answer is generated
+        self.gemini_streaming = env.get("GEMINI_STREAMING", "true").lower() == "true"
+        self.gemini_stream_edit_interval = float(env.get("GEMINI_STREAM_EDIT_INTERVAL", "1.0"))
+        
+        # Conversation memory configuration
+        self.conversation_history_tokens = int(env.get("CONVERSATION_HISTORY_TOKENS", "1200"))
+        self.conversation_summary_tokens = int(env.get("CONVERSATION_SUMMARY_TOKENS", "300"))
+        self.conversation_max_chats = int(env.get("CONVERSATION_MAX_CHATS", "10000"))
+        self.conversation_db = env.get("CONVERSATION_DB", "")
+        self.conversation_flush_interval = float(env.get("CONVERSATION_FLUSH_INTERVAL", "30"))
+        
+        # Search result cache configuration
+        self.search_cache_backend = env.get("SEARCH_CACHE_BACKEND", "memory")
+        self.search_cache_path = env.get("SEARCH_CACHE_PATH", "search_cache.sqlite3")
+        self.search_cache_negative_ttl = float(env.get("SEARCH_CACHE_NEGATIVE_TTL", "600"))
+        
+        # Local index of songs and movies seen before, answering confident matches without upstream calls
+        self.search_index_path = env.get("SEARCH_INDEX_PATH", "search_index.sqlite3")
+        self.search_index_max_age_days = float(env.get("SEARCH_INDEX_MAX_AGE_DAYS", "7"))
+        self.search_index_min_results = int(env.get("SEARCH_INDEX_MIN_RESULTS", "3"))
+        
+        # Inline mode (@bot ...): Telegram caches each answer for inline_cache_time seconds,
+        # upstream is asked once the user pauses typing for inline_debounce_ms
+        self.inline_cache_time = int(env.get("INLINE_CACHE_TIME", "300"))
+        self.inline_debounce_ms = int(env.get("INLINE_DEBOUNCE_MS", "300"))
+        self.inline_min_chars = int(env.get("INLINE_MIN_CHARS", "2"))
+        # Inline queries run apart from chat updates, at most this many at a time
+        self.inline_concurrency = int(env.get("INLINE_CONCURRENCY", "4"))
+        
+        # Upstream protection: circuit breakers and daily quota budgets (0 = unlimited)
+        self.breaker_failure_threshold = int(env.get("BREAKER_FAILURE_THRESHOLD", "5"))
+        self.breaker_reset_timeout = float(env.get("BREAKER_RESET_TIMEOUT", "30"))
+        self.youtube_daily_quota = float(env.get("YOUTUBE_DAILY_QUOTA", "10000"))
+        self.youtube_search_cost = float(env.get("YOUTUBE_SEARCH_COST", "100"))
+        self.gemini_daily_requests = float(env.get("GEMINI_DAILY_REQUESTS", "0"))
+        # Spent quota is kept here across restarts (empty = in memory only)
+        self.quota_state_dir = env.get("QUOTA_STATE_DIR", DEFAULT_QUOTA_STATE_DIR)
+    
+    @classmethod
+    def from_env(cls):
+        """Load .env into the environment, then read the settings from it"""
+        load_dotenv()
+        return cls()
+    
+    def missing(self):
+        """Names of required variables that are not set"""
+        return [name for name in self.REQUIRED if not self.env.get(name)]
 
 # User configuration
 USER_NAME = "بهنوش"
 BOT_NAME = "امیر"
 
-# Configure Gemini AI
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-pro')
+# Everything below is created by configure() when the bot starts, so importing
+# this module stays cheap and free of side effects (spawned workers import it too)
+settings = None
+tts_pool = None
+voice_encoder = None
+audio_cache = None
+file_id_store = None
+search_cache = None
+search_index = None
+inline_search = None
+conversations = None
+
+# Gemini model; google.generativeai takes about a second to import, so it is
+# loaded on first use by get_model(). Tests and benchmarks may assign a stand-in.
+model = None
+_model_lock = threading.Lock()
+
+# Identical Gemini prompts in flight at the same time share one request
+gemini_flights = SingleFlight()
+
+# Audio of the phrases synthesized by warm_up_audio(), kept out of the cache's LRU
+audio_assets = {}
+
+def configure(new_settings=None):
+    """Create the caches, pools and stores the handlers use; later calls are no-ops"""
+    global settings, tts_pool, voice_encoder, audio_cache, file_id_store, search_cache, search_index, inline_search, conversations
+    if settings is not None:
+        return settings
+    settings = new_settings or Settings.from_env()
+    
+    # Shared TTS worker pool; saturated or slow jobs degrade to text-only replies
+    tts_pool = TTSWorkerPool(
+        max_workers=settings.tts_workers,
+        max_queue=settings.tts_queue_size,
+        job_timeout=settings.tts_timeout,
+        use_processes=settings.tts_use_processes
+    )
+    
+    # Speech is sent as Opus voice notes when ffmpeg is there, as gTTS MP3 otherwise
+    if settings.voice_format == 'opus':
+        voice_encoder = OpusEncoder(
+            bitrate_kbps=settings.voice_bitrate_kbps,
+            sample_rate=settings.voice_sample_rate,
+            compression_level=settings.voice_compression_level,
+            ffmpeg=settings.ffmpeg_path,
+            timeout=settings.tts_timeout
+        )
+        if not voice_encoder.available():
+            logger.warning(f"{settings.ffmpeg_path} not found, sending speech as MP3 audio instead of voice notes")
+            voice_encoder = None
+    
+    # Synthesized audio cache, in memory and on disk
+    audio_cache = AudioCache(
+        max_memory_bytes=settings.tts_cache_memory_mb * 1024 * 1024,
+        disk_dir=settings.tts_cache_dir or None,
+        max_disk_bytes=settings.tts_cache_disk_mb * 1024 * 1024,
+        audio_format='opus' if voice_encoder is not None else 'mp3'
+    )
+    
+    # Telegram file_ids of audio we have already uploaded
+    file_id_store = FileIdStore(settings.telegram_file_id_db)
+    
+    # Cached search results, refreshed in the background once stale
+    search_cache = ResultCache(
+        backend=create_backend(settings.search_cache_backend, settings.search_cache_path),
+        namespace='bot',
+        negative_ttl=settings.search_cache_negative_ttl
+    )
+    
+    if settings.search_index_path:
+        search_index = SearchIndex(
+            settings.search_index_path,
+            max_age=settings.search_index_max_age_days * 24 * 3600,
+            min_results=settings.search_index_min_results
+        )
+        metrics.register_stats('search_index', search_index.stats)
+    
+    # Inline query suggestions: cached answers, then the index, then upstream once typing pauses
+    inline_search = InlineSearch(
+        search=lambda kind, query: INLINE_SEARCHES[kind](query),
+        index=search_index,
+        debounce=settings.inline_debounce_ms / 1000,
+        ttl=settings.inline_cache_time,
+        min_chars=settings.inline_min_chars,
+        min_local=settings.search_index_min_results,
+        limit=INLINE_MAX_RESULTS
+    )
+    
+    # Fail fast on unhealthy or over-budget upstreams; workers split the daily budgets
+    workers = max(1, settings.worker_processes)
+    if settings.quota_state_dir:
+        os.makedirs(settings.quota_state_dir, exist_ok=True)
+    
+    def quota_state(provider):
+        # A restarted worker picks up its own share of the day's budget
+        if not settings.quota_state_dir:
+            return None
+        return os.path.join(settings.quota_state_dir, f"{provider.lower()}-{settings.worker_index}.json")
+    
+    for provider in ('Spotify', 'TMDB', 'OMDB'):
+        provider_guards.configure(provider, settings.breaker_failure_threshold, settings.breaker_reset_timeout)
+    provider_guards.configure(
+        'YouTube', settings.breaker_failure_threshold, settings.breaker_reset_timeout,
+        daily_units=settings.youtube_daily_quota / workers,
+        cost=settings.youtube_search_cost,
+        state_path=quota_state('YouTube')
+    )
+    provider_guards.configure(
+        'Gemini', settings.breaker_failure_threshold, settings.breaker_reset_timeout,
+        daily_units=settings.gemini_daily_requests / workers,
+        state_path=quota_state('Gemini')
+    )
+    
+    # Per-chat conversation memory for Gemini prompts
+    conversations = ConversationStore(
+        history_tokens=settings.conversation_history_tokens,
+        summary_tokens=settings.conversation_summary_tokens,
+        max_chats=settings.conversation_max_chats,
+        db_path=settings.conversation_db or None,
+        flush_interval=settings.conversation_flush_interval,
+        summarizer=lambda previous, transcript: GeminiService.summarize_conversation(previous, transcript)
+    )
+    
+    # Components that keep their own counters are exported at scrape time
+    metrics.register_stats('search_cache', search_cache.stats)
+    metrics.register_stats('inline_search', inline_search.stats)
+    metrics.register_stats('audio_cache', audio_cache.stats)
+    metrics.register_stats('tts_pool', tts_pool.stats)
+    metrics.register_stats('gemini_flights', gemini_flights.stats)
+    metrics.register_stats('conversations', conversations.stats)
+    metrics.register_stats('provider', provider_guards.stats, label='provider')
+    return settings
+
+def get_model():
+    """Import and configure the Gemini SDK on first use and return the shared model"""
+    global model
+    with _model_lock:
+        if model is None:
+            import google.generativeai as genai
+            genai.configure(api_key=configure().gemini_api_key)
+            model = genai.GenerativeModel('gemini-pro')
+    return model
+
+async def get_model_async():
+    """get_model() without blocking the event loop while the SDK is first imported"""
+    if model is not None:
+        return model
+    return await asyncio.to_thread(get_model)
+
+def preload_sdks():
+    """Import the slow SDKs ahead of the first request that needs them"""
+    started = time.perf_counter()
+    try:
+        get_model()
+        load_gtts()
+    except Exception as e:
+        logger.warning(f"Preloading SDKs failed, they will load on first use: {e}")
+        return
+    logger.info(f"SDKs preloaded in {time.perf_counter() - started:.2f}s")
+
+GEMINI_FALLBACK_REPLY = f"{USER_NAME} جان، متاسفانه الان نمی‌تونم جواب بدم. دوباره امتحان کن! 😊"
 
 # Persian jokes database
 JOKES = [
@@ -56,427 +348,804 @@ JOKES = [
     f"{USER_NAME} جان، چرا تلفن همیشه مودب بود؟ چون همیشه می‌گفت الو! 📞"
 ]
 
+# YouTube and Spotify return at most 5 songs, a TMDB page at most 20 movies
+MAX_SONG_RESULTS = 5
+MAX_MOVIE_RESULTS = 20
+
+# Suggestions per kind in an inline query answer (Telegram shows at most 50)
+INLINE_MAX_RESULTS = 10
+
+# A leading keyword restricts an inline query to songs or movies
+INLINE_KEYWORDS = {
+    'آهنگ': ('music',), 'موزیک': ('music',), 'song': ('music',),
+    'فیلم': ('movie',), 'movie': ('movie',),
+}
+
+def songs_found_text(count):
+    return f"{USER_NAME} جان، {count} آهنگ برات پیدا کردم!"
+
+def movies_found_text(count):
+    return f"{USER_NAME} جان، {count} فیلم برات پیدا کردم!"
+
+def canned_phrases():
+    """Every spoken reply whose text is known before any user asks"""
+    phrases = list(JOKES)
+    phrases.append(GEMINI_FALLBACK_REPLY)
+    phrases.extend(songs_found_text(count) for count in range(1, MAX_SONG_RESULTS + 1))
+    phrases.extend(movies_found_text(count) for count in range(1, MAX_MOVIE_RESULTS + 1))
+    return phrases
+
+# Keyboards and fixed texts, built once and shared by every update
+ui = UIRegistry()
+ui.add_keyboard('main_menu', [
+    [("🎵 جستجوی موزیک", 'search_music'), ("🎬 جستجوی فیلم", 'search_movie')],
+    [("😂 جک بگو", 'tell_joke'), ("💬 گفتگو", 'start_chat')],
+    [("📋 راهنما", 'show_help'), ("🔄 منوی اصلی", 'main_menu')]
+])
+ui.add_text('welcome', f"""
+سلام {USER_NAME} عزیز! من {BOT_NAME}، دستیار شخصی توام 💙
+
+از منوی زیر می‌تونی به راحتی از قابلیت‌هام استفاده کنی:
+""")
+ui.add_text('main_menu', f"{USER_NAME} جان، منوی اصلی:")
+ui.add_text('help', f"""
+راهنمای کامل ربات {BOT_NAME} 📖
+
+🎵 جستجوی موزیک:
+/song محسن یگانه - دیره
+/song شادمهر عقیلی
+
+🎬 جستجوی فیلم:
+/movie جدایی نادر از سیمین
+/movie مجید مجیدی
+
+😂 شنیدن جک:
+/joke یا از منو استفاده کن
+
+💬 گفتگو با هوش مصنوعی:
+/talk یه فیلم خوب معرفی کن
+یا فقط پیام بفرست بدون دستور
+
+🔄 دستورات دیگر:
+/start - شروع مجدد
+/menu - نمایش منو
+/help - این راهنما
+
+نکته: همه پاسخ‌ها به صورت صوتی و متنی ارسال می‌شوند 🎤
+""")
+ui.add_text('search_music', f"{USER_NAME} جان، برای جستجوی موزیک، از دستور زیر استفاده کن:\n\n/song [نام آهنگ یا خواننده]\n\nمثال: /song محسن یگانه دیره")
+ui.add_text('search_movie', f"{USER_NAME} جان، برای جستجوی فیلم، از دستور زیر استفاده کن:\n\n/movie [نام فیلم]\n\nمثال: /movie جدایی نادر از سیمین")
+ui.add_text('start_chat', f"{USER_NAME} جان، برای گفتگو می‌تونی:\n\n1️⃣ از دستور /talk استفاده کنی:\n/talk یه فیلم خوب معرفی کن\n\n2️⃣ یا مستقیماً پیام بفرستی بدون دستور")
+ui.add_text('joke_done', f"{USER_NAME} جان، امیدوارم خوشت اومده باشه! 😊")
+ui.add_text('song_usage', f"{USER_NAME} جان، اسم آهنگ یا خواننده رو بگو! مثال: /song محسن یگانه")
+ui.add_text('movie_usage', f"{USER_NAME} جان، اسم فیلم رو بگو! مثال: /movie جدایی نادر از سیمین")
+ui.add_text('talk_usage', f"{USER_NAME} جان، چی می‌خوای بگی؟ مثال: /talk یه فیلم خوب معرفی کن")
+ui.add_text('thinking', f"{USER_NAME} جان، دارم فکر می‌کنم... 💭")
+ui.add_text('error', f"{USER_NAME} جان، یه مشکلی پیش اومد. دوباره امتحان کن! 😊")
+ui.freeze()
+
 class PersianMusicAPI:
     """Handler for Persian music search using public APIs"""
     
     @staticmethod
-    def search_youtube_music(query):
+    async def search(query):
+        """Formatted song results, from the local index when it has a confident match"""
+        if search_index is not None:
+            results = await search_index.lookup_async('music', query, limit=MAX_SONG_RESULTS)
+            if results:
+                return results
+        
+        results = MusicService.format_youtube_results(await PersianMusicAPI.search_youtube_music(query))
+        if not results and settings.spotify_token and not provider_guards.available('YouTube'):
+            # YouTube is down or out of quota; Spotify is the fallback
+            results = MusicService.format_spotify_results(await PersianMusicAPI.search_spotify_public(query))
+        if search_index is not None and results:
+            search_index.add_later('music', results)
+        return results
+    
+    @staticmethod
+    async def search_youtube_music(query):
         """Search Persian music on YouTube"""
         try:
-            url = "https://www.googleapis.com/youtube/v3/search"
-            params = {
-                'part': 'snippet',
-                'q': f"{query} آهنگ ایرانی Persian music",
-                'type': 'video',
-                'maxResults': 5,
-                'key': YOUTUBE_API_KEY,
-                'regionCode': 'IR'
-            }
-            response = requests.get(url, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('items', [])
+            return await search_cache.get_or_fetch(
+                'YouTube', query, lambda: provider_guards.call('YouTube', lambda: PersianMusicAPI._fetch_youtube_music(query))
+            )
+        except ProviderUnavailable as e:
+            logger.warning(f"Skipping YouTube search: {e}")
         except Exception as e:
             logger.error(f"YouTube API error: {e}")
         return []
     
     @staticmethod
-    def search_spotify_public(query):
+    async def _fetch_youtube_music(query):
+        url = f"{settings.youtube_api_url}/search"
+        params = {
+            'part': 'snippet',
+            'q': f"{query} آهنگ ایرانی Persian music",
+            'type': 'video',
+            'maxResults': 5,
+            'key': settings.youtube_api_key,
+            'regionCode': 'IR'
+        }
+        response = await http_pool.get(url, params=params)
+        response.raise_for_status()
+        data = response.json()
+        return data.get('items', [])
+    
+    @staticmethod
+    async def search_spotify_public(query):
         """Search Persian music using Spotify Web API (public endpoints)"""
         try:
-            # Using Spotify's public search endpoint
-            url = "https://api.spotify.com/v1/search"
-            headers = {
-                'Authorization': f'Bearer {os.getenv("SPOTIFY_TOKEN", "")}'
-            }
-            params = {
-                'q': f"{query} Persian Iranian",
-                'type': 'track',
-                'market': 'IR',
-                'limit': 5
-            }
-            response = requests.get(url, headers=headers, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('tracks', {}).get('items', [])
+            return await search_cache.get_or_fetch(
+                'Spotify', query, lambda: provider_guards.call('Spotify', lambda: PersianMusicAPI._fetch_spotify_public(query))
+            )
+        except ProviderUnavailable as e:
+            logger.warning(f"Skipping Spotify search: {e}")
         except Exception as e:
             logger.error(f"Spotify API error: {e}")
         return []
+    
+    @staticmethod
+    async def _fetch_spotify_public(query):
+        # Using Spotify's public search endpoint
+        url = f"{settings.spotify_api_url}/search"
+        headers = {
+            'Authorization': f'Bearer {settings.spotify_token}'
+        }
+        params = {
+            'q': f"{query} Persian Iranian",
+            'type': 'track',
+            'market': 'IR',
+            'limit': 5
+        }
+        response = await http_pool.get(url, params=params, headers=headers)
+        response.raise_for_status()
+        data = response.json()
+        return data.get('tracks', {}).get('items', [])
 
 class MovieAPI:
     """Handler for movie search using public APIs"""
     
     @staticmethod
-    def search_tmdb(query):
+    async def search(query):
+        """Formatted movie results, from the local index when it has a confident match"""
+        if search_index is not None:
+            results = await search_index.lookup_async('movie', query, limit=MAX_MOVIE_RESULTS)
+            if results:
+                return results
+        
+        results = MovieService.format_tmdb_results(await MovieAPI.search_tmdb(query))
+        if not results and settings.omdb_api_key and not provider_guards.available('TMDB'):
+            # TMDB is down; OMDB is the fallback
+            results = MovieService.format_omdb_results(await MovieAPI.search_omdb(query))
+        if search_index is not None and results:
+            search_index.add_later('movie', results)
+        return results
+    
+    @staticmethod
+    async def search_tmdb(query):
         """Search movies using TMDB API"""
         try:
-            url = "https://api.themoviedb.org/3/search/movie"
-            params = {
-                'api_key': TMDB_API_KEY,
-                'query': query,
-                'language': 'fa-IR',
-                'region': 'IR'
-            }
-            response = requests.get(url, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('results', [])
+            return await search_cache.get_or_fetch(
+                'TMDB', query, lambda: provider_guards.call('TMDB', lambda: MovieAPI._fetch_tmdb(query))
+            )
+        except ProviderUnavailable as e:
+            logger.warning(f"Skipping TMDB search: {e}")
         except Exception as e:
             logger.error(f"TMDB API error: {e}")
         return []
     
     @staticmethod
-    def search_omdb(query):
+    async def _fetch_tmdb(query):
+        url = f"{settings.tmdb_api_url}/search/movie"
+        params = {
+            'api_key': settings.tmdb_api_key,
+            'query': query,
+            'language': 'fa-IR',
+            'region': 'IR'
+        }
+        response = await http_pool.get(url, params=params)
+        response.raise_for_status()
+        data = response.json()
+        return data.get('results', [])
+    
+    @staticmethod
+    async def search_omdb(query):
         """Search movies using OMDB API"""
         try:
-            url = "http://www.omdbapi.com/"
-            params = {
-                'apikey': os.getenv("OMDB_API_KEY", ""),
-                's': query,
-                'type': 'movie'
-            }
-            response = requests.get(url, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('Search', [])
+            return await search_cache.get_or_fetch(
+                'OMDB', query, lambda: provider_guards.call('OMDB', lambda: MovieAPI._fetch_omdb(query))
+            )
+        except ProviderUnavailable as e:
+            logger.warning(f"Skipping OMDB search: {e}")
         except Exception as e:
             logger.error(f"OMDB API error: {e}")
         return []
+    
+    @staticmethod
+    async def _fetch_omdb(query):
+        url = f"{settings.omdb_api_url}/"
+        params = {
+            'apikey': settings.omdb_api_key,
+            's': query,
+            'type': 'movie'
+        }
+        response = await http_pool.get(url, params=params)
+        response.raise_for_status()
+        data = response.json()
+        return data.get('Search', [])
+
+# What inline queries search upstream, per kind
+INLINE_SEARCHES = {'music': PersianMusicAPI.search, 'movie': MovieAPI.search}
 
 class VoiceService:
     """Text-to-speech service"""
     
     @staticmethod
-    def create_audio(text, lang='fa'):
-        """Create audio from text using gTTS"""
-        try:
-            tts = gTTS(text=text, lang=lang, slow=False)
-            audio_buffer = BytesIO()
-            tts.write_to_fp(audio_buffer)
-            audio_buffer.seek(0)
-            return audio_buffer
-        except Exception as e:
-            logger.error(f"TTS error: {e}")
-            return None
+    async def create_audio_async(text, lang='fa'):
+        """Create audio on the TTS worker pool without blocking the event loop"""
+        audio = audio_assets.get(text) if lang == 'fa' else None
+        if audio is not None:
+            return BytesIO(audio)
+        return await VoiceUtils.text_to_speech_async(text, tts_pool, lang=lang, cache=audio_cache,
+                                                     encoder=voice_encoder)
+    
+    @staticmethod
+    async def create_audio_parts(text, lang='fa'):
+        """Audio of a long text in up to two parts, the first sentences as soon as they are ready"""
+        audio = audio_assets.get(text) if lang == 'fa' else None
+        if audio is not None:
+            yield BytesIO(audio)
+            return
+        async for audio_buffer in VoiceUtils.text_to_speech_parts(
+            text, tts_pool, lang=lang, cache=audio_cache, encoder=voice_encoder,
+            chunk_chars=settings.tts_chunk_chars,
+            first_chunk_chars=settings.tts_first_chunk_chars,
+            concurrency=settings.tts_chunk_concurrency
+        ):
+            yield audio_buffer
 
 class GeminiService:
     """Gemini AI service for conversations"""
     
     @staticmethod
-    def generate_response(prompt):
-        """Generate response using Gemini AI"""
+    async def build_prompt(prompt, chat_id=None):
+        context = await conversations.render_context(chat_id, USER_NAME, BOT_NAME) if chat_id is not None else ''
+        if context:
+            context = f"گفتگوی قبلی شما:\n{context}\n\n"
+        return f"تو {BOT_NAME} هستی و با {USER_NAME} صحبت می‌کنی. به صورت دوستانه و گرم پاسخ بده. {context}سوال: {prompt}"
+    
+    @staticmethod
+    async def generate_response_async(prompt, chat_id=None):
+        """Generate response without blocking; identical concurrent prompts share one call"""
+        full_prompt = await GeminiService.build_prompt(prompt, chat_id)
         try:
-            full_prompt = f"تو {BOT_NAME} هستی و با {USER_NAME} صحبت می‌کنی. به صورت دوستانه و گرم پاسخ بده. سوال: {prompt}"
-            response = model.generate_content(full_prompt)
-            return response.text
+            return await gemini_flights.do(full_prompt, lambda: GeminiService._generate(full_prompt))
         except Exception as e:
             logger.error(f"Gemini AI error: {e}")
-            return f"{USER_NAME} جان، متاسفانه الان نمی‌تونم جواب بدم. دوباره امتحان کن! 😊"
+            return GEMINI_FALLBACK_REPLY
+    
+    @staticmethod
+    async def stream_response(prompt, chat_id=None):
+        """Yield the response text piece by piece as Gemini generates it"""
+        full_prompt = await GeminiService.build_prompt(prompt, chat_id)
+        guard = provider_guards.get('Gemini')
+        guard.acquire()
+        started = time.perf_counter()
+        try:
+            response = await (await get_model_async()).generate_content_async(full_prompt, stream=True)
+            async for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            guard.record(e, time.perf_counter() - started)
+            raise
+        except BaseException:
+            # Cancelled, or the consumer closed the generator early
+            guard.release()
+            raise
+        guard.record(duration=time.perf_counter() - started)
+    
+    @staticmethod
+    async def summarize_conversation(previous_summary, transcript):
+        """Condense older turns of a chat into a short running summary"""
+        prompt = (
+            "این گفتگو بین کاربر (U) و دستیار (A) را در حداکثر سه جمله کوتاه فارسی خلاصه کن "
+            "و نکات مهم درباره کاربر را نگه دار.\n"
+            f"خلاصه قبلی: {previous_summary or '-'}\n{transcript}"
+        )
+        return await GeminiService._generate(prompt)
+    
+    @staticmethod
+    async def _generate(full_prompt):
+        gemini = await get_model_async()
+        response = await provider_guards.call('Gemini', lambda: gemini.generate_content_async(full_prompt))
+        return response.text
 
-# Bot handlers
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Start command handler"""
-    welcome_message = f"""
-سلام {USER_NAME} عزیز! من {BOT_NAME}، دستیار شخصی توام 💙
+async def reply_speech(message, audio, caption=None, duration=None):
+    """Reply with a voice note when speech is encoded as Opus, with an audio file otherwise"""
+    if voice_encoder is not None:
+        sent = await message.reply_voice(audio, caption=caption, duration=duration)
+        return sent, sent.voice
+    sent = await message.reply_audio(audio, caption=caption)
+    return sent, sent.audio
 
-از منوی زیر می‌تونی به راحتی از قابلیت‌هام استفاده کنی:
-"""
-    
-    # Create inline keyboard menu
-    keyboard = [
-        [
-            InlineKeyboardButton("🎵 جستجوی موزیک", callback_data='search_music'),
-            InlineKeyboardButton("🎬 جستجوی فیلم", callback_data='search_movie')
-        ],
-        [
-            InlineKeyboardButton("😂 جک بگو", callback_data='tell_joke'),
-            InlineKeyboardButton("💬 گفتگو", callback_data='start_chat')
-        ],
-        [
-            InlineKeyboardButton("📋 راهنما", callback_data='show_help'),
-            InlineKeyboardButton("🔄 منوی اصلی", callback_data='main_menu')
-        ]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text(welcome_message, reply_markup=reply_markup)
+async def send_audio(message, audio_buffer, caption=None):
+    """Reply with speech; caption text over Telegram's limit follows as text messages"""
+    overflow = ''
+    if caption:
+        caption, overflow = split_caption(caption, MAX_CAPTION_LENGTH)
+    sent = await upload_audio(message, audio_buffer, caption=caption)
+    for part in split_message(overflow, MAX_MESSAGE_LENGTH):
+        await message.reply_text(part)
+    return sent
 
-async def menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Menu command handler"""
-    menu_message = f"{USER_NAME} جان، منوی اصلی:"
-    
-    keyboard = [
-        [
-            InlineKeyboardButton("🎵 جستجوی موزیک", callback_data='search_music'),
-            InlineKeyboardButton("🎬 جستجوی فیلم", callback_data='search_movie')
-        ],
-        [
-            InlineKeyboardButton("😂 جک بگو", callback_data='tell_joke'),
-            InlineKeyboardButton("💬 گفتگو", callback_data='start_chat')
-        ],
-        [
-            InlineKeyboardButton("📋 راهنما", callback_data='show_help'),
-            InlineKeyboardButton("🔄 منوی اصلی", callback_data='main_menu')
-        ]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text(menu_message, reply_markup=reply_markup)
+async def send_speech(message, text, caption=None):
+    """Speak text, the caption going with the first part; False if no audio could be made"""
+    spoken = False
+    async for audio_buffer in VoiceService.create_audio_parts(text):
+        await send_audio(message, audio_buffer, caption=None if spoken else caption)
+        spoken = True
+    return spoken
 
-async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Help command handler"""
-    help_text = f"""
-راهنمای کامل ربات {BOT_NAME} 📖
+async def reply_spoken(message, text, speech_text=None):
+    """Reply with text and its speech (or speech_text's), without holding the text back for long
 
-🎵 جستجوی موزیک:
-/song محسن یگانه - دیره
-/song شادمهر عقیلی
+    Speech ready within SPEECH_CAPTION_WAIT (cached phrases, short clips)
+    goes out as one message captioned with the text; otherwise the text is
+    sent at once and the speech follows when synthesis finishes.
+    """
+    speech = asyncio.ensure_future(VoiceService.create_audio_async(speech_text or text))
+    try:
+        done, _ = await asyncio.wait([speech], timeout=settings.speech_caption_wait)
+        if speech in done and speech.result():
+            await send_audio(message, speech.result(), caption=text)
+            return
+        await message.reply_text(text)
+        audio_buffer = await speech
+        if audio_buffer:
+            await send_audio(message, audio_buffer)
+    finally:
+        speech.cancel()
 
-🎬 جستجوی فیلم:
-/movie جدایی نادر از سیمین
-/movie مجید مجیدی
+async def upload_audio(message, audio_buffer, caption=None):
+    """Reply with speech, reusing the file_id of an identical earlier upload"""
+    audio_bytes = audio_buffer.getvalue()
+    content_hash = FileIdStore.content_hash(audio_bytes)
+    duration = None
+    if voice_encoder is not None:
+        # Voice notes show their length before they are downloaded
+        seconds = ogg_duration(audio_bytes)
+        duration = max(1, round(seconds)) if seconds else None
+    file_id = file_id_store.get(content_hash)
+    if file_id:
+        try:
+            sent, _ = await reply_speech(message, file_id, caption=caption, duration=duration)
+            return sent
+        except BadRequest as e:
+            logger.warning(f"Stored file_id rejected, uploading again: {e}")
+            file_id_store.forget(content_hash)
+    
+    sent, media = await reply_speech(message, audio_buffer, caption=caption, duration=duration)
+    if media:
+        file_id_store.set(content_hash, media.file_id)
+    return sent
 
-😂 شنیدن جک:
-/joke
+async def answer_with_gemini(message, user_message, placeholder=None):
+    """Reply with a Gemini answer, streamed into one message when enabled, then as audio"""
+    chat_id = message.chat_id
+    if not settings.gemini_streaming:
+        response = await GeminiService.generate_response_async(user_message, chat_id)
+        if response != GEMINI_FALLBACK_REPLY:
+            await conversations.add_exchange(chat_id, user_message, response)
+        # Long answers are spoken in parts; the caption's overflow follows the first as text
+        if not await send_speech(message, response, caption=response):
+            await message.reply_text(response)
+        return
+    
+    progress = ProgressiveMessage(message, placeholder, min_interval=settings.gemini_stream_edit_interval)
+    response = ''
+    try:
+        async for chunk in GeminiService.stream_response(user_message, chat_id):
+            response += chunk
+            await progress.update(response)
+    except Exception as e:
+        logger.error(f"Gemini AI streaming error: {e}")
+    
+    if response:
+        await conversations.add_exchange(chat_id, user_message, response)
+    else:
+        response = GEMINI_FALLBACK_REPLY
+    await progress.finish(response)
+    
+    # The text is already on screen; speech starts once the answer is complete
+    await send_speech(message, response)
 
-💬 گفتگو با هوش مصنوعی:
-/talk یه فیلم خوب معرفی کن
-یا فقط پیام بفرست بدون دستور
+# Bot handlers
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Start command handler"""
+    await update.message.reply_text(ui.text('welcome'), reply_markup=ui.markup('main_menu'))
 
-🔄 دستورات دیگر:
-/start - شروع مجدد
-/help - این راهنما
+async def menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Menu command handler"""
+    await update.message.reply_text(ui.text('main_menu'), reply_markup=ui.markup('main_menu'))
 
-نکته: همه پاسخ‌ها به صورت صوتی و متنی ارسال می‌شوند 🎤
-"""
-    await update.message.reply_text(help_text)
+async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Help command handler"""
+    await update.message.reply_text(ui.text('help'))
 
 async def song_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Song search command handler"""
     if not context.args:
-        await update.message.reply_text(f"{USER_NAME} جان، اسم آهنگ یا خواننده رو بگو! مثال: /song محسن یگانه")
+        await update.message.reply_text(ui.text('song_usage'))
         return
     
     query = ' '.join(context.args)
     await update.message.reply_text(f"{USER_NAME} جان، دارم '{query}' رو برات جستجو می‌کنم... 🎵")
     
-    # Search YouTube for Persian music
-    youtube_results = PersianMusicAPI.search_youtube_music(query)
+    # Search YouTube for Persian music, or the local index of songs found before
+    results = await PersianMusicAPI.search(query)
     
-    if youtube_results:
+    if results:
         result_text = f"{USER_NAME} عزیز، این آهنگ‌ها رو برات پیدا کردم:\n\n"
-        for i, video in enumerate(youtube_results[:3], 1):
-            title = video['snippet']['title']
-            video_id = video['id']['videoId']
-            youtube_url = f"https://www.youtube.com/watch?v={video_id}"
-            result_text += f"{i}. {title}\n🔗 {youtube_url}\n\n"
-        
-        # Create audio response
-        audio_text = f"{USER_NAME} جان، {len(youtube_results)} آهنگ برات پیدا کردم!"
-        audio_buffer = VoiceService.create_audio(audio_text)
+        for i, song in enumerate(results[:3], 1):
+            # YouTube titles usually name the artist already, Spotify track names do not
+            title = f"{song['artist']} - {song['title']}" if song['source'] == 'Spotify' else song['title']
+            result_text += f"{i}. {title}\n🔗 {song['url']}\n\n"
         
-        if audio_buffer:
-            await update.message.reply_audio(audio_buffer, caption=result_text)
-        else:
-            await update.message.reply_text(result_text)
+        # Results with a spoken summary
+        await reply_spoken(update.message, result_text, speech_text=songs_found_text(len(results)))
     else:
         error_msg = f"{USER_NAME} جان، متاسفانه '{query}' رو پیدا نکردم. یه اسم دیگه امتحان کن! 🎵"
-        audio_buffer = VoiceService.create_audio(error_msg)
-        
-        if audio_buffer:
-            await update.message.reply_audio(audio_buffer, caption=error_msg)
-        else:
-            await update.message.reply_text(error_msg)
+        await reply_spoken(update.message, error_msg)
 
 async def movie_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Movie search command handler"""
     if not context.args:
-        await update.message.reply_text(f"{USER_NAME} جان، اسم فیلم رو بگو! مثال: /movie جدایی نادر از سیمین")
+        await update.message.reply_text(ui.text('movie_usage'))
         return
     
     query = ' '.join(context.args)
     await update.message.reply_text(f"{USER_NAME} جان، دارم '{query}' رو برات جستجو می‌کنم... 🎬")
     
-    # Search TMDB for movies
-    tmdb_results = MovieAPI.search_tmdb(query)
+    # Search TMDB for movies, or the local index of movies found before
+    results = await MovieAPI.search(query)
     
-    if tmdb_results:
+    if results:
         result_text = f"{USER_NAME} عزیز، این فیلم‌ها رو برات پیدا کردم:\n\n"
-        for i, movie in enumerate(tmdb_results[:3], 1):
-            title = movie.get('title', 'نامشخص')
-            overview = movie.get('overview', 'خلاصه موجود نیست')
-            release_date = movie.get('release_date', 'تاریخ نامشخص')
-            vote_average = movie.get('vote_average', 0)
+        for i, movie in enumerate(results[:3], 1):
+            result_text += f"{i}. {movie['title']}\n"
+            if movie['source'] == 'OMDB':
+                result_text += f"📅 سال انتشار: {movie['year']}\n\n"
+                continue
             
-            result_text += f"{i}. {title}\n"
-            result_text += f"📅 سال انتشار: {release_date}\n"
-            result_text += f"⭐ امتیاز: {vote_average}/10\n"
-            result_text += f"📝 خلاصه: {overview[:100]}...\n\n"
-        
-        # Create audio response
-        audio_text = f"{USER_NAME} جان، {len(tmdb_results)} فیلم برات پیدا کردم!"
-        audio_buffer = VoiceService.create_audio(audio_text)
+            result_text += f"📅 سال انتشار: {movie['release_date']}\n"
+            result_text += f"⭐ امتیاز: {movie['vote_average']}/10\n"
+            result_text += f"📝 خلاصه: {(movie['overview'] or '')[:100]}...\n\n"
         
-        if audio_buffer:
-            await update.message.reply_audio(audio_buffer, caption=result_text)
-        else:
-            await update.message.reply_text(result_text)
+        # Results with a spoken summary
+        await reply_spoken(update.message, result_text, speech_text=movies_found_text(len(results)))
     else:
         error_msg = f"{USER_NAME} جان، متاسفانه '{query}' رو پیدا نکردم. یه اسم دیگه امتحان کن! 🎬"
-        audio_buffer = VoiceService.create_audio(error_msg)
-        
-        if audio_buffer:
-            await update.message.reply_audio(audio_buffer, caption=error_msg)
-        else:
-            await update.message.reply_text(error_msg)
+        await reply_spoken(update.message, error_msg)
 
 async def joke_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Joke command handler"""
     joke = random.choice(JOKES)
-    audio_buffer = VoiceService.create_audio(joke)
-    
-    if audio_buffer:
-        await update.message.reply_audio(audio_buffer, caption=joke)
-    else:
-        await update.message.reply_text(joke)
+    await reply_spoken(update.message, joke)
 
 async def talk_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Talk command handler"""
     if not context.args:
-        await update.message.reply_text(f"{USER_NAME} جان، چی می‌خوای بگی؟ مثال: /talk یه فیلم خوب معرفی کن")
+        await update.message.reply_text(ui.text('talk_usage'))
         return
     
     user_message = ' '.join(context.args)
-    await update.message.reply_text(f"{USER_NAME} جان، دارم فکر می‌کنم... 💭")
+    thinking = await update.message.reply_text(ui.text('thinking'))
     
-    # Generate response using Gemini
-    response = GeminiService.generate_response(user_message)
-    audio_buffer = VoiceService.create_audio(response)
-    
-    if audio_buffer:
-        await update.message.reply_audio(audio_buffer, caption=response)
-    else:
-        await update.message.reply_text(response)
+    await answer_with_gemini(update.message, user_message, placeholder=thinking)
 
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle regular text messages"""
     user_message = update.message.text
     
-    # Generate response using Gemini
-    response = GeminiService.generate_response(user_message)
-    audio_buffer = VoiceService.create_audio(response)
+    await answer_with_gemini(update.message, user_message)
+
+async def tell_joke(query):
+    """Send a joke with its audio, then put the menu back under the button message"""
+    joke = random.choice(JOKES)
+    await reply_spoken(query.message, joke)
     
-    if audio_buffer:
-        await update.message.reply_audio(audio_buffer, caption=response)
-    else:
-        await update.message.reply_text(response)
+    # Then update the message with menu
+    await query.edit_message_text(ui.text('joke_done'), reply_markup=ui.markup('main_menu'))
+
+def show_text(name):
+    """Button action that replaces the button message with a registered text and the menu"""
+    async def action(query):
+        await query.edit_message_text(ui.text(name), reply_markup=ui.markup('main_menu'))
+    return action
+
+# callback_data -> action taking the callback query
+BUTTON_ACTIONS = {
+    'search_music': show_text('search_music'),
+    'search_movie': show_text('search_movie'),
+    'tell_joke': tell_joke,
+    'start_chat': show_text('start_chat'),
+    'show_help': show_text('help'),
+    'main_menu': show_text('main_menu'),
+}
 
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle button callbacks"""
     query = update.callback_query
     await query.answer()
     
-    keyboard = [
-        [
-            InlineKeyboardButton("🎵 جستجوی موزیک", callback_data='search_music'),
-            InlineKeyboardButton("🎬 جستجوی فیلم", callback_data='search_movie')
-        ],
-        [
-            InlineKeyboardButton("😂 جک بگو", callback_data='tell_joke'),
-            InlineKeyboardButton("💬 گفتگو", callback_data='start_chat')
-        ],
-        [
-            InlineKeyboardButton("📋 راهنما", callback_data='show_help'),
-            InlineKeyboardButton("🔄 منوی اصلی", callback_data='main_menu')
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    action = BUTTON_ACTIONS.get(query.data)
+    if action is not None:
+        await action(query)
+
+def inline_kinds(text):
+    """Kinds an inline query asks for and the words to search: "فیلم سیمین" searches movies for سیمین"""
+    first, _, rest = text.partition(' ')
+    kinds = INLINE_KEYWORDS.get(first.lower())
+    if kinds is None:
+        return ('music', 'movie'), text
+    return kinds, rest.strip()
+
+def inline_article(kind, position, result):
+    """An inline query result that sends the song or movie to the chat when chosen"""
+    if kind == 'music':
+        # YouTube titles usually name the artist already, Spotify track names do not
+        title = f"{result['artist']} - {result['title']}" if result['source'] == 'Spotify' else result['title']
+        text = f"🎵 {title}\n🔗 {result['url']}"
+        description = f"🎵 {result.get('artist') or ''}"
+        thumbnail = result.get('thumbnail')
+    else:
+        title = result['title']
+        year = result.get('year') or (result.get('release_date') or '')[:4]
+        text = f"🎬 {title}\n📅 سال انتشار: {year}"
+        if result['source'] != 'OMDB':
+            text += f"\n⭐ امتیاز: {result['vote_average']}/10\n📝 خلاصه: {(result['overview'] or '')[:200]}"
+        description = f"🎬 {year}"
+        thumbnail = result.get('poster_url')
+    return InlineQueryResultArticle(
+        id=f"{kind}:{position}",
+        title=title,
+        description=description,
+        input_message_content=InputTextMessageContent(text),
+        thumbnail_url=thumbnail
+    )
+
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Suggest songs and movies while the user types @bot ..."""
+    query = update.inline_query
+    kinds, text = inline_kinds(query.query.strip())
+    user_id = query.from_user.id
+    suggestions = await asyncio.gather(*(inline_search.suggest(user_id, kind, text) for kind in kinds))
+    if any(results is None for results in suggestions):
+        # A newer keystroke is being answered instead
+        return
     
-    if query.data == 'search_music':
-        text = f"{USER_NAME} جان، برای جستجوی موزیک، از دستور زیر استفاده کن:\n\n/song [نام آهنگ یا خواننده]\n\nمثال: /song محسن یگانه دیره"
-        await query.edit_message_text(text, reply_markup=reply_markup)
-        
-    elif query.data == 'search_movie':
-        text = f"{USER_NAME} جان، برای جستجوی فیلم، از دستور زیر استفاده کن:\n\n/movie [نام فیلم]\n\nمثال: /movie جدایی نادر از سیمین"
-        await query.edit_message_text(text, reply_markup=reply_markup)
-        
-    elif query.data == 'tell_joke':
-        joke = random.choice(JOKES)
-        audio_buffer = VoiceService.create_audio(joke)
-        
-        # Send audio first
-        if audio_buffer:
-            await query.message.reply_audio(audio_buffer, caption=joke)
-        else:
-            await query.message.reply_text(joke)
-            
-        # Then update the message with menu
-        await query.edit_message_text(f"{USER_NAME} جان، امیدوارم خوشت اومده باشه! 😊", reply_markup=reply_markup)
-        
-    elif query.data == 'start_chat':
-        text = f"{USER_NAME} جان، برای گفتگو می‌تونی:\n\n1️⃣ از دستور /talk استفاده کنی:\n/talk یه فیلم خوب معرفی کن\n\n2️⃣ یا مستقیماً پیام بفرستی بدون دستور"
-        await query.edit_message_text(text, reply_markup=reply_markup)
-        
-    elif query.data == 'show_help':
-        help_text = f"""
-راهنمای کامل ربات {BOT_NAME} 📖
+    articles = []
+    for kind, results in zip(kinds, suggestions):
+        articles.extend(inline_article(kind, position, result) for position, result in enumerate(results))
+    # The same text from any user is answered by Telegram's cache without reaching the bot
+    await query.answer(articles, cache_time=settings.inline_cache_time, is_personal=False)
 
-🎵 جستجوی موزیک:
-/song محسن یگانه - دیره
-/song شادمهر عقیلی
+async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Error handler"""
+    logger.warning(f'Update {update} caused error {context.error}')
+    if isinstance(context.error, RetryAfter):
+        # Replying now would only extend the flood wait
+        return
+    if isinstance(update, Update) and update.message:
+        await update.message.reply_text(ui.text('error'))
 
-🎬 جستجوی فیلم:
-/movie جدایی نادر از سیمین
-/movie مجید مجیدی
+async def warm_up_audio():
+    """Synthesize the canned phrases so their first use is as fast as any later one"""
+    started = time.perf_counter()
+    phrases = canned_phrases()
+    assets = await VoiceUtils.warm_up(
+        phrases, tts_pool, concurrency=settings.audio_warmup_concurrency, cache=audio_cache, encoder=voice_encoder
+    )
+    audio_assets.update(assets)
+    # Phrases uploaded by an earlier run are sent by file_id without uploading again
+    uploaded = sum(1 for audio in assets.values() if file_id_store.get(FileIdStore.content_hash(audio)))
+    logger.info(f"Audio warm-up: {len(assets)}/{len(phrases)} phrases ready ({uploaded} already uploaded) "
+                f"in {time.perf_counter() - started:.1f}s")
+    return assets
 
-😂 شنیدن جک:
-/joke یا از منو استفاده کن
+async def post_init(application: Application):
+    """Start the metrics endpoint and load the slow SDKs and canned audio in the background"""
+    if settings.metrics_port:
+        port = settings.metrics_port + settings.worker_index
+        try:
+            application.bot_data['metrics_server'] = await start_metrics_server(metrics, settings.metrics_host, port)
+        except OSError as e:
+            # A taken port must not stop the bot (or make the supervisor restart this worker forever)
+            logger.warning(f"Metrics endpoint disabled, could not listen on {settings.metrics_host}:{port}: {e}")
+    if settings.preload_sdks:
+        # Polling starts right away; the first Gemini or TTS call rarely pays the import
+        asyncio.get_running_loop().run_in_executor(None, preload_sdks)
+    # Workers share the disk cache, so one of them warming it is enough
+    if settings.audio_warmup and (settings.worker_index == 0 or not settings.tts_cache_dir):
+        application.bot_data['audio_warmup'] = asyncio.create_task(warm_up_audio())
 
-💬 گفتگو با هوش مصنوعی:
-/talk یه فیلم خوب معرفی کن
-یا فقط پیام بفرست بدون دستور
+async def post_shutdown(application: Application):
+    """Release pooled upstream connections and TTS workers"""
+    metrics_server = application.bot_data.pop('metrics_server', None)
+    if metrics_server is not None:
+        metrics_server.close()
+    warmup = application.bot_data.pop('audio_warmup', None)
+    if warmup is not None:
+        warmup.cancel()
+    await http_pool.aclose()
+    release_resources()
 
-🔄 دستورات دیگر:
-/start - شروع مجدد
-/menu - نمایش منو
-/help - این راهنما
+def release_resources():
+    """Stop the TTS workers and close every local store opened by configure"""
+    tts_pool.shutdown()
+    provider_guards.save()
+    file_id_store.close()
+    search_cache.close()
+    if search_index is not None:
+        search_index.close()
+    conversations.close()
 
-نکته: همه پاسخ‌ها به صورت صوتی و متنی ارسال می‌شوند 🎤
-"""
-        await query.edit_message_text(help_text, reply_markup=reply_markup)
-        
-    elif query.data == 'main_menu':
-        menu_text = f"{USER_NAME} جان، منوی اصلی:"
-        await query.edit_message_text(menu_text, reply_markup=reply_markup)
+def create_handlers(wrap=lambda callback: callback):
+    """Every update handler of the bot, each callback passed through wrap
+    
+    Creating them needs no configuration, so the supervisor can tell which
+    update types to poll for without setting the bot up in its own process.
+    """
+    return [
+        CommandHandler("start", wrap(start)),
+        CommandHandler("menu", wrap(menu_command)),
+        CommandHandler("help", wrap(help_command)),
+        CommandHandler("song", wrap(song_command)),
+        CommandHandler("movie", wrap(movie_command)),
+        CommandHandler("joke", wrap(joke_command)),
+        CommandHandler("talk", wrap(talk_command)),
+        CallbackQueryHandler(wrap(button_callback)),
+        InlineQueryHandler(wrap(inline_query)),
+        MessageHandler(filters.TEXT & ~filters.COMMAND, wrap(handle_text)),
+    ]
 
-async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Error handler"""
-    logger.warning(f'Update {update} caused error {context.error}')
-    if update.message:
-        await update.message.reply_text(f"{USER_NAME} جان، یه مشکلی پیش اومد. دوباره امتحان کن! 😊")
+def build_application(new_settings=None):
+    """Create the bot application with every handler registered
+    
+    Worker processes call this without settings and read them from their
+    environment, which they inherit from the supervisor.
+    """
+    settings = configure(new_settings)
+    scheduler = ChatScheduler(
+        max_concurrent=settings.concurrent_updates,
+        per_chat_limit=settings.chat_concurrency,
+        max_pending_per_chat=settings.chat_max_pending,
+        max_inline=settings.inline_concurrency
+    )
+    rate_limiter = SendRateLimiter(
+        # Worker processes each send their share of the bot-wide budget
+        global_rate=settings.send_global_rate / max(1, settings.worker_processes),
+        chat_rate=settings.send_chat_rate,
+        group_rate=settings.send_group_rate,
+        chat_burst=settings.send_chat_burst,
+        max_retries=settings.send_max_retries
+    )
+    metrics.register_stats('scheduler', scheduler.stats)
+    metrics.register_stats('send', rate_limiter.stats)
+    metrics.register_stats(
+        'send_queue',
+        lambda: {lane: {'depth': depth} for lane, depth in rate_limiter.stats()['queued'].items()},
+        label='lane'
+    )
+    
+    builder = (
+        Application.builder()
+        .token(settings.telegram_token)
+        .concurrent_updates(scheduler)
+        .rate_limiter(rate_limiter)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if settings.telegram_api_base_url:
+        builder = builder.base_url(settings.telegram_api_base_url)
+    application = builder.build()
+    
+    # Add handlers, each timed under its function name
+    application.add_handlers(create_handlers(metrics.instrument))
+    
+    # Add error handler
+    application.add_error_handler(error_handler)
+    
+    return application
 
 def main():
     """Main function to run the bot"""
-    # Create application
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
-    
-    # Add handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("menu", menu_command))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("song", song_command))
-    application.add_handler(CommandHandler("movie", movie_command))
-    application.add_handler(CommandHandler("joke", joke_command))
-    application.add_handler(CommandHandler("talk", talk_command))
-    application.add_handler(CallbackQueryHandler(button_callback))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
+    # Configure logging
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
     
-    # Add error handler
-    application.add_error_handler(error_handler)
+    # Offline maintenance steps run instead of the bot
+    parser = argparse.ArgumentParser(description="Telegram bot; without options it runs the bot")
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument('--warm-audio', action='store_true',
+                        help="synthesize the fixed replies into TTS_CACHE_DIR and exit")
+    action.add_argument('--import-index', metavar='PATH',
+                        help="load search index entries from a JSON lines file and exit")
+    action.add_argument('--export-index', metavar='PATH',
+                        help="write the search index as JSON lines and exit")
+    args = parser.parse_args()
+    
+    # Load environment variables and check the required tokens are available
+    settings = Settings.from_env()
+    if args.warm_audio:
+        # Offline build step: fill the disk audio cache before deploying
+        if not settings.tts_cache_dir:
+            logger.warning("TTS_CACHE_DIR is empty, the synthesized audio will not be kept")
+        configure(settings)
+        try:
+            asyncio.run(warm_up_audio())
+        finally:
+            release_resources()
+        return
+    if args.import_index or args.export_index:
+        # Bulk transfer of the local search index as JSON lines, e.g. to seed a new deploy
+        configure(settings)
+        try:
+            if search_index is None:
+                logger.error("SEARCH_INDEX_PATH is empty, there is no search index")
+                exit(1)
+            if args.import_index:
+                search_index.import_jsonl(args.import_index)
+            else:
+                count = search_index.export_jsonl(args.export_index)
+                logger.info(f"Exported {count} search index entries to {args.export_index}")
+        finally:
+            release_resources()
+        return
+    missing = settings.missing()
+    if missing:
+        for name in missing:
+            logger.error(f"{name} not found in environment variables")
+        exit(1)
+    
+    # Only ask Telegram for the update types we handle
+    allowed_updates = derive_allowed_updates(create_handlers())
     
     # Run the bot
     print(f"ربات {BOT_NAME} برای {USER_NAME} شروع شد! 🚀")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if settings.worker_processes > 0:
+        # Each worker process builds its own application from build_application
+        supervisor = Supervisor(
+            settings.telegram_token,
+            build_application,
+            workers=settings.worker_processes,
+            base_url=settings.telegram_api_base_url or None,
+            allowed_updates=allowed_updates,
+            heartbeat_timeout=settings.worker_heartbeat_timeout,
+            drain_timeout=settings.drain_timeout
+        )
+        supervisor.run()
+        return
+    
+    # Without workers, this process runs the bot itself
+    application = build_application(settings)
+    if settings.bot_mode == 'webhook':
+        webhook_app = WebhookApp(
+            application,
+            path=settings.webhook_path,
+            webhook_url=settings.webhook_url or None,
+            secret_token=settings.webhook_secret or None,
+            allowed_updates=allowed_updates,
+            max_connections=settings.webhook_max_connections,
+            drain_timeout=settings.drain_timeout
+        )
+        run_webhook_server(webhook_app, listen=settings.webhook_listen, port=settings.webhook_port)
+    else:
+        application.run_polling(allowed_updates=allowed_updates)
 
 if __name__ == '__main__':
     main()
@@ -1,99 +1,156 @@
 
-import requests
 import logging
 from typing import List, Dict, Optional
 
+import httpx
+
+from utils.circuit_breaker import ProviderGuards, ProviderUnavailable, provider_guards
+from utils.dedup import merge_results
+from utils.fanout import gather_with_deadline
+from utils.http_client import HttpClientPool, http_pool
+from utils.normalization import normalize_text
+from utils.result_cache import ResultCache
+from utils.search_index import SearchIndex
+from utils.single_flight import SingleFlight
+
 logger = logging.getLogger(__name__)
 
 class MovieService:
     """Service for searching movies using public APIs"""
     
-    def __init__(self, tmdb_api_key: str, omdb_api_key: Optional[str] = None):
+    def __init__(self, tmdb_api_key: str, omdb_api_key: Optional[str] = None,
+                 http: Optional[HttpClientPool] = None, search_deadline: float = 5.0,
+                 cache: Optional[ResultCache] = None, guards: Optional[ProviderGuards] = None,
+                 index: Optional[SearchIndex] = None):
         self.tmdb_api_key = tmdb_api_key
         self.omdb_api_key = omdb_api_key
+        self.http = http or http_pool
+        self.search_deadline = search_deadline
+        self._flights = SingleFlight()
+        self.cache = cache or ResultCache(namespace='movie')
+        self.guards = guards or provider_guards
+        # Optional local catalogue, fed with every comprehensive search
+        self.index = index
     
-    def search_tmdb(self, query: str) -> List[Dict]:
+    async def search_tmdb(self, query: str) -> List[Dict]:
         """Search movies using TMDB API"""
         try:
-            url = "https://api.themoviedb.org/3/search/movie"
-            params = {
-                'api_key': self.tmdb_api_key,
-                'query': query,
-                'language': 'fa-IR',
-                'region': 'IR',
-                'include_adult': False
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            return self._format_tmdb_results(data.get('results', []))
-            
-        except requests.exceptions.RequestException as e:
+            return await self._cached_tmdb(query)
+        except ProviderUnavailable as e:
+            logger.warning(f"Skipping TMDB search: {e}")
+            return []
+        except httpx.HTTPError as e:
             logger.error(f"TMDB API request failed: {e}")
             return []
         except Exception as e:
             logger.error(f"Unexpected error in TMDB search: {e}")
             return []
     
-    def search_omdb(self, query: str) -> List[Dict]:
+    async def _cached_tmdb(self, query: str) -> List[Dict]:
+        """TMDB results through the cache and circuit breaker; raises when the provider fails"""
+        return await self.cache.get_or_fetch(
+            'TMDB', query, lambda: self.guards.call('TMDB', lambda: self._fetch_tmdb(query))
+        )
+    
+    async def _fetch_tmdb(self, query: str) -> List[Dict]:
+        """Query the TMDB movie search API; raises on upstream errors"""
+        url = "https://api.themoviedb.org/3/search/movie"
+        params = {
+            'api_key': self.tmdb_api_key,
+            'query': query,
+            'language': 'fa-IR',
+            'region': 'IR',
+            'include_adult': False
+        }
+        
+        response = await self.http.get(url, params=params, timeout=10)
+        response.raise_for_status()
+        
+        data = response.json()
+        return self.format_tmdb_results(data.get('results', []))
+    
+    async def search_omdb(self, query: str) -> List[Dict]:
         """Search movies using OMDB API (if key available)"""
         if not self.omdb_api_key:
             return []
         
         try:
-            url = "http://www.omdbapi.com/"
-            params = {
-                'apikey': self.omdb_api_key,
-                's': query,
-                'type': 'movie',
-                'r': 'json'
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            if data.get('Response') == 'True':
-                return self._format_omdb_results(data.get('Search', []))
-            else:
-                logger.warning(f"OMDB API returned error: {data.get('Error', 'Unknown error')}")
-                return []
-            
-        except requests.exceptions.RequestException as e:
+            return await self._cached_omdb(query)
+        except ProviderUnavailable as e:
+            logger.warning(f"Skipping OMDB search: {e}")
+            return []
+        except httpx.HTTPError as e:
             logger.error(f"OMDB API request failed: {e}")
             return []
         except Exception as e:
             logger.error(f"Unexpected error in OMDB search: {e}")
             return []
     
-    def search_persian_movies(self, query: str) -> List[Dict]:
+    async def _cached_omdb(self, query: str) -> List[Dict]:
+        """OMDB results through the cache and circuit breaker; raises when the provider fails"""
+        return await self.cache.get_or_fetch(
+            'OMDB', query, lambda: self.guards.call('OMDB', lambda: self._fetch_omdb(query))
+        )
+    
+    async def _fetch_omdb(self, query: str) -> List[Dict]:
+        """Query the OMDB search API; raises on upstream errors"""
+        url = "http://www.omdbapi.com/"
+        params = {
+            'apikey': self.omdb_api_key,
+            's': query,
+            'type': 'movie',
+            'r': 'json'
+        }
+        
+        response = await self.http.get(url, params=params, timeout=10)
+        response.raise_for_status()
+        
+        data = response.json()
+        if data.get('Response') == 'True':
+            return self.format_omdb_results(data.get('Search', []))
+        else:
+            logger.warning(f"OMDB API returned error: {data.get('Error', 'Unknown error')}")
+            return []
+    
+    async def search_persian_movies(self, query: str) -> List[Dict]:
         """Search specifically for Persian/Iranian movies"""
         try:
-            url = "https://api.themoviedb.org/3/search/movie"
-            params = {
-                'api_key': self.tmdb_api_key,
-                'query': f"{query} Persian Iranian",
-                'language': 'fa-IR',
-                'region': 'IR',
-                'include_adult': False
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            return self._format_tmdb_results(data.get('results', []))
-            
-        except requests.exceptions.RequestException as e:
+            return await self._cached_persian_movies(query)
+        except ProviderUnavailable as e:
+            logger.warning(f"Skipping Persian movie search: {e}")
+            return []
+        except httpx.HTTPError as e:
             logger.error(f"Persian movie search failed: {e}")
             return []
         except Exception as e:
             logger.error(f"Unexpected error in Persian movie search: {e}")
             return []
     
-    def _format_tmdb_results(self, items: List[Dict]) -> List[Dict]:
+    async def _cached_persian_movies(self, query: str) -> List[Dict]:
+        """TMDB-Persian results through the cache and circuit breaker; raises when the provider fails"""
+        return await self.cache.get_or_fetch(
+            'TMDB-Persian', query, lambda: self.guards.call('TMDB', lambda: self._fetch_persian_movies(query))
+        )
+    
+    async def _fetch_persian_movies(self, query: str) -> List[Dict]:
+        """Query TMDB with Persian/Iranian keywords; raises on upstream errors"""
+        url = "https://api.themoviedb.org/3/search/movie"
+        params = {
+            'api_key': self.tmdb_api_key,
+            'query': f"{query} Persian Iranian",
+            'language': 'fa-IR',
+            'region': 'IR',
+            'include_adult': False
+        }
+        
+        response = await self.http.get(url, params=params, timeout=10)
+        response.raise_for_status()
+        
+        data = response.json()
+        return self.format_tmdb_results(data.get('results', []))
+    
+    @staticmethod
+    def format_tmdb_results(items: List[Dict]) -> List[Dict]:
         """Format TMDB search results"""
         formatted_results = []
         for item in items:
@@ -118,7 +175,8 @@ class MovieService:
         
         return formatted_results
     
-    def _format_omdb_results(self, items: List[Dict]) -> List[Dict]:
+    @staticmethod
+    def format_omdb_results(items: List[Dict]) -> List[Dict]:
         """Format OMDB search results"""
         formatted_results = []
         for item in items:
@@ -138,36 +196,47 @@ class MovieService:
         
         return formatted_results
     
-    def comprehensive_search(self, query: str) -> List[Dict]:
-        """Search across multiple movie databases"""
-        all_results = []
-        
-        # Search TMDB
-        tmdb_results = self.search_tmdb(query)
-        all_results.extend(tmdb_results)
+    async def comprehensive_search(self, query: str, deadline: Optional[float] = None) -> Dict:
+        """Search across multiple movie databases concurrently
         
-        # Search for Persian movies specifically
-        persian_results = self.search_persian_movies(query)
-        all_results.extend(persian_results)
+        Providers that fail, are switched off by their circuit breaker, or do
+        not answer within the deadline are listed under 'missing', with
+        'partial' set to True. With an index, confident
+        local matches are returned without calling upstream ('local' is True).
+        """
+        deadline = deadline if deadline is not None else self.search_deadline
+        # Identical concurrent searches share one fan-out
+        return await self._flights.do(
+            (normalize_text(query), deadline), lambda: self._comprehensive_search(query, deadline)
+        )
+    
+    async def _comprehensive_search(self, query: str, deadline: float) -> Dict:
+        if self.index is not None:
+            local_results = await self.index.lookup_async('movie', query)
+            if local_results:
+                return {'results': local_results, 'partial': False, 'missing': [], 'local': True}
         
-        # Search OMDB if available
-        omdb_results = self.search_omdb(query)
-        all_results.extend(omdb_results)
+        calls = {
+            'TMDB': self._cached_tmdb(query),
+            'TMDB-Persian': self._cached_persian_movies(query),
+        }
+        if self.omdb_api_key:
+            calls['OMDB'] = self._cached_omdb(query)
         
-        # Remove duplicates based on title similarity
-        unique_results = self._remove_duplicates(all_results)
+        provider_results, missing = await gather_with_deadline(calls, deadline)
         
-        return unique_results[:10]  # Return top 10 results
-    
-    def _remove_duplicates(self, results: List[Dict]) -> List[Dict]:
-        """Remove duplicate results based on title similarity"""
-        unique_results = []
-        seen_titles = set()
+        all_results = []
+        for results in provider_results.values():
+            all_results.extend(results)
         
-        for result in results:
-            title_lower = result['title'].lower()
-            if title_lower not in seen_titles:
-                seen_titles.add(title_lower)
-                unique_results.append(result)
+        # Merge near-duplicates across providers; results more providers found rank first
+        unique_results = merge_results(all_results)
+        if self.index is not None and unique_results:
+            self.index.add_later('movie', unique_results)
         
-        return unique_results
+        return {
+            'results': unique_results[:10],  # Return top 10 results
+            'partial': bool(missing),
+            'missing': missing,
+            'local': False
+        }
@@ -1,75 +1,120 @@
 
-import requests
 import logging
 from typing import List, Dict, Optional
 
+import httpx
+
+from utils.circuit_breaker import ProviderGuards, ProviderUnavailable, provider_guards
+from utils.dedup import merge_results
+from utils.fanout import gather_with_deadline
+from utils.http_client import HttpClientPool, http_pool
+from utils.normalization import normalize_text
+from utils.result_cache import ResultCache
+from utils.search_index import SearchIndex
+from utils.single_flight import SingleFlight
+
 logger = logging.getLogger(__name__)
 
 class MusicService:
     """Service for searching Persian music using public APIs"""
     
-    def __init__(self, youtube_api_key: str, spotify_token: Optional[str] = None):
+    def __init__(self, youtube_api_key: str, spotify_token: Optional[str] = None,
+                 http: Optional[HttpClientPool] = None, search_deadline: float = 5.0,
+                 cache: Optional[ResultCache] = None, guards: Optional[ProviderGuards] = None,
+                 index: Optional[SearchIndex] = None):
         self.youtube_api_key = youtube_api_key
         self.spotify_token = spotify_token
+        self.http = http or http_pool
+        self.search_deadline = search_deadline
+        self._flights = SingleFlight()
+        self.cache = cache or ResultCache(namespace='music')
+        self.guards = guards or provider_guards
+        # Optional local catalogue, fed with every comprehensive search
+        self.index = index
     
-    def search_youtube_music(self, query: str) -> List[Dict]:
+    async def search_youtube_music(self, query: str) -> List[Dict]:
         """Search for Persian music on YouTube"""
         try:
-            url = "https://www.googleapis.com/youtube/v3/search"
-            params = {
-                'part': 'snippet',
-                'q': f"{query} آهنگ ایرانی Persian music",
-                'type': 'video',
-                'maxResults': 5,
-                'key': self.youtube_api_key,
-                'regionCode': 'IR'
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            return self._format_youtube_results(data.get('items', []))
-            
-        except requests.exceptions.RequestException as e:
+            return await self._cached_youtube_music(query)
+        except ProviderUnavailable as e:
+            logger.warning(f"Skipping YouTube search: {e}")
+            return []
+        except httpx.HTTPError as e:
             logger.error(f"YouTube API request failed: {e}")
             return []
         except Exception as e:
             logger.error(f"Unexpected error in YouTube search: {e}")
             return []
     
-    def search_spotify_music(self, query: str) -> List[Dict]:
+    async def _cached_youtube_music(self, query: str) -> List[Dict]:
+        """YouTube results through the cache and circuit breaker; raises when the provider fails"""
+        return await self.cache.get_or_fetch(
+            'YouTube', query, lambda: self.guards.call('YouTube', lambda: self._fetch_youtube_music(query))
+        )
+    
+    async def _fetch_youtube_music(self, query: str) -> List[Dict]:
+        """Query the YouTube search API; raises on upstream errors"""
+        url = "https://www.googleapis.com/youtube/v3/search"
+        params = {
+            'part': 'snippet',
+            'q': f"{query} آهنگ ایرانی Persian music",
+            'type': 'video',
+            'maxResults': 5,
+            'key': self.youtube_api_key,
+            'regionCode': 'IR'
+        }
+        
+        response = await self.http.get(url, params=params, timeout=10)
+        response.raise_for_status()
+        
+        data = response.json()
+        return self.format_youtube_results(data.get('items', []))
+    
+    async def search_spotify_music(self, query: str) -> List[Dict]:
         """Search for Persian music on Spotify (if token available)"""
         if not self.spotify_token:
             return []
         
         try:
-            url = "https://api.spotify.com/v1/search"
-            headers = {
-                'Authorization': f'Bearer {self.spotify_token}',
-                'Content-Type': 'application/json'
-            }
-            params = {
-                'q': f"{query} Persian Iranian",
-                'type': 'track',
-                'market': 'IR',
-                'limit': 5
-            }
-            
-            response = requests.get(url, headers=headers, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            return self._format_spotify_results(data.get('tracks', {}).get('items', []))
-            
-        except requests.exceptions.RequestException as e:
+            return await self._cached_spotify_music(query)
+        except ProviderUnavailable as e:
+            logger.warning(f"Skipping Spotify search: {e}")
+            return []
+        except httpx.HTTPError as e:
             logger.error(f"Spotify API request failed: {e}")
             return []
         except Exception as e:
             logger.error(f"Unexpected error in Spotify search: {e}")
             return []
     
-    def _format_youtube_results(self, items: List[Dict]) -> List[Dict]:
+    async def _cached_spotify_music(self, query: str) -> List[Dict]:
+        """Spotify results through the cache and circuit breaker; raises when the provider fails"""
+        return await self.cache.get_or_fetch(
+            'Spotify', query, lambda: self.guards.call('Spotify', lambda: self._fetch_spotify_music(query))
+        )
+    
+    async def _fetch_spotify_music(self, query: str) -> List[Dict]:
+        """Query the Spotify search API; raises on upstream errors"""
+        url = "https://api.spotify.com/v1/search"
+        headers = {
+            'Authorization': f'Bearer {self.spotify_token}',
+            'Content-Type': 'application/json'
+        }
+        params = {
+            'q': f"{query} Persian Iranian",
+            'type': 'track',
+            'market': 'IR',
+            'limit': 5
+        }
+        
+        response = await self.http.get(url, params=params, headers=headers, timeout=10)
+        response.raise_for_status()
+        
+        data = response.json()
+        return self.format_spotify_results(data.get('tracks', {}).get('items', []))
+    
+    @staticmethod
+    def format_youtube_results(items: List[Dict]) -> List[Dict]:
         """Format YouTube search results"""
         formatted_results = []
         for item in items:
@@ -88,7 +133,8 @@ class MusicService:
         
         return formatted_results
     
-    def _format_spotify_results(self, items: List[Dict]) -> List[Dict]:
+    @staticmethod
+    def format_spotify_results(items: List[Dict]) -> List[Dict]:
         """Format Spotify search results"""
         formatted_results = []
         for item in items:
@@ -108,32 +154,44 @@ class MusicService:
         
         return formatted_results
     
-    def comprehensive_search(self, query: str) -> List[Dict]:
-        """Search across multiple platforms"""
-        all_results = []
+    async def comprehensive_search(self, query: str, deadline: Optional[float] = None) -> Dict:
+        """Search across multiple platforms concurrently
         
-        # Search YouTube
-        youtube_results = self.search_youtube_music(query)
-        all_results.extend(youtube_results)
+        Providers that fail, are switched off by their circuit breaker, or do
+        not answer within the deadline are listed under 'missing', with
+        'partial' set to True. With an index, confident
+        local matches are returned without calling upstream ('local' is True).
+        """
+        deadline = deadline if deadline is not None else self.search_deadline
+        # Identical concurrent searches share one fan-out
+        return await self._flights.do(
+            (normalize_text(query), deadline), lambda: self._comprehensive_search(query, deadline)
+        )
+    
+    async def _comprehensive_search(self, query: str, deadline: float) -> Dict:
+        if self.index is not None:
+            local_results = await self.index.lookup_async('music', query)
+            if local_results:
+                return {'results': local_results, 'partial': False, 'missing': [], 'local': True}
         
-        # Search Spotify if available
-        spotify_results = self.search_spotify_music(query)
-        all_results.extend(spotify_results)
+        calls = {'YouTube': self._cached_youtube_music(query)}
+        if self.spotify_token:
+            calls['Spotify'] = self._cached_spotify_music(query)
         
-        # Remove duplicates based on title similarity
-        unique_results = self._remove_duplicates(all_results)
+        provider_results, missing = await gather_with_deadline(calls, deadline)
         
-        return unique_results[:10]  # Return top 10 results
-    
-    def _remove_duplicates(self, results: List[Dict]) -> List[Dict]:
-        """Remove duplicate results based on title similarity"""
-        unique_results = []
-        seen_titles = set()
+        all_results = []
+        for results in provider_results.values():
+            all_results.extend(results)
         
-        for result in results:
-            title_lower = result['title'].lower()
-            if title_lower not in seen_titles:
-                seen_titles.add(title_lower)
-                unique_results.append(result)
+        # Merge near-duplicates across providers; results more providers found rank first
+        unique_results = merge_results(all_results)
+        if self.index is not None and unique_results:
+            self.index.add_later('music', unique_results)
         
-        return unique_results
+        return {
+            'results': unique_results[:10],  # Return top 10 results
+            'partial': bool(missing),
+            'missing': missing,
+            'local': False
+        }
@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'persian-bot-tts-cache')
+
+# File extension of each audio format the cache can hold
+AUDIO_EXTENSIONS = {'mp3': '.mp3', 'opus': '.ogg'}
+
+
+class AudioCache:
+    """Content-addressed cache for synthesized speech
+
+    Entries are keyed by a hash of (text, lang, slow) and the audio format
+    the cache holds. A size-bounded LRU keeps hot clips in memory; an optional
+    directory of audio files keeps them across restarts and is consulted on
+    memory misses. On the event loop, use get_async() and put_async(), which
+    touch the disk from a worker thread.
+    """
+
+    def __init__(self, max_memory_bytes: int = 32 * 1024 * 1024, disk_dir: Optional[str] = DEFAULT_CACHE_DIR,
+                 max_disk_bytes: int = 256 * 1024 * 1024, audio_format: str = 'mp3'):
+        if audio_format not in AUDIO_EXTENSIONS:
+            raise ValueError(f"Unknown audio format {audio_format!r}")
+        self.audio_format = audio_format
+        self.extension = AUDIO_EXTENSIONS[audio_format]
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+        if self.disk_dir:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+                self._disk_bytes = sum(
+                    entry.stat().st_size for entry in os.scandir(self.disk_dir)
+                    if entry.is_file() and entry.name.endswith(self.extension)
+                )
+            except OSError as e:
+                logger.error(f"Audio cache directory unavailable, disk tier disabled: {e}")
+                self.disk_dir = None
+
+    @staticmethod
+    def make_key(text: str, lang: str = 'fa', slow: bool = False, audio_format: str = 'mp3') -> str:
+        """Return the content address for a synthesis request"""
+        raw = f"{lang}\x00{int(slow)}\x00{text}"
+        if audio_format != 'mp3':
+            # MP3 keys predate the format and stay as they were, so existing caches still hit
+            raw += f"\x00{audio_format}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}{self.extension}")
+
+    def _remember(self, key: str, data: bytes) -> None:
+        """Insert into the memory tier, evicting least recently used entries"""
+        if len(data) > self.max_memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.evictions += 1
+
+    def _memory_get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+            return data
+
+    def get(self, text: str, lang: str = 'fa', slow: bool = False) -> Optional[bytes]:
+        """Return cached audio bytes, or None on a miss"""
+        key = self.make_key(text, lang, slow, self.audio_format)
+        data = self._memory_get(key)
+        if data is not None:
+            return data
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                os.utime(path)
+            except FileNotFoundError:
+                data = None
+            except OSError as e:
+                logger.warning(f"Audio cache read failed: {e}")
+                data = None
+            if data:
+                with self._lock:
+                    self._remember(key, data)
+                    self.disk_hits += 1
+                return data
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, text: str, lang: str, slow: bool, data: bytes) -> None:
+        """Store audio bytes in both tiers"""
+        if not data:
+            return
+        key = self.make_key(text, lang, slow, self.audio_format)
+        with self._lock:
+            self._remember(key, data)
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            if os.path.exists(path):
+                return
+            try:
+                # Write to a temporary file first so readers never see partial audio
+                temp_file = tempfile.NamedTemporaryFile(delete=False, dir=self.disk_dir, suffix='.tmp')
+                with temp_file:
+                    temp_file.write(data)
+                os.replace(temp_file.name, path)
+                with self._lock:
+                    self._disk_bytes += len(data)
+                    over_budget = self._disk_bytes > self.max_disk_bytes
+                if over_budget:
+                    self._prune_disk()
+            except OSError as e:
+                logger.warning(f"Audio cache write failed: {e}")
+
+    async def get_async(self, text: str, lang: str = 'fa', slow: bool = False) -> Optional[bytes]:
+        """get() for the event loop: memory hits are answered directly, disk reads run in a thread"""
+        if self.disk_dir:
+            data = self._memory_get(self.make_key(text, lang, slow, self.audio_format))
+            if data is not None:
+                return data
+            return await asyncio.to_thread(self.get, text, lang, slow)
+        return self.get(text, lang, slow)
+
+    async def put_async(self, text: str, lang: str, slow: bool, data: bytes) -> None:
+        """put() for the event loop: the file write (and any pruning) runs in a thread"""
+        if self.disk_dir:
+            await asyncio.to_thread(self.put, text, lang, slow, data)
+        else:
+            self.put(text, lang, slow, data)
+
+    def _prune_disk(self) -> None:
+        """Delete least recently used files until the disk tier fits its budget"""
+        try:
+            entries = sorted(
+                (entry for entry in os.scandir(self.disk_dir) if entry.name.endswith(self.extension)),
+                key=lambda entry: entry.stat().st_mtime
+            )
+        except OSError as e:
+            logger.warning(f"Audio cache prune failed: {e}")
+            return
+
+        total = sum(entry.stat().st_size for entry in entries)
+        target = self.max_disk_bytes * 0.9
+        for entry in entries:
+            if total <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.unlink(entry.path)
+                total -= size
+                self.disk_evictions += 1
+            except OSError:
+                continue
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'disk_evictions': self.disk_evictions,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'disk_bytes': self._disk_bytes
+            }
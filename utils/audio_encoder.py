@@ -0,0 +1,70 @@
+import logging
+import shutil
+import struct
+import subprocess
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Opus always counts samples at 48 kHz in the Ogg granule position
+_OPUS_GRANULE_RATE = 48000
+# libopus accepts only these input rates
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+class OpusEncoder:
+    """Transcode synthesized speech to OGG/Opus voice notes with ffmpeg
+
+    gTTS produces 24 kHz mono MP3 at 32 kbps or more; Opus in VoIP mode keeps
+    speech intelligible at half that, and Telegram shows OGG/Opus sent with
+    sendVoice as a voice note with a waveform. Encoding runs in a subprocess,
+    so callers on the event loop should use it from the TTS worker pool.
+    """
+
+    def __init__(self, bitrate_kbps: int = 16, sample_rate: int = 24000, compression_level: int = 5,
+                 ffmpeg: str = 'ffmpeg', timeout: float = 10.0):
+        if sample_rate not in OPUS_SAMPLE_RATES:
+            raise ValueError(f"Opus sample rate must be one of {OPUS_SAMPLE_RATES}, not {sample_rate}")
+        self.bitrate_kbps = bitrate_kbps
+        self.sample_rate = sample_rate
+        # 0-10: encoder effort; at a fixed bitrate 10 sounds best but costs ~4x level 0
+        self.compression_level = compression_level
+        self.ffmpeg = ffmpeg
+        self.timeout = timeout
+
+    def available(self) -> bool:
+        """Whether the ffmpeg binary can be found"""
+        return shutil.which(self.ffmpeg) is not None
+
+    def command(self) -> List[str]:
+        return [
+            self.ffmpeg, '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0',
+            '-vn', '-ac', '1', '-ar', str(self.sample_rate),
+            '-c:a', 'libopus', '-b:a', f'{self.bitrate_kbps}k', '-application', 'voip',
+            '-compression_level', str(self.compression_level),
+            '-f', 'ogg', 'pipe:1'
+        ]
+
+    def encode(self, audio: bytes) -> Optional[bytes]:
+        """OGG/Opus bytes of the given audio (any format ffmpeg reads), or None on failure"""
+        try:
+            result = subprocess.run(self.command(), input=audio, capture_output=True, timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logger.error(f"Opus encoding failed: {e}")
+            return None
+        if result.returncode != 0 or not result.stdout:
+            logger.error(f"Opus encoding failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+            return None
+        return result.stdout
+
+
+def ogg_duration(data: bytes) -> Optional[float]:
+    """Seconds of audio in an OGG/Opus stream, read from its last page; None if it is not one"""
+    last_page = data.rfind(b'OggS')
+    if last_page < 0 or len(data) < last_page + 14 or not data.startswith(b'OggS'):
+        return None
+    granule = struct.unpack_from('<q', data, last_page + 6)[0]
+    # The OpusHead in the first page says how many samples the decoder skips
+    head = data.find(b'OpusHead')
+    pre_skip = struct.unpack_from('<H', data, head + 10)[0] if 0 <= head < len(data) - 12 else 0
+    return max(0.0, (granule - pre_skip) / _OPUS_GRANULE_RATE)
@@ -0,0 +1,261 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Deque, Dict, Hashable, Optional, Set
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    """One update waiting for its turn"""
+
+    __slots__ = ('update', 'turn', 'coalesce_key')
+
+    def __init__(self, update: object, turn: asyncio.Future, coalesce_key: Optional[Hashable]):
+        self.update = update
+        self.turn = turn
+        self.coalesce_key = coalesce_key
+
+
+class _ChatQueue:
+    __slots__ = ('pending', 'running', 'scheduled')
+
+    def __init__(self):
+        self.pending: Deque[_Entry] = deque()
+        self.running = 0
+        # True while the chat sits in the round-robin ready queue
+        self.scheduled = False
+
+
+def chat_key_of(update: object) -> Hashable:
+    """Return the chat (or user) an update belongs to; unknown updates get a key of their own"""
+    if isinstance(update, Update):
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+    return ('update', id(update))
+
+
+def inline_user_of(update: object) -> Optional[int]:
+    """The user typing an inline query, or None for any other update"""
+    if isinstance(update, Update) and update.inline_query is not None:
+        return update.inline_query.from_user.id
+    return None
+
+
+def coalesce_key_of(update: object) -> Optional[Hashable]:
+    """Button presses on the same message supersede each other; nothing else does"""
+    if isinstance(update, Update) and update.callback_query and update.callback_query.message:
+        return ('callback', update.callback_query.message.message_id)
+    return None
+
+
+class ChatScheduler(BaseUpdateProcessor):
+    """Update processor that orders work per chat and shares workers fairly
+
+    Each chat runs at most per_chat_limit updates at a time (one by default,
+    so its updates are handled in arrival order) and queues at most
+    max_pending_per_chat more; updates beyond that are dropped. A button press
+    that is still queued is replaced by a newer press on the same message.
+    Dropped and replaced button presses are still answered, so the client
+    stops showing them as loading.
+    Free slots out of max_concurrent are handed to waiting chats round-robin,
+    so a chat with a long backlog cannot starve the others.
+
+    Inline queries (one per keystroke, mostly waiting out a debounce) run in
+    a lane of their own, at most max_inline at a time, so a fast typist takes
+    no slots from chats. A user's inline query still waiting for that lane is
+    dropped when the user types on; Telegram only shows the newest answer.
+
+    PTB's own semaphore only bounds how many updates are admitted at once
+    (max_admitted); running work is limited by max_concurrent and max_inline.
+    """
+
+    def __init__(self, max_concurrent: int = 16, per_chat_limit: int = 1, max_pending_per_chat: int = 8,
+                 max_inline: int = 4, max_admitted: int = 4096):
+        super().__init__(max_admitted)
+        if max_concurrent < 1 or per_chat_limit < 1 or max_inline < 1:
+            raise ValueError("max_concurrent, per_chat_limit and max_inline must be positive")
+        self.max_concurrent = max_concurrent
+        self.per_chat_limit = per_chat_limit
+        self.max_pending_per_chat = max_pending_per_chat
+        self.max_inline = max_inline
+        self.running = 0
+        self.inline_running = 0
+        self.processed = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self._chats: Dict[Hashable, _ChatQueue] = {}
+        self._ready: Deque[Hashable] = deque()
+        self._answers: Set[asyncio.Task] = set()
+        # Inline queries waiting for the inline lane, oldest first, and the one each user has waiting
+        self._inline_waiting: Deque[asyncio.Future] = deque()
+        self._inline_pending: Dict[int, asyncio.Future] = {}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        # Application.stop() has already waited for queued updates; release any stragglers
+        for chat in self._chats.values():
+            while chat.pending:
+                entry = chat.pending.popleft()
+                if not entry.turn.done():
+                    entry.turn.set_result(False)
+        self._ready.clear()
+        while self._inline_waiting:
+            turn = self._inline_waiting.popleft()
+            if not turn.done():
+                turn.set_result(False)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        user = inline_user_of(update)
+        if user is not None:
+            await self._process_inline(user, coroutine)
+            return
+
+        key = chat_key_of(update)
+        chat = self._chats.get(key)
+        if chat is None:
+            chat = self._chats[key] = _ChatQueue()
+
+        coalesce_key = coalesce_key_of(update)
+        if coalesce_key is not None:
+            self._supersede(chat, coalesce_key)
+        if len(chat.pending) >= self.max_pending_per_chat:
+            self.dropped += 1
+            logger.warning(f"Chat {key} has {len(chat.pending)} updates waiting, dropping a new one")
+            coroutine.close()
+            self._answer_dropped(update)
+            self._forget_if_idle(key, chat)
+            return
+
+        entry = _Entry(update, asyncio.get_running_loop().create_future(), coalesce_key)
+        chat.pending.append(entry)
+        self._schedule(key, chat)
+        self._dispatch()
+
+        try:
+            proceed = await entry.turn
+        except asyncio.CancelledError:
+            if entry in chat.pending:
+                chat.pending.remove(entry)
+            elif entry.turn.done() and not entry.turn.cancelled() and entry.turn.result():
+                self._release(key, chat)
+            self._forget_if_idle(key, chat)
+            coroutine.close()
+            raise
+        if not proceed:
+            coroutine.close()
+            return
+
+        try:
+            await coroutine
+        finally:
+            self.processed += 1
+            self._release(key, chat)
+
+    async def _process_inline(self, user: int, coroutine: Awaitable[Any]) -> None:
+        if self.inline_running < self.max_inline:
+            self.inline_running += 1
+        else:
+            previous = self._inline_pending.get(user)
+            if previous is not None and not previous.done():
+                previous.set_result(False)
+                self.coalesced += 1
+            turn = self._inline_pending[user] = asyncio.get_running_loop().create_future()
+            self._inline_waiting.append(turn)
+            try:
+                proceed = await turn
+            except asyncio.CancelledError:
+                if turn.done() and not turn.cancelled() and turn.result():
+                    self._release_inline()
+                coroutine.close()
+                raise
+            finally:
+                if self._inline_pending.get(user) is turn:
+                    del self._inline_pending[user]
+            if not proceed:
+                coroutine.close()
+                return
+
+        try:
+            await coroutine
+        finally:
+            self.processed += 1
+            self._release_inline()
+
+    def _release_inline(self) -> None:
+        """Hand the inline slot to the oldest query still waiting, or free it"""
+        while self._inline_waiting:
+            turn = self._inline_waiting.popleft()
+            if not turn.done():
+                turn.set_result(True)
+                return
+        self.inline_running -= 1
+
+    def _supersede(self, chat: _ChatQueue, coalesce_key: Hashable) -> None:
+        for entry in [entry for entry in chat.pending if entry.coalesce_key == coalesce_key]:
+            chat.pending.remove(entry)
+            entry.turn.set_result(False)
+            self._answer_dropped(entry.update)
+            self.coalesced += 1
+
+    def _answer_dropped(self, update: object) -> None:
+        """Answer a button press that will not be handled, without waiting for Telegram"""
+        if not isinstance(update, Update) or update.callback_query is None:
+            return
+        task = asyncio.ensure_future(update.callback_query.answer())
+        self._answers.add(task)
+        task.add_done_callback(self._answered)
+
+    def _answered(self, task: asyncio.Task) -> None:
+        self._answers.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Could not answer a dropped button press: {task.exception()}")
+
+    def _schedule(self, key: Hashable, chat: _ChatQueue) -> None:
+        if chat.pending and not chat.scheduled and chat.running < self.per_chat_limit:
+            chat.scheduled = True
+            self._ready.append(key)
+
+    def _dispatch(self) -> None:
+        """Hand free slots to ready chats, one update per chat per round"""
+        while self.running < self.max_concurrent and self._ready:
+            key = self._ready.popleft()
+            chat = self._chats[key]
+            chat.scheduled = False
+            if not chat.pending:
+                self._forget_if_idle(key, chat)
+                continue
+            entry = chat.pending.popleft()
+            chat.running += 1
+            self.running += 1
+            entry.turn.set_result(True)
+            self._schedule(key, chat)
+
+    def _release(self, key: Hashable, chat: _ChatQueue) -> None:
+        chat.running -= 1
+        self.running -= 1
+        self._schedule(key, chat)
+        self._forget_if_idle(key, chat)
+        self._dispatch()
+
+    def _forget_if_idle(self, key: Hashable, chat: _ChatQueue) -> None:
+        if not chat.pending and not chat.running and not chat.scheduled:
+            self._chats.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'running': self.running,
+            'inline_running': self.inline_running,
+            'waiting': sum(len(chat.pending) for chat in self._chats.values()),
+            'active_chats': len(self._chats),
+            'processed': self.processed,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped
+        }
@@ -0,0 +1,322 @@
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+try:
+    from zoneinfo import ZoneInfo
+    # YouTube Data API quotas reset at midnight Pacific time
+    QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')
+except Exception:
+    QUOTA_TIMEZONE = timezone.utc
+
+# Where spent quota units are kept across restarts, one file per provider and worker
+DEFAULT_QUOTA_STATE_DIR = os.path.join(tempfile.gettempdir(), 'persian-bot-quota')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class ProviderUnavailable(Exception):
+    """Raised instead of calling a provider whose circuit is open or budget is spent"""
+
+    def __init__(self, provider: str, reason: str):
+        super().__init__(f"{provider} unavailable: {reason}")
+        self.provider = provider
+        self.reason = reason
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """Whether an error says the provider is unhealthy rather than the request being bad
+
+    Transport errors, 5xx and rate limiting count. Refused requests do not:
+    other 4xx answers, Gemini's InvalidArgument, prompts blocked by its
+    safety filters, and the ValueError the SDK raises when asked for the
+    text of a blocked or non-text answer.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status >= 500 or status in (403, 429)
+    if isinstance(error, ValueError):
+        return False
+    module = type(error).__module__
+    if module.startswith('google.api_core'):
+        # GoogleAPICallError carries the HTTP status (ResourceExhausted is 429);
+        # RetryError, raised when retries ran out of time, has none
+        status = getattr(error, 'code', None)
+        return not isinstance(status, int) or status >= 500 or status == 429
+    if module.startswith('google.generativeai'):
+        # BlockedPromptException, StopCandidateException: the answer, not the service
+        return False
+    return True
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker for one upstream
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    fail fast for reset_timeout seconds. Then up to half_open_calls probe
+    calls are let through: a success closes the circuit, a failure opens it
+    again. A probe that ends without an outcome (cancelled) is released; one
+    that never reports back is given up on after another reset_timeout.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.probing_since = 0.0
+        self.times_opened = 0
+
+    def allow(self) -> bool:
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = HALF_OPEN
+            self.probes = 0
+        if self.state == HALF_OPEN:
+            if self.probes >= self.half_open_calls:
+                if time.monotonic() - self.probing_since < self.reset_timeout:
+                    return False
+                # The probes never reported back; let new ones through
+                self.probes = 0
+            if self.probes == 0:
+                self.probing_since = time.monotonic()
+            self.probes += 1
+        return True
+
+    def release(self) -> None:
+        """Give back a probe whose call ended without success or failure, e.g. cancelled"""
+        if self.state == HALF_OPEN and self.probes > 0:
+            self.probes -= 1
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.times_opened += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+
+class QuotaBudget:
+    """Daily unit budget, e.g. YouTube Data API quota units
+
+    With state_path, the units spent today are written there at most every
+    save_interval seconds (and when the quota is exhausted or on save()), and
+    read back on start, so a restart does not hand out the day's quota again.
+    Units spent since the last write are lost if the process dies.
+    """
+
+    def __init__(self, daily_units: float, tz=QUOTA_TIMEZONE, state_path: Optional[str] = None,
+                 save_interval: float = 10.0):
+        self.daily_units = daily_units
+        self.tz = tz
+        self.state_path = state_path
+        self.save_interval = save_interval
+        self.used = 0.0
+        self._resets_at = self._next_reset()
+        self._saved_at = time.monotonic()
+        self._saved_used = 0.0
+        self._load()
+
+    def _load(self) -> None:
+        if not self.state_path:
+            return
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+            if state['resets_at'] == self._resets_at.isoformat():
+                self.used = self._saved_used = float(state['used'])
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable quota state {self.state_path}: {e}")
+
+    def save(self) -> None:
+        """Write the units spent today to state_path, if there is one and they changed"""
+        self._saved_at = time.monotonic()
+        if not self.state_path or self.used == self._saved_used:
+            return
+        temp_path = f"{self.state_path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'resets_at': self._resets_at.isoformat(), 'used': self.used}, f)
+            os.replace(temp_path, self.state_path)
+            self._saved_used = self.used
+        except OSError as e:
+            logger.warning(f"Could not save quota state to {self.state_path}: {e}")
+
+    def _next_reset(self) -> datetime:
+        now = datetime.now(self.tz)
+        return (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def _roll_over(self) -> None:
+        if datetime.now(self.tz) >= self._resets_at:
+            self.used = 0.0
+            self._resets_at = self._next_reset()
+
+    @property
+    def remaining(self) -> float:
+        self._roll_over()
+        return max(0.0, self.daily_units - self.used)
+
+    def can_spend(self, units: float) -> bool:
+        return self.remaining >= units
+
+    def spend(self, units: float) -> None:
+        self._roll_over()
+        self.used += units
+        if time.monotonic() - self._saved_at >= self.save_interval:
+            self.save()
+
+    def exhaust(self) -> None:
+        """The provider reported its quota as spent; stop until the next reset"""
+        self.used = max(self.used, self.daily_units)
+        self.save()
+
+
+class ProviderGuard:
+    """Circuit breaker plus optional quota budget in front of one provider"""
+
+    def __init__(self, name: str, breaker: Optional[CircuitBreaker] = None,
+                 budget: Optional[QuotaBudget] = None, cost: float = 1):
+        self.name = name
+        self.breaker = breaker or CircuitBreaker()
+        self.budget = budget
+        self.cost = cost
+        self.calls = 0
+        self.rejected = 0
+        self._latency = metrics.histogram('upstream_seconds', provider=name)
+
+    @property
+    def available(self) -> bool:
+        """Whether a call would be attempted now (without reserving a probe)"""
+        if self.budget is not None and not self.budget.can_spend(self.cost):
+            return False
+        if self.breaker.state == OPEN:
+            return time.monotonic() - self.breaker.opened_at >= self.breaker.reset_timeout
+        return True
+
+    def acquire(self, units: Optional[float] = None) -> None:
+        """Reserve a call, raising ProviderUnavailable to fail fast"""
+        units = self.cost if units is None else units
+        if self.budget is not None and not self.budget.can_spend(units):
+            self.rejected += 1
+            raise ProviderUnavailable(self.name, 'daily quota spent')
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise ProviderUnavailable(self.name, 'circuit open')
+        if self.budget is not None:
+            # Providers such as YouTube charge for failed requests too
+            self.budget.spend(units)
+        self.calls += 1
+
+    def record(self, error: Optional[BaseException] = None, duration: Optional[float] = None) -> None:
+        if duration is not None:
+            self._latency.observe(duration)
+        if error is None:
+            self.breaker.record_success()
+            return
+        if isinstance(error, httpx.HTTPStatusError) and error.response.status_code in (403, 429) \
+                and self.budget is not None:
+            logger.warning(f"{self.name} reported its quota as exceeded")
+            self.budget.exhaust()
+        metrics.inc('upstream_errors_total', provider=self.name)
+        if is_upstream_failure(error):
+            previous = self.breaker.state
+            self.breaker.record_failure()
+            if self.breaker.state == OPEN and previous != OPEN:
+                logger.warning(f"{self.name} circuit opened after {self.breaker.failures} failures: {error}")
+        else:
+            self.breaker.record_success()
+
+    def release(self) -> None:
+        """The reserved call ended without an outcome (cancelled or closed early)"""
+        self.breaker.release()
+
+    async def call(self, func: Callable[[], Awaitable[Any]], units: Optional[float] = None) -> Any:
+        self.acquire(units)
+        started = time.perf_counter()
+        try:
+            result = await func()
+        except Exception as e:
+            self.record(e, time.perf_counter() - started)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.record(duration=time.perf_counter() - started)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            'state': self.breaker.state,
+            'open': int(self.breaker.state == OPEN),
+            'failures': self.breaker.failures,
+            'times_opened': self.breaker.times_opened,
+            'calls': self.calls,
+            'rejected': self.rejected
+        }
+        if self.budget is not None:
+            stats['budget_remaining'] = self.budget.remaining
+            stats['budget_daily'] = self.budget.daily_units
+        return stats
+
+
+class ProviderGuards:
+    """Registry of per-provider guards; unknown providers get a default breaker"""
+
+    def __init__(self):
+        self._guards: Dict[str, ProviderGuard] = {}
+
+    def configure(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                  daily_units: Optional[float] = None, cost: float = 1,
+                  state_path: Optional[str] = None) -> ProviderGuard:
+        budget = QuotaBudget(daily_units, state_path=state_path) if daily_units else None
+        guard = ProviderGuard(name, CircuitBreaker(failure_threshold, reset_timeout), budget, cost)
+        self._guards[name] = guard
+        return guard
+
+    def get(self, name: str) -> ProviderGuard:
+        guard = self._guards.get(name)
+        if guard is None:
+            guard = self._guards[name] = ProviderGuard(name)
+        return guard
+
+    def available(self, name: str) -> bool:
+        return self.get(name).available
+
+    async def call(self, name: str, func: Callable[[], Awaitable[Any]], units: Optional[float] = None) -> Any:
+        return await self.get(name).call(func, units)
+
+    def save(self) -> None:
+        """Write every quota budget's spent units to its state file"""
+        for guard in self._guards.values():
+            if guard.budget is not None:
+                guard.budget.save()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: guard.stats() for name, guard in self._guards.items()}
+
+
+# Shared by the services and the bot; main.py configures budgets from the environment
+provider_guards = ProviderGuards()
@@ -0,0 +1,273 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (previous_summary, transcript) -> new summary
+Summarizer = Callable[[str, str], Awaitable[str]]
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate; Persian averages roughly three characters per token"""
+    return len(text) // 3 + 1
+
+
+class ChatHistory:
+    """Compact per-chat state: a running summary plus the most recent turns"""
+
+    __slots__ = ('summary', 'turns', 'tokens', 'pending', 'summarizing', 'dirty')
+
+    def __init__(self, summary: str = '', turns: Optional[List[Tuple[bool, str]]] = None):
+        self.summary = summary
+        # (is_user, text) pairs, oldest first
+        self.turns: Deque[Tuple[bool, str]] = deque(turns or [])
+        self.tokens = sum(estimate_tokens(text) for _, text in self.turns)
+        self.pending: List[Tuple[bool, str]] = []
+        self.summarizing = False
+        # Changed since it was last written to the database
+        self.dirty = False
+
+    def to_json(self) -> str:
+        return json.dumps({'summary': self.summary, 'turns': list(self.turns)}, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, data: str) -> 'ChatHistory':
+        raw = json.loads(data)
+        return cls(raw.get('summary', ''), [(bool(is_user), text) for is_user, text in raw.get('turns', [])])
+
+
+class ConversationStore:
+    """Per-chat conversation memory with a token-budgeted sliding window
+
+    Recent turns are kept verbatim up to history_tokens. Older turns are
+    folded into a running summary of at most summary_tokens, produced by the
+    summarizer in the background (or by truncation when none is set). Only
+    max_chats histories stay in memory; with a database path, evicted chats
+    are written to SQLite and reloaded on their next message, and changed
+    histories are written every flush_interval seconds, so a crash loses
+    at most that much. Database reads and writes run in a worker thread;
+    the file may be shared by several bot processes and runs in WAL mode.
+    """
+
+    def __init__(self, history_tokens: int = 1200, summary_tokens: int = 300, max_chats: int = 10000,
+                 db_path: Optional[str] = None, summarizer: Optional[Summarizer] = None,
+                 flush_interval: float = 30.0):
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.max_chats = max_chats
+        self.summarizer = summarizer
+        self.flush_interval = flush_interval
+        self._chats: "OrderedDict[int, ChatHistory]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+        self._flusher: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        self._conn = None
+        self.flushed = 0
+        self.errors = 0
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "chat_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def _write(self, rows: List[Tuple[int, str, float]]) -> None:
+        """Store (chat_id, data, updated_at) rows; called from a worker thread (or at shutdown)"""
+        if self._conn is None or not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO conversations (chat_id, data, updated_at) VALUES (?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def _load(self, chat_id: int) -> Optional[ChatHistory]:
+        if self._conn is None:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM conversations WHERE chat_id = ?", (chat_id,)).fetchone()
+        return ChatHistory.from_json(row[0]) if row else None
+
+    @staticmethod
+    def _rows(histories: List[Tuple[int, ChatHistory]]) -> List[Tuple[int, str, float]]:
+        # Serialized on the event loop, which is the only place histories change
+        now = time.time()
+        rows = []
+        for chat_id, history in histories:
+            rows.append((chat_id, history.to_json(), now))
+            history.dirty = False
+        return rows
+
+    async def _store(self, histories: List[Tuple[int, ChatHistory]]) -> None:
+        rows = self._rows(histories)
+        try:
+            await asyncio.to_thread(self._write, rows)
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Could not save {len(rows)} conversations: {e}")
+            for _, history in histories:
+                history.dirty = True
+
+    async def _get(self, chat_id: int) -> ChatHistory:
+        history = self._chats.get(chat_id)
+        if history is not None:
+            self._chats.move_to_end(chat_id)
+            return history
+
+        loaded = None
+        if self._conn is not None:
+            self._start_flusher()
+            try:
+                loaded = await asyncio.to_thread(self._load, chat_id)
+            except (sqlite3.Error, ValueError) as e:
+                self.errors += 1
+                logger.warning(f"Could not load conversation {chat_id}, starting afresh: {e}")
+            # Another message of this chat may have loaded it meanwhile
+            history = self._chats.get(chat_id)
+            if history is not None:
+                self._chats.move_to_end(chat_id)
+                return history
+
+        history = loaded or ChatHistory()
+        self._chats[chat_id] = history
+        evicted = []
+        while len(self._chats) > self.max_chats:
+            evicted_id, evicted_history = self._chats.popitem(last=False)
+            if evicted_history.dirty:
+                evicted.append((evicted_id, evicted_history))
+        if evicted and self._conn is not None:
+            await self._store(evicted)
+        return history
+
+    def _start_flusher(self) -> None:
+        if self._flusher is None and self.flush_interval > 0:
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_periodically())
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write every changed in-memory history to the database"""
+        dirty = [(chat_id, history) for chat_id, history in self._chats.items() if history.dirty]
+        if dirty and self._conn is not None:
+            await self._store(dirty)
+            self.flushed += len(dirty)
+
+    async def render_context(self, chat_id: int, user_label: str, bot_label: str) -> str:
+        """Return the summary and recent turns as prompt text"""
+        history = await self._get(chat_id)
+        lines = []
+        if history.summary:
+            lines.append(f"خلاصه گفتگوهای قبلی: {history.summary}")
+        for is_user, text in history.turns:
+            lines.append(f"{user_label if is_user else bot_label}: {text}")
+        return '\n'.join(lines)
+
+    async def add_exchange(self, chat_id: int, user_text: str, bot_text: str) -> None:
+        """Record one question/answer pair and keep the window within budget"""
+        history = await self._get(chat_id)
+        history.dirty = True
+        for turn in ((True, user_text), (False, bot_text)):
+            history.turns.append(turn)
+            history.tokens += estimate_tokens(turn[1])
+
+        # Always keep the latest exchange verbatim
+        while history.tokens > self.history_tokens and len(history.turns) > 2:
+            is_user, text = history.turns.popleft()
+            history.tokens -= estimate_tokens(text)
+            history.pending.append((is_user, text))
+
+        if history.pending and not history.summarizing:
+            self._schedule_summary(chat_id, history)
+
+    def _schedule_summary(self, chat_id: int, history: ChatHistory) -> None:
+        history.summarizing = True
+        try:
+            task = asyncio.get_running_loop().create_task(self._summarize(chat_id, history))
+        except RuntimeError:
+            # No event loop (e.g. offline use): fold synchronously
+            self._fold_without_summarizer(history)
+            history.summarizing = False
+            return
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _clip_summary(self, summary: str) -> str:
+        max_chars = self.summary_tokens * 3
+        return summary if len(summary) <= max_chars else summary[-max_chars:]
+
+    def _fold_without_summarizer(self, history: ChatHistory) -> None:
+        """Fallback summary: keep the beginning of each folded turn"""
+        folded = ' | '.join(text[:80] for _, text in history.pending)
+        history.pending = []
+        history.summary = self._clip_summary(f"{history.summary} | {folded}" if history.summary else folded)
+        history.dirty = True
+
+    async def _summarize(self, chat_id: int, history: ChatHistory) -> None:
+        try:
+            while history.pending:
+                if self.summarizer is None:
+                    self._fold_without_summarizer(history)
+                    break
+                folded, history.pending = history.pending, []
+                transcript = '\n'.join(f"{'U' if is_user else 'A'}: {text}" for is_user, text in folded)
+                try:
+                    summary = await self.summarizer(history.summary, transcript)
+                    history.summary = self._clip_summary(summary.strip())
+                    history.dirty = True
+                except Exception as e:
+                    logger.warning(f"Conversation summary failed for chat {chat_id}: {e}")
+                    history.pending = folded + history.pending
+                    self._fold_without_summarizer(history)
+        finally:
+            history.summarizing = False
+
+    def _delete(self, chat_id: int) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM conversations WHERE chat_id = ?", (chat_id,))
+            self._conn.commit()
+
+    async def clear(self, chat_id: int) -> None:
+        """Forget a chat's history"""
+        self._chats.pop(chat_id, None)
+        if self._conn is not None:
+            try:
+                await asyncio.to_thread(self._delete, chat_id)
+            except sqlite3.Error as e:
+                self.errors += 1
+                logger.warning(f"Could not delete conversation {chat_id}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            'chats_in_memory': len(self._chats),
+            'summaries_running': len(self._tasks),
+            'flushed': self.flushed,
+            'errors': self.errors
+        }
+
+    def close(self) -> None:
+        """Persist every changed in-memory chat and close the database"""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        if self._conn is not None:
+            dirty = [(chat_id, history) for chat_id, history in self._chats.items() if history.dirty]
+            try:
+                self._write(self._rows(dirty))
+            except sqlite3.Error as e:
+                logger.error(f"Could not save {len(dirty)} conversations on shutdown: {e}")
+            with self._lock:
+                self._conn.close()
+            self._conn = None
@@ -0,0 +1,168 @@
+import random
+import re
+from typing import Dict, Hashable, List, Optional, Set
+
+from utils.normalization import normalize_text
+
+# Words that label an upload rather than name the work (kept: remix, live, ...)
+NOISE_WORDS = frozenset(normalize_text(word) for word in (
+    'official', 'video', 'music', 'audio', 'lyrics', 'lyric', 'hd', '4k', 'hq', 'clip', 'new', 'full',
+    'موزیک', 'ویدیو', 'ویدئو', 'آهنگ', 'جدید', 'رسمی', 'کلیپ', 'متن', 'با', 'از',
+))
+
+_PUNCTUATION = re.compile(r'[^\w\s]+')
+# "Artist - Title" as YouTube uploads usually name songs
+_ARTIST_SEPARATOR = re.compile(r'\s+[-–—|]\s+')
+_YEAR = re.compile(r'\d{4}')
+
+# MinHash over character trigrams: 8 bands of 2 rows put pairs with trigram
+# Jaccard similarity above ~0.35 in a shared bucket with high probability.
+# Each hash function is the string hash XORed with a random mask, which is
+# much cheaper in Python than (a * h + b) mod p and good enough for bucketing.
+_BANDS = 8
+_ROWS = 2
+_rng = random.Random(20240101)
+_MASKS = [_rng.getrandbits(64) for _ in range(_BANDS * _ROWS)]
+
+# Fields that identify the same item across passes of one provider
+_ID_FIELDS = ('tmdb_id', 'imdb_id', 'url')
+
+
+def _words(text: str) -> List[str]:
+    return [word for word in _PUNCTUATION.sub(' ', normalize_text(text)).split() if word not in NOISE_WORDS]
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f' {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def dice(a: Set[str], b: Set[str]) -> float:
+    """Dice coefficient of two trigram sets"""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def _overlap(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+class _Record:
+    """What merge_results compares about one result"""
+
+    __slots__ = ('index', 'result', 'titles', 'numbers', 'artist', 'year', 'keys')
+
+    def __init__(self, index: int, result: Dict):
+        self.index = index
+        self.result = result
+        title = str(result.get('title') or '')
+        artist_words = _words(str(result.get('artist') or ''))
+
+        parts = _ARTIST_SEPARATOR.split(title, maxsplit=1)
+        if len(parts) == 2:
+            # The side that shares more with the artist field names the artist
+            left, right = _words(parts[0]), _words(parts[1])
+            if artist_words and len(set(right) & set(artist_words)) > len(set(left) & set(artist_words)):
+                left, right = right, left
+            artist_words = artist_words + left
+            title_words = right
+        else:
+            title_words = _words(title)
+        # Channel or artist names repeated inside the title say nothing about the song
+        title_words = [word for word in title_words if word not in artist_words] or title_words
+
+        self.titles = [_trigrams(' '.join(title_words))]
+        # "Part 1" and "Part 2" are close in trigrams but never the same item
+        self.numbers = {word for word in title_words if word.isdigit()}
+        original_title = result.get('original_title')
+        if original_title and normalize_text(original_title) != normalize_text(title):
+            self.titles.append(_trigrams(' '.join(_words(original_title))))
+        self.artist = _trigrams(' '.join(artist_words)) if artist_words else set()
+
+        year = _YEAR.search(str(result.get('year') or result.get('release_date') or ''))
+        self.year = year.group() if year else None
+        self.keys: List[Hashable] = [(field, result[field]) for field in _ID_FIELDS if result.get(field)]
+        self.keys.extend(_bands(set().union(*self.titles)))
+
+
+def _bands(grams: Set[str]) -> List[Hashable]:
+    if not grams:
+        return []
+    hashes = [hash(gram) for gram in grams]
+    signature = [min([h ^ mask for h in hashes]) for mask in _MASKS]
+    return [('band', band, tuple(signature[band * _ROWS:(band + 1) * _ROWS])) for band in range(_BANDS)]
+
+
+def _same_item(a: _Record, b: _Record, threshold: float) -> bool:
+    if a.year and b.year and a.year != b.year:
+        return False
+    if a.numbers != b.numbers and a.numbers and b.numbers:
+        return False
+    if a.artist and b.artist and _overlap(a.artist, b.artist) < 0.5:
+        return False
+    return max(dice(x, y) for x in a.titles for y in b.titles) >= threshold
+
+
+def merge_results(results: List[Dict], threshold: float = 0.6, max_bucket: int = 50) -> List[Dict]:
+    """Merge near-duplicate results across providers and rank them
+
+    Results are compared on their normalized title (without upload labels
+    such as "Official Video" or the artist name repeated in it), their artist
+    and their year. Results sharing an id are always merged. Only pairs that
+    share a MinHash bucket are compared, so a batch costs linear time rather
+    than comparing every pair; buckets larger than max_bucket are skipped as
+    uninformative.
+
+    Each merged result is the first of its group, with missing fields filled
+    from the others and 'sources' listing every provider that returned it.
+    Results found by more providers rank first; ties keep provider order.
+    """
+    records = [_Record(index, result) for index, result in enumerate(results)]
+    parent = list(range(len(records)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    buckets: Dict[Hashable, List[int]] = {}
+    for record in records:
+        for key in record.keys:
+            buckets.setdefault(key, []).append(record.index)
+
+    for key, members in buckets.items():
+        if len(members) < 2 or len(members) > max_bucket:
+            continue
+        by_id = key[0] != 'band'
+        for position, i in enumerate(members):
+            for j in members[position + 1:]:
+                root_i, root_j = find(i), find(j)
+                if root_i == root_j:
+                    continue
+                if by_id or _same_item(records[i], records[j], threshold):
+                    parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    groups: Dict[int, List[Dict]] = {}
+    for record in records:
+        groups.setdefault(find(record.index), []).append(record.result)
+
+    merged = []
+    for root, members in groups.items():
+        result = dict(members[0])
+        for other in members[1:]:
+            for field, value in other.items():
+                if result.get(field) in (None, '') and value not in (None, ''):
+                    result[field] = value
+        sources: List[Optional[str]] = []
+        for member in members:
+            for source in member.get('sources') or [member.get('source')]:
+                if source and source not in sources:
+                    sources.append(source)
+        result['sources'] = sources
+        merged.append((-len(sources), root, result))
+    merged.sort(key=lambda item: item[:2])
+    return [result for _, _, result in merged]
@@ -0,0 +1,40 @@
+import asyncio
+import logging
+from typing import Awaitable, Dict, List, Optional, Tuple
+
+from utils.circuit_breaker import ProviderUnavailable
+
+logger = logging.getLogger(__name__)
+
+
+async def gather_with_deadline(calls: Dict[str, Awaitable[List[Dict]]],
+                               deadline: Optional[float]) -> Tuple[Dict[str, List[Dict]], List[str]]:
+    """Run provider calls concurrently and collect whatever finished before the deadline
+
+    Returns a mapping of provider name to results (in the order the calls were
+    given) and the list of providers that timed out or failed.
+    """
+    tasks = {name: asyncio.ensure_future(call) for name, call in calls.items()}
+    if not tasks:
+        return {}, []
+
+    done, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+    for task in pending:
+        task.cancel()
+
+    results: Dict[str, List[Dict]] = {}
+    missing: List[str] = []
+    for name, task in tasks.items():
+        if task not in done:
+            logger.warning(f"{name} search missed the {deadline}s deadline")
+            missing.append(name)
+        elif isinstance(task.exception(), ProviderUnavailable):
+            logger.warning(f"Skipping {name} search: {task.exception()}")
+            missing.append(name)
+        elif task.exception() is not None:
+            logger.error(f"{name} search failed: {task.exception()}")
+            missing.append(name)
+        else:
+            results[name] = task.result()
+
+    return results, missing
@@ -0,0 +1,124 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FILE_ID_DB = os.path.join(tempfile.gettempdir(), 'persian-bot-file-ids.sqlite3')
+
+
+class FileIdStore:
+    """Persistent mapping from audio content hash to Telegram file_id
+
+    Once a clip has been uploaded, later sends of identical bytes can
+    reference the file_id instead of uploading the audio again.
+
+    Lookups run on the event loop, so they only read: the last_used times
+    they update are kept in memory and written with the next stored
+    file_id, every flush_every lookups, or on close. The database may be
+    shared by several bot processes and runs in WAL mode. A database error
+    is logged and treated as a miss, so the caller uploads the audio.
+    """
+
+    def __init__(self, path: str = DEFAULT_FILE_ID_DB, max_entries: int = 50000, flush_every: int = 100):
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # A lost last_used update costs nothing, so commits need not wait for the disk
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_ids ("
+            "content_hash TEXT PRIMARY KEY, file_id TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._writes = 0
+        self._touched: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @staticmethod
+    def content_hash(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def _write_touched(self) -> None:
+        """Write the pending last_used times; the caller holds the lock and commits"""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE file_ids SET last_used = ? WHERE content_hash = ?",
+                [(last_used, content_hash) for content_hash, last_used in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def get(self, content_hash: str) -> Optional[str]:
+        """Return the stored file_id for this content, if any"""
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT file_id FROM file_ids WHERE content_hash = ?", (content_hash,)
+                ).fetchone()
+                if row is not None:
+                    self._touched[content_hash] = time.time()
+                    if len(self._touched) >= self.flush_every:
+                        self._write_touched()
+                        self._conn.commit()
+            except sqlite3.Error as e:
+                self.errors += 1
+                logger.warning(f"File id lookup failed, uploading instead: {e}")
+                return None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def set(self, content_hash: str, file_id: str) -> None:
+        """Remember the file_id Telegram assigned to this content"""
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO file_ids (content_hash, file_id, last_used) VALUES (?, ?, ?)",
+                    (content_hash, file_id, time.time())
+                )
+                self._touched.pop(content_hash, None)
+                self._write_touched()
+                self._writes += 1
+                if self._writes % 500 == 0:
+                    # Keep the table bounded; unique AI replies are rarely resent
+                    self._conn.execute(
+                        "DELETE FROM file_ids WHERE content_hash NOT IN "
+                        "(SELECT content_hash FROM file_ids ORDER BY last_used DESC LIMIT ?)",
+                        (self.max_entries,)
+                    )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                self.errors += 1
+                logger.warning(f"Could not store file id: {e}")
+
+    def forget(self, content_hash: str) -> None:
+        """Drop a file_id that Telegram no longer accepts"""
+        with self._lock:
+            self._touched.pop(content_hash, None)
+            try:
+                self._conn.execute("DELETE FROM file_ids WHERE content_hash = ?", (content_hash,))
+                self._conn.commit()
+            except sqlite3.Error as e:
+                self.errors += 1
+                logger.warning(f"Could not forget file id: {e}")
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._write_touched()
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not save file id usage times: {e}")
+            self._conn.close()
@@ -0,0 +1,78 @@
+import logging
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class HttpClientPool:
+    """Shared async HTTP clients, one pooled keep-alive client per upstream host
+
+    Awaiting a slow upstream frees the event loop, but other chats are only
+    served meanwhile when the Application processes updates concurrently
+    (build_application sets this up with a ChatScheduler); PTB's default
+    handles one update at a time.
+    """
+
+    def __init__(self, max_connections: int = 20, max_keepalive_connections: int = 10,
+                 keepalive_expiry: float = 30.0, timeout: float = 10.0):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = timeout
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    @staticmethod
+    def _host_key(url: str) -> str:
+        """Return scheme://host[:port] for a URL"""
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def get_client(self, url: str) -> httpx.AsyncClient:
+        """Return the shared client for the host of the given URL"""
+        key = self._host_key(url)
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                limits=self.limits,
+                timeout=httpx.Timeout(self.timeout)
+            )
+            self._clients[key] = client
+            logger.debug(f"Opened HTTP client for {key} (http2={HTTP2_AVAILABLE})")
+        return client
+
+    async def get(self, url: str, params: Optional[Dict] = None, headers: Optional[Dict] = None,
+                  timeout: Optional[float] = None) -> httpx.Response:
+        """Send a GET request through the pooled client for the URL's host"""
+        client = self.get_client(url)
+        return await client.get(
+            url,
+            params=params,
+            headers=headers,
+            timeout=timeout if timeout is not None else self.timeout
+        )
+
+    async def aclose(self) -> None:
+        """Close every pooled client"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Error closing HTTP client: {e}")
+
+
+# Process-wide pool shared by all services
+http_pool = HttpClientPool()
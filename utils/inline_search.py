@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from utils.normalization import normalize_text
+from utils.search_index import SearchIndex
+
+logger = logging.getLogger(__name__)
+
+
+class InlineSearch:
+    """Suggestions for inline queries (@bot ...) as the user types
+
+    Each keystroke is answered, in order of preference, from a short-lived
+    cache of earlier answers, from the local search index (the last word may
+    be partly typed), or upstream. Upstream is only asked once the user has
+    stopped typing for `debounce` seconds: a keystroke superseded by a newer
+    one from the same user in that time gets None at once and should not be
+    answered, so fast typing costs one upstream search instead of one per
+    character.
+    """
+
+    def __init__(self, search: Callable[[str, str], Awaitable[List[Dict]]], index: Optional[SearchIndex] = None,
+                 debounce: float = 0.3, ttl: float = 300.0, max_entries: int = 5000, min_chars: int = 2,
+                 min_local: int = 3, limit: int = 10):
+        self.search = search
+        self.index = index
+        self.debounce = debounce
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.min_chars = min_chars
+        self.min_local = min_local
+        self.limit = limit
+        self._answers: "OrderedDict[Tuple[str, str], Tuple[float, List[Dict]]]" = OrderedDict()
+        # Newest keystroke per (user, kind); setting its event wakes it to give up
+        self._latest: Dict[Hashable, asyncio.Event] = {}
+        self.requests = 0
+        self.cache_hits = 0
+        self.local_hits = 0
+        self.upstream = 0
+        self.superseded = 0
+
+    def _cached(self, key: Tuple[str, str]) -> Optional[List[Dict]]:
+        entry = self._answers.get(key)
+        if entry is None:
+            return None
+        stored_at, results = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._answers[key]
+            return None
+        self._answers.move_to_end(key)
+        return results
+
+    def _store(self, key: Tuple[str, str], results: List[Dict]) -> List[Dict]:
+        self._answers[key] = (time.monotonic(), results)
+        self._answers.move_to_end(key)
+        while len(self._answers) > self.max_entries:
+            self._answers.popitem(last=False)
+        return results
+
+    async def suggest(self, user_id: Hashable, kind: str, text: str) -> Optional[List[Dict]]:
+        """Results for text typed so far, or None when a newer keystroke superseded it"""
+        self.requests += 1
+        normalized = ' '.join(normalize_text(text).split())
+        if len(normalized) < self.min_chars:
+            return []
+        key = (kind, normalized)
+        results = self._cached(key)
+        if results is not None:
+            self.cache_hits += 1
+            return results
+
+        local = await self.index.complete_async(kind, normalized, self.limit) if self.index is not None else []
+        if len(local) >= self.min_local:
+            self.local_hits += 1
+            return self._store(key, local)
+
+        latest_key = (user_id, kind)
+        previous = self._latest.get(latest_key)
+        if previous is not None:
+            previous.set()
+        superseded = self._latest[latest_key] = asyncio.Event()
+        try:
+            try:
+                await asyncio.wait_for(superseded.wait(), self.debounce)
+            except asyncio.TimeoutError:
+                pass
+            if superseded.is_set():
+                self.superseded += 1
+                return None
+            # Another user may have typed the same words meanwhile
+            results = self._cached(key)
+            if results is not None:
+                self.cache_hits += 1
+                return results
+            self.upstream += 1
+            results = (await self.search(kind, text))[:self.limit] or local
+        finally:
+            if self._latest.get(latest_key) is superseded:
+                del self._latest[latest_key]
+        return self._store(key, results)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'requests': self.requests,
+            'cache_hits': self.cache_hits,
+            'local_hits': self.local_hits,
+            'upstream': self.upstream,
+            'superseded': self.superseded,
+            'cached_answers': len(self._answers)
+        }
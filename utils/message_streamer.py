@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from utils.speech_chunks import split_caption, split_message, utf16_length
+
+logger = logging.getLogger(__name__)
+
+# Telegram rejects text messages and media captions longer than these (in UTF-16 code units)
+MAX_MESSAGE_LENGTH = 4096
+MAX_CAPTION_LENGTH = 1024
+
+
+class ProgressiveMessage:
+    """A Telegram message that is edited in place as text is generated
+
+    Edits are rate limited to one per min_interval seconds; intermediate
+    updates arriving faster than that are folded into the next edit. If no
+    message exists yet, the first edit replies to reply_to instead.
+    """
+
+    def __init__(self, reply_to: Message, message: Optional[Message] = None, min_interval: float = 1.0,
+                 cursor: str = ' ▌'):
+        self.reply_to = reply_to
+        self.message = message
+        self.min_interval = min_interval
+        self.cursor = cursor
+        self.edits = 0
+        self._shown = message.text if message is not None else None
+        self._next_edit_at = 0.0
+
+    async def update(self, text: str) -> None:
+        """Show partial text if the rate limit allows an edit now
+
+        Never raises: a failed intermediate edit (e.g. a network timeout) is
+        caught up by the next one, so generation is not interrupted. Only
+        finish() lets errors through.
+        """
+        if time.monotonic() < self._next_edit_at:
+            return
+        try:
+            shown, _ = split_caption(text, MAX_MESSAGE_LENGTH - utf16_length(self.cursor))
+            await self._show(shown + self.cursor)
+        except TelegramError as e:
+            logger.warning(f"Progressive message edit failed, retrying with the next update: {e}")
+            self._next_edit_at = time.monotonic() + self.min_interval
+
+    async def finish(self, text: str) -> None:
+        """Show the final text, splitting anything over the message limit into follow-ups"""
+        messages = split_message(text, MAX_MESSAGE_LENGTH) or [text]
+        for _ in range(3):
+            delay = self._next_edit_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if await self._show(messages[0]):
+                break
+
+        for message in messages[1:]:
+            await self.reply_to.reply_text(message)
+
+    async def _show(self, text: str) -> bool:
+        """Send or edit the message; False if flood control postponed it"""
+        if not text.strip() or text == self._shown:
+            return True
+        try:
+            if self.message is None:
+                self.message = await self.reply_to.reply_text(text)
+            else:
+                await self.message.edit_text(text)
+                self.edits += 1
+            self._shown = text
+        except RetryAfter as e:
+            # Flood control: back off and let the next update or finish() catch up
+            logger.warning(f"Message edit rate limited for {e.retry_after}s")
+            self._next_edit_at = time.monotonic() + float(e.retry_after)
+            return False
+        except BadRequest as e:
+            if 'not modified' not in str(e).lower():
+                logger.warning(f"Progressive message edit failed: {e}")
+        self._next_edit_at = time.monotonic() + self.min_interval
+        return True
@@ -0,0 +1,203 @@
+import asyncio
+import functools
+import logging
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers cache hits (milliseconds) up to slow Gemini answers and uploads
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: LabelKey, extra: str = '') -> str:
+    parts = [f'{key}="{_escape(value)}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; observe() is a bisect and three additions"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One slot per bucket plus the +Inf overflow
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """In-process counters, gauges and histograms rendered in Prometheus text format
+
+    Hot paths should look a histogram up once (histogram() or instrument())
+    and keep the object; everything else is a dict update. Components that
+    already count things in a stats() dict are exported through
+    register_stats() at scrape time instead of being instrumented twice.
+    """
+
+    def __init__(self, prefix: str = 'bot'):
+        self.prefix = prefix
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._collectors: List[Tuple[str, Callable[[], Dict], Optional[str]]] = []
+
+    def histogram(self, name: str, buckets: Sequence[float] = DEFAULT_BUCKETS, **labels: Any) -> Histogram:
+        series = self._histograms.setdefault(name, {})
+        key = _label_key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(buckets)
+        return histogram
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        self.histogram(name, **labels).observe(value)
+
+    def inc(self, name: str, amount: float = 1.0, **labels: Any) -> None:
+        series = self._counters.setdefault(name, {})
+        key = _label_key(labels)
+        series[key] = series.get(key, 0.0) + amount
+
+    def total(self, name: str) -> float:
+        """Sum of a counter across all its label values"""
+        return sum(self._counters.get(name, {}).values())
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def instrument(self, func: Callable, name: str = 'handler', label: str = 'handler') -> Callable:
+        """Wrap an async function to record its latency, errors and in-flight calls"""
+        labels = {label: func.__name__}
+        histogram = self.histogram(f'{name}_seconds', **labels)
+        key = _label_key(labels)
+        errors = self._counters.setdefault(f'{name}_errors_total', {})
+        errors.setdefault(key, 0.0)
+        in_flight = self._gauges.setdefault(f'{name}_in_flight', {})
+        in_flight.setdefault(key, 0.0)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            in_flight[key] += 1
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                errors[key] += 1
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started)
+                in_flight[key] -= 1
+
+        return wrapper
+
+    def register_stats(self, name: str, stats: Callable[[], Dict], label: Optional[str] = None) -> None:
+        """Export the numeric values of stats() as gauges named {prefix}_{name}_{key}
+
+        With label set, stats() returns {label_value: {key: value}} instead,
+        e.g. one entry per provider.
+        """
+        self._collectors.append((name, stats, label))
+
+    def _collect(self) -> Dict[str, Dict[LabelKey, float]]:
+        collected: Dict[str, Dict[LabelKey, float]] = {}
+        for name, stats, label in self._collectors:
+            try:
+                values = stats()
+            except Exception as e:
+                logger.warning(f"Metrics collector {name} failed: {e}")
+                continue
+            groups: Iterable[Tuple[LabelKey, Dict]] = (
+                (((label, str(group)),), group_values) for group, group_values in values.items()
+            ) if label else (((), values),)
+            for labels, group_values in groups:
+                for key, value in group_values.items():
+                    if isinstance(value, bool):
+                        value = int(value)
+                    if isinstance(value, (int, float)):
+                        collected.setdefault(f'{name}_{key}', {})[labels] = value
+        return collected
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text exposition format"""
+        lines = []
+        prefix = self.prefix
+        for name, series in sorted(self._counters.items()):
+            lines.append(f'# TYPE {prefix}_{name} counter')
+            for labels, value in series.items():
+                lines.append(f'{prefix}_{name}{_format_labels(labels)} {value}')
+        gauges = dict(self._gauges)
+        gauges.update(self._collect())
+        for name, series in sorted(gauges.items()):
+            lines.append(f'# TYPE {prefix}_{name} gauge')
+            for labels, value in series.items():
+                lines.append(f'{prefix}_{name}{_format_labels(labels)} {value}')
+        for name, series in sorted(self._histograms.items()):
+            lines.append(f'# TYPE {prefix}_{name} histogram')
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    bucket_labels = _format_labels(labels, f'le="{bound}"')
+                    lines.append(f'{prefix}_{name}_bucket{bucket_labels} {cumulative}')
+                bucket_labels = _format_labels(labels, 'le="+Inf"')
+                lines.append(f'{prefix}_{name}_bucket{bucket_labels} {histogram.count}')
+                lines.append(f'{prefix}_{name}_sum{_format_labels(labels)} {histogram.sum}')
+                lines.append(f'{prefix}_{name}_count{_format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+async def start_metrics_server(registry: 'MetricsRegistry', host: str = '127.0.0.1',
+                               port: int = 9300) -> asyncio.AbstractServer:
+    """Serve GET /metrics for Prometheus scrapes on a plain asyncio socket server"""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            while True:
+                header = await asyncio.wait_for(reader.readline(), 5)
+                if header in (b'\r\n', b'\n', b''):
+                    break
+            parts = request_line.split()
+            if len(parts) >= 2 and parts[0] == b'GET' and parts[1].split(b'?')[0] == b'/metrics':
+                status, body = b'200 OK', registry.render().encode()
+            else:
+                status, body = b'404 Not Found', b'not found\n'
+            writer.write(
+                b'HTTP/1.1 ' + status + b'\r\n'
+                b'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                b'Content-Length: ' + str(len(body)).encode() + b'\r\n'
+                b'Connection: close\r\n\r\n' + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
+
+
+# Shared by the bot and the utilities it instruments
+metrics = MetricsRegistry()
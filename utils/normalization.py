@@ -0,0 +1,49 @@
+from functools import lru_cache
+from typing import Dict, List, Optional, Union
+
+# Arabic code points that Persian keyboards and sources use interchangeably
+_CHAR_MAP: Dict[int, Optional[str]] = {
+    ord('ي'): 'ی',
+    ord('ى'): 'ی',
+    ord('ك'): 'ک',
+    ord('ة'): 'ه',
+    ord('ۀ'): 'ه',
+    ord('أ'): 'ا',
+    ord('إ'): 'ا',
+    ord('ٱ'): 'ا',
+    ord('ؤ'): 'و',
+}
+
+# Persian (U+06F0..) and Arabic-Indic (U+0660..) digits to ASCII
+for _offset in range(10):
+    _CHAR_MAP[0x06F0 + _offset] = str(_offset)
+    _CHAR_MAP[0x0660 + _offset] = str(_offset)
+
+# Diacritics, superscript alef and tatweel carry no search meaning
+for _code in range(0x064B, 0x0660):
+    _CHAR_MAP[_code] = None
+_CHAR_MAP[0x0670] = None
+_CHAR_MAP[0x0640] = None
+
+# Zero-width joiners and direction marks; ZWNJ is dropped so that
+# "می‌خوام" and "میخوام" normalize to the same key
+for _code in (0x200C, 0x200D, 0x200E, 0x200F):
+    _CHAR_MAP[_code] = None
+
+# str.translate is roughly twice as fast with a list indexed by code point
+# than with a dict. Code points past the end of the list raise IndexError,
+# which translate treats as "leave unchanged".
+_TRANSLATION: List[Union[int, str, None]] = list(range(max(_CHAR_MAP) + 1))
+for _code, _replacement in _CHAR_MAP.items():
+    _TRANSLATION[_code] = _replacement
+
+
+@lru_cache(maxsize=16384)
+def normalize_text(text: str) -> str:
+    """Normalize Persian/Arabic text for cache keys and title comparison
+
+    Unifies yeh/kaf/heh/alef variants, converts Persian and Arabic digits to
+    ASCII, strips diacritics, tatweel and zero-width characters, case-folds
+    and collapses whitespace.
+    """
+    return ' '.join(text.translate(_TRANSLATION).casefold().split())
@@ -0,0 +1,233 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.normalization import normalize_text
+from utils.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Seconds a result stays fresh, per provider
+DEFAULT_TTLS = {
+    'YouTube': 6 * 3600,
+    'Spotify': 6 * 3600,
+    'TMDB': 24 * 3600,
+    'TMDB-Persian': 24 * 3600,
+    'OMDB': 24 * 3600
+}
+
+
+class MemoryBackend:
+    """In-process LRU store for cached results"""
+
+    # Calls return at once and may run on the event loop
+    blocking = False
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, stored_at: float, value: Any) -> None:
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def close(self) -> None:
+        self._entries.clear()
+
+
+class SQLiteBackend:
+    """SQLite store for cached results that survives restarts
+
+    Worker processes share the file, so it runs in WAL mode: readers do not
+    wait for a writer. Calls touch the disk, so ResultCache makes them from a
+    worker thread.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # A cache can lose its last writes in a power cut; commits need not wait for the disk
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS search_results ("
+            "cache_key TEXT PRIMARY KEY, stored_at REAL NOT NULL, value TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT stored_at, value FROM search_results WHERE cache_key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def set(self, key: str, stored_at: float, value: Any) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_results (cache_key, stored_at, value) VALUES (?, ?, ?)",
+                (key, stored_at, json.dumps(value, ensure_ascii=False))
+            )
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                self._conn.execute(
+                    "DELETE FROM search_results WHERE cache_key NOT IN "
+                    "(SELECT cache_key FROM search_results ORDER BY stored_at DESC LIMIT ?)",
+                    (self.max_entries,)
+                )
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM search_results WHERE cache_key = ?", (key,))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ResultCache:
+    """TTL cache for provider search results with stale-while-revalidate
+
+    Fresh entries are returned directly. Entries past their TTL but within
+    the stale window are returned immediately while a background refresh
+    replaces them. Empty results are cached for a shorter negative TTL.
+    Fetch errors are never cached; when a fetch fails (for example because
+    the provider's circuit is open) an expired entry is served instead.
+    Backend errors never fail a search: a failed read is a miss and a failed
+    write is logged.
+    """
+
+    def __init__(self, backend=None, namespace: str = '', ttls: Optional[Dict[str, float]] = None,
+                 default_ttl: float = 6 * 3600, negative_ttl: float = 600, stale_ttl: float = 24 * 3600):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.namespace = namespace
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self._flights = SingleFlight()
+        self.hits = 0
+        self.stale_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.fallback_hits = 0
+        self.errors = 0
+
+    async def _backend_get(self, key: str) -> Optional[Tuple[float, Any]]:
+        try:
+            if self.backend.blocking:
+                return await asyncio.to_thread(self.backend.get, key)
+            return self.backend.get(key)
+        except (sqlite3.Error, ValueError) as e:
+            self.errors += 1
+            logger.warning(f"Search cache read failed, treating it as a miss: {e}")
+            return None
+
+    async def _backend_set(self, key: str, stored_at: float, value: Any) -> None:
+        try:
+            if self.backend.blocking:
+                await asyncio.to_thread(self.backend.set, key, stored_at, value)
+            else:
+                self.backend.set(key, stored_at, value)
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Search cache write failed: {e}")
+
+    def make_key(self, provider: str, query: str) -> str:
+        return f"{self.namespace}:{provider}:{normalize_text(query)}"
+
+    def _ttl_for(self, provider: str, value: List) -> float:
+        if not value:
+            return self.negative_ttl
+        return self.ttls.get(provider, self.default_ttl)
+
+    async def _fetch_and_store(self, key: str, fetch: Callable[[], Awaitable[List]]) -> List:
+        value = await fetch()
+        await self._backend_set(key, time.time(), value)
+        return value
+
+    def _start_fetch(self, key: str, fetch: Callable[[], Awaitable[List]]) -> asyncio.Future:
+        # Concurrent misses and refreshes for one key share a single upstream call
+        return self._flights.start(key, lambda: self._fetch_and_store(key, fetch))
+
+    async def get_or_fetch(self, provider: str, query: str, fetch: Callable[[], Awaitable[List]]) -> List:
+        """Return cached results for (provider, query), calling fetch on a miss
+
+        The upstream fetch keeps running if the caller stops waiting (for
+        example on a fan-out deadline), so late answers still warm the cache.
+        """
+        key = self.make_key(provider, query)
+        entry = await self._backend_get(key)
+        if entry is not None:
+            stored_at, value = entry
+            age = time.time() - stored_at
+            ttl = self._ttl_for(provider, value)
+            if age < ttl:
+                if value:
+                    self.hits += 1
+                else:
+                    self.negative_hits += 1
+                return value
+            if value and age < ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._start_fetch(key, fetch)
+                return value
+
+        self.misses += 1
+        try:
+            return await asyncio.shield(self._start_fetch(key, fetch))
+        except Exception as e:
+            if entry is None or not entry[1]:
+                raise
+            self.fallback_hits += 1
+            logger.warning(f"Serving expired {provider} results for '{query}' after fetch failed: {e}")
+            return entry[1]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'fallback_hits': self.fallback_hits,
+            'errors': self.errors,
+            'refreshing': self._flights.in_flight,
+            'coalesced': self._flights.shared
+        }
+
+    def close(self) -> None:
+        self.backend.close()
+
+
+def create_backend(kind: str = 'memory', path: Optional[str] = None):
+    """Build a cache backend from configuration ('memory' or 'sqlite')"""
+    if kind == 'sqlite':
+        if not path:
+            raise ValueError("SQLite search cache needs a path")
+        return SQLiteBackend(path)
+    return MemoryBackend()
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from utils.normalization import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Fields of a formatted music or movie result that describe what it is
+_SEARCH_FIELDS = ('title', 'artist', 'original_title', 'year')
+
+
+class SearchIndex:
+    """Local full-text index of formatted search results (SQLite FTS5)
+
+    Results that the music and movie services format are added as they come
+    back from upstream, so the catalogue of popular artists and films builds
+    up over time. lookup() answers a query locally only when it is confident:
+    at least min_results entries updated within max_age contain every word of
+    the query. Anything less is a miss and the caller asks upstream, whose
+    results then refresh the index.
+
+    The database may be shared by several bot processes, so it runs in WAL
+    mode. Handlers on the event loop use the *_async methods, which run in a
+    worker thread and treat a database error as a miss instead of failing
+    the search.
+    """
+
+    def __init__(self, path: str = ':memory:', max_age: float = 7 * 24 * 3600, min_results: int = 3,
+                 candidates: int = 100):
+        self.path = path
+        self.max_age = max_age
+        self.min_results = min_results
+        self.candidates = candidates
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # Readers in other processes do not wait for a writer, nor it for them
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                entry_key TEXT NOT NULL,
+                search_text TEXT NOT NULL,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                UNIQUE (kind, entry_key)
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+                search_text, content='entries', content_rowid='id'
+            );
+            CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+                INSERT INTO entries_fts (rowid, search_text) VALUES (new.id, new.search_text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+                INSERT INTO entries_fts (entries_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_au AFTER UPDATE ON entries BEGIN
+                INSERT INTO entries_fts (entries_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+                INSERT INTO entries_fts (rowid, search_text) VALUES (new.id, new.search_text);
+            END;
+        """)
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.added = 0
+        self.errors = 0
+        self._pending: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def entry_key(result: Dict) -> str:
+        """Identity of a result, so a refresh replaces it instead of adding a copy"""
+        for field in ('url', 'tmdb_id', 'imdb_id'):
+            if result.get(field):
+                return f"{field}:{result[field]}"
+        return f"title:{normalize_text(str(result.get('title', '')))}"
+
+    @staticmethod
+    def search_text(result: Dict) -> str:
+        parts = [str(result[field]) for field in _SEARCH_FIELDS if result.get(field)]
+        release_date = result.get('release_date')
+        if release_date and release_date[:4].isdigit():
+            parts.append(release_date[:4])
+        return normalize_text(' '.join(parts))
+
+    @staticmethod
+    def _match_expression(query: str, prefix: bool = False) -> Optional[str]:
+        """Every normalized word as a quoted FTS5 phrase, implicitly ANDed
+
+        With prefix, the last word also matches longer words starting with it.
+        """
+        words = normalize_text(query).split()
+        if not words:
+            return None
+        expression = ' '.join('"' + word.replace('"', '""') + '"' for word in words)
+        return expression + ' *' if prefix else expression
+
+    def _rows(self, kind: str, expression: str, limit: int, min_updated_at: float) -> List[tuple]:
+        # bm25 ranking scores every match (30+ ms for a popular artist at 1M
+        # entries); walking matches newest first stops after limit rows
+        return self._conn.execute(
+            "SELECT entries.search_text, entries.data FROM entries_fts JOIN entries ON entries.id = entries_fts.rowid "
+            "WHERE entries_fts MATCH ? AND entries.kind = ? AND entries.updated_at >= ? "
+            "ORDER BY entries_fts.rowid DESC LIMIT ?",
+            (expression, kind, min_updated_at, limit)
+        ).fetchall()
+
+    def search(self, kind: str, query: str, limit: int = 10, max_age: Optional[float] = None,
+               prefix: bool = False) -> List[Dict]:
+        """Entries containing every word of the query, closest matches first
+
+        Candidates are the `candidates` most recently added matches; the
+        shortest of them (least text besides the query) rank highest. With
+        prefix, the query may end in a partly typed word.
+        """
+        expression = self._match_expression(query, prefix)
+        if expression is None:
+            return []
+        min_updated_at = time.time() - max_age if max_age is not None else 0.0
+        with self._lock:
+            rows = self._rows(kind, expression, max(limit, self.candidates), min_updated_at)
+        rows.sort(key=lambda row: len(row[0]))
+        return [json.loads(data) for _, data in rows[:limit]]
+
+    def lookup(self, kind: str, query: str, limit: int = 10) -> List[Dict]:
+        """Results to answer with locally, or [] when upstream should be asked"""
+        results = self.search(kind, query, max(limit, self.min_results), self.max_age)
+        if len(results) < self.min_results:
+            self.misses += 1
+            return []
+        self.hits += 1
+        return results[:limit]
+
+    def complete(self, kind: str, text: str, limit: int = 10) -> List[Dict]:
+        """Entries matching text as typed so far, for autocomplete; entries of any age count"""
+        return self.search(kind, text, limit, prefix=True)
+
+    def _row(self, kind: str, result: Dict, updated_at: float) -> tuple:
+        return (kind, self.entry_key(result), self.search_text(result),
+                json.dumps(result, ensure_ascii=False), updated_at)
+
+    def _write(self, rows: List[tuple]) -> int:
+        rows = [row for row in rows if row[2]]
+        if not rows:
+            return 0
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO entries (kind, entry_key, search_text, data, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (kind, entry_key) DO UPDATE SET "
+                "search_text = excluded.search_text, data = excluded.data, updated_at = excluded.updated_at",
+                rows
+            )
+            self._conn.commit()
+            self.added += len(rows)
+        return len(rows)
+
+    def add(self, kind: str, results: Iterable[Dict], updated_at: Optional[float] = None) -> int:
+        """Insert or refresh formatted results; returns how many were written"""
+        updated_at = time.time() if updated_at is None else updated_at
+        return self._write([self._row(kind, result, updated_at) for result in results])
+
+    async def lookup_async(self, kind: str, query: str, limit: int = 10) -> List[Dict]:
+        """lookup() in a worker thread; a database error counts as a miss"""
+        try:
+            return await asyncio.to_thread(self.lookup, kind, query, limit)
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Search index lookup failed, asking upstream: {e}")
+            return []
+
+    async def complete_async(self, kind: str, text: str, limit: int = 10) -> List[Dict]:
+        """complete() in a worker thread; a database error gives no suggestions"""
+        try:
+            return await asyncio.to_thread(self.complete, kind, text, limit)
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Search index completion failed: {e}")
+            return []
+
+    async def _add_logged(self, kind: str, results: List[Dict]) -> None:
+        try:
+            await asyncio.to_thread(self.add, kind, results)
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Could not add {len(results)} results to the search index: {e}")
+
+    def add_later(self, kind: str, results: Iterable[Dict]) -> None:
+        """Add results from a worker thread without waiting for the write (call on the event loop)"""
+        task = asyncio.get_running_loop().create_task(self._add_logged(kind, list(results)))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    def export_jsonl(self, path: str) -> int:
+        """Write every entry as one JSON object per line; returns the number written"""
+        count = 0
+        with self._lock, open(path, 'w', encoding='utf-8') as f:
+            for kind, data, updated_at in self._conn.execute("SELECT kind, data, updated_at FROM entries ORDER BY id"):
+                f.write(f'{{"kind": {json.dumps(kind)}, "updated_at": {updated_at}, "result": {data}}}\n')
+                count += 1
+        return count
+
+    def import_jsonl(self, path: str, batch_size: int = 10000) -> int:
+        """Bulk-load entries written by export_jsonl (or built offline); returns the number read
+
+        Lines are {"kind": ..., "result": {...}} with an optional updated_at;
+        entries already in the index are replaced.
+        """
+        count = 0
+        now = time.time()
+        rows = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                rows.append(self._row(record['kind'], record['result'], record.get('updated_at', now)))
+                count += 1
+                if len(rows) >= batch_size:
+                    self._write(rows)
+                    rows = []
+        self._write(rows)
+        logger.info(f"Imported {count} search index entries from {path}")
+        return count
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'added': self.added, 'errors': self.errors}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
@@ -0,0 +1,224 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from utils.metrics import Histogram, metrics
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes: lower values are sent first when the global budget is short
+LANE_INTERACTIVE = 0
+LANE_TEXT = 1
+LANE_MEDIA = 2
+LANE_NAMES = {LANE_INTERACTIVE: 'interactive', LANE_TEXT: 'text', LANE_MEDIA: 'media'}
+
+# Answers the user is actively waiting on; they do not count against a chat's message budget
+INTERACTIVE_ENDPOINTS = {'answerCallbackQuery', 'answerInlineQuery', 'sendChatAction'}
+MEDIA_ENDPOINTS = {
+    'sendAudio', 'sendVoice', 'sendDocument', 'sendPhoto', 'sendVideo', 'sendVideoNote',
+    'sendAnimation', 'sendMediaGroup', 'sendSticker'
+}
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations instead of rejecting requests
+
+    Tokens may go negative: reserve() always takes one and returns how long
+    the caller has to wait for it, which keeps callers in FIFO order.
+    """
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Seconds until a token is available"""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+    def reserve(self) -> float:
+        """Take a token and return the seconds to wait before using it"""
+        self.take()
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every reservation for at least seconds"""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class SendRateLimiter(BaseRateLimiter[int]):
+    """Throttle outgoing Bot API requests below Telegram's flood limits
+
+    Every message to a chat takes a token from that chat's bucket (private
+    chats and groups have separate rates) and then one from the global
+    bucket. Requests waiting for a global token are released by priority
+    lane: callback/inline answers first, then text, then media uploads. A
+    rate_limit_args int overrides the lane. On RetryAfter the affected chat
+    (or, for chat-less requests, the whole bot) is paused for the requested
+    time and the request is retried up to max_retries times.
+    """
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, group_rate: float = 20 / 60,
+                 chat_burst: float = 3.0, max_retries: int = 2, max_tracked_chats: int = 10000):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_tracked_chats = max_tracked_chats
+        self._global = TokenBucket(global_rate, max(1.0, global_rate))
+        self._chats: Dict[Union[int, str], TokenBucket] = {}
+        self._waiting: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.queued = {lane: 0 for lane in LANE_NAMES}
+        self.sent = 0
+        self.retried = 0
+        self.delayed_seconds = 0.0
+        self._latency: Dict[str, Histogram] = {}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for _, _, future in self._waiting:
+            if not future.done():
+                future.cancel()
+        self._waiting.clear()
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_tracked_chats:
+                # A full bucket behaves exactly like a new one, so idle chats can be forgotten
+                self._chats = {key: value for key, value in self._chats.items() if not value.idle}
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            bucket = TokenBucket(self.group_rate if is_group else self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _acquire_global(self, lane: int) -> None:
+        if not self._waiting and self._global.delay() == 0:
+            self._global.take()
+            return
+        if self._dispatcher is None:
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (lane, next(self._sequence), future))
+        self._wakeup.set()
+        await future
+
+    async def _dispatch(self) -> None:
+        """Hand out global tokens to waiting requests, most urgent lane first"""
+        while True:
+            if not self._waiting:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = self._global.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiting)
+            if future.done():
+                continue
+            self._global.take()
+            future.set_result(None)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        chat_id = data.get('chat_id')
+        interactive = endpoint in INTERACTIVE_ENDPOINTS
+        if not interactive and chat_id is None:
+            # getMe, setWebhook, getFile and friends are not messages
+            return await callback(*args, **kwargs)
+
+        if isinstance(rate_limit_args, int):
+            lane = rate_limit_args
+        elif interactive:
+            lane = LANE_INTERACTIVE
+        elif endpoint in MEDIA_ENDPOINTS:
+            lane = LANE_MEDIA
+        else:
+            lane = LANE_TEXT
+        bucket = self._chat_bucket(chat_id) if chat_id is not None and not interactive else None
+
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            self.queued[lane] = self.queued.get(lane, 0) + 1
+            try:
+                if bucket is not None:
+                    delay = bucket.reserve()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                await self._acquire_global(lane)
+            finally:
+                self.queued[lane] -= 1
+            self.delayed_seconds += time.monotonic() - started
+
+            latency = self._latency.get(endpoint)
+            if latency is None:
+                latency = self._latency[endpoint] = metrics.histogram('telegram_request_seconds', endpoint=endpoint)
+            started = time.perf_counter()
+            try:
+                result = await callback(*args, **kwargs)
+                self.sent += 1
+                return result
+            except RetryAfter as e:
+                metrics.inc('telegram_retry_after_total', endpoint=endpoint)
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retried += 1
+                logger.warning(f"{endpoint} to chat {chat_id} rate limited, retrying in {e.retry_after}s")
+                (bucket or self._global).pause(float(e.retry_after))
+            finally:
+                latency.observe(time.perf_counter() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queued': {LANE_NAMES.get(lane, str(lane)): count for lane, count in self.queued.items()},
+            'waiting_for_global': len(self._waiting),
+            'tracked_chats': len(self._chats),
+            'sent': self.sent,
+            'retried': self.retried,
+            'delayed_seconds': round(self.delayed_seconds, 3)
+        }
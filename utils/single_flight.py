@@ -0,0 +1,53 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls into one in-flight upstream call
+
+    The first caller for a key starts the call; callers arriving while it is
+    still running wait on the same result. Once it finishes the key is
+    released, so later calls go upstream again (or hit a cache).
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.started = 0
+        self.shared = 0
+
+    def start(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """Return the in-flight future for key, starting func() if there is none"""
+        future = self._calls.get(key)
+        if future is not None:
+            self.shared += 1
+            return future
+
+        future = asyncio.ensure_future(func())
+        self._calls[key] = future
+        self.started += 1
+
+        def _release(done: asyncio.Future) -> None:
+            if self._calls.get(key) is done:
+                del self._calls[key]
+            if not done.cancelled() and done.exception() is not None:
+                logger.debug(f"Single-flight call for {key!r} failed: {done.exception()}")
+
+        future.add_done_callback(_release)
+        return future
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Run func() once per key among concurrent callers and return its result
+
+        A waiter being cancelled does not cancel the shared call for the others.
+        """
+        return await asyncio.shield(self.start(key, func))
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        return {'started': self.started, 'shared': self.shared, 'in_flight': self.in_flight}
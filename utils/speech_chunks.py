@@ -0,0 +1,186 @@
+import re
+import struct
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+# Sentence ends in Persian and Latin text; a newline always ends a sentence
+_SENTENCE_END = re.compile(r'(?<=[.!?؟…;؛])\s+|\s*\n+\s*')
+# Clause boundaries to fall back on inside a sentence that is too long
+_CLAUSE_END = re.compile(r'(?<=[،,:])\s+')
+
+# Ogg page header flag of a stream's last page
+_LAST_PAGE = 0x04
+
+
+def _pack(parts: Sequence[str], limit: int) -> List[str]:
+    """Join consecutive parts with spaces into chunks of at most limit characters where possible"""
+    chunks = []
+    current = ''
+    for part in parts:
+        if current and len(current) + 1 + len(part) > limit:
+            chunks.append(current)
+            current = part
+        else:
+            current = f'{current} {part}' if current else part
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _split_long(sentence: str, limit: int) -> List[str]:
+    if len(sentence) <= limit:
+        return [sentence]
+    pieces = []
+    for clause in _CLAUSE_END.split(sentence):
+        pieces.extend([clause] if len(clause) <= limit else _pack(clause.split(), limit))
+    return _pack(pieces, limit)
+
+
+def split_sentences(text: str, max_chars: int = 200, first_chars: Optional[int] = None) -> List[str]:
+    """Split text into chunks of whole sentences, each at most max_chars where possible
+
+    Sentences longer than max_chars are split at clause boundaries, then
+    between words. With first_chars, the first chunk is kept that short
+    (but holds at least one piece), so it can be spoken sooner.
+    """
+    pieces = []
+    for sentence in _SENTENCE_END.split(text.strip()):
+        if sentence.strip():
+            pieces.extend(_split_long(sentence.strip(), max_chars))
+    if not first_chars or len(pieces) < 2:
+        return _pack(pieces, max_chars)
+
+    first = pieces[0]
+    taken = 1
+    while taken < len(pieces) and len(first) + 1 + len(pieces[taken]) <= first_chars:
+        first = f'{first} {pieces[taken]}'
+        taken += 1
+    return [first] + _pack(pieces[taken:], max_chars)
+
+
+def utf16_length(text: str) -> int:
+    """Length as Telegram counts it (UTF-16 code units, so an emoji counts twice)"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def split_caption(text: str, limit: int) -> Tuple[str, str]:
+    """Split text into a caption of at most limit (UTF-16) characters and the overflow
+
+    The caption ends at the last sentence end, or failing that the last
+    space, that fits; text that fits is returned whole with no overflow.
+    """
+    if utf16_length(text) <= limit:
+        return text, ''
+    prefix = text.encode('utf-16-le')[:limit * 2].decode('utf-16-le', 'ignore')
+    ends = [match.start() for match in _SENTENCE_END.finditer(prefix)]
+    if ends and ends[-1] > limit // 2:
+        cut = ends[-1]
+    else:
+        cut = prefix.rfind(' ')
+        if cut <= 0:
+            cut = len(prefix)
+    return text[:cut].rstrip(), text[cut:].strip()
+
+
+def split_message(text: str, limit: int) -> List[str]:
+    """Split text into messages of at most limit (UTF-16) characters, at sentence ends where possible"""
+    messages = []
+    while text:
+        message, text = split_caption(text, limit)
+        if message:
+            messages.append(message)
+    return messages
+
+
+def _strip_id3(data: bytes) -> bytes:
+    """MP3 frames without the ID3v2 tag in front or the ID3v1 tag at the end"""
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] & 0x7f) << 21 | (data[7] & 0x7f) << 14 | (data[8] & 0x7f) << 7 | (data[9] & 0x7f)
+        footer = 10 if data[5] & 0x10 else 0
+        data = data[10 + size + footer:]
+    if len(data) >= 128 and data[-128:-125] == b'TAG':
+        data = data[:-128]
+    return data
+
+
+def concat_mp3(chunks: Sequence[bytes]) -> bytes:
+    """One MP3 stream from several: MP3 frames are self-contained, so their tags are all that goes"""
+    return b''.join(_strip_id3(chunk) for chunk in chunks)
+
+
+def _crc_table() -> List[int]:
+    table = []
+    for i in range(256):
+        crc = i << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else crc << 1
+        table.append(crc & 0xFFFFFFFF)
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def _ogg_crc(page: bytes) -> int:
+    crc = 0
+    for byte in page:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ _CRC_TABLE[((crc >> 24) ^ byte) & 0xFF]
+    return crc
+
+
+def _ogg_pages(data: bytes) -> Iterator[Tuple[bytearray, int]]:
+    """Each page of an Ogg stream with the number of packets that end on it"""
+    position = 0
+    while position < len(data):
+        if data[position:position + 4] != b'OggS':
+            raise ValueError(f"Not an Ogg page at byte {position}")
+        segments = data[position + 26]
+        lacing = data[position + 27:position + 27 + segments]
+        end = position + 27 + segments + sum(lacing)
+        yield bytearray(data[position:end]), sum(1 for value in lacing if value < 255)
+        position = end
+
+
+def concat_ogg_opus(chunks: Sequence[bytes]) -> bytes:
+    """One OGG/Opus stream from several encoded with the same settings, without re-encoding
+
+    The Opus packets of every chunk are kept; the headers (OpusHead and
+    OpusTags, the first two packets) of all but the first are dropped, and
+    pages are renumbered into the first chunk's stream with granule positions
+    running on. Each later chunk keeps its few ms of encoder priming.
+    """
+    pages = []
+    serial = None
+    offset = 0
+    for index, data in enumerate(chunks):
+        packets = 0
+        last_granule = 0
+        for page, ended in _ogg_pages(data):
+            header = packets < 2
+            packets += ended
+            if header and index > 0:
+                continue
+            if serial is None:
+                serial = struct.unpack_from('<I', page, 14)[0]
+            granule = struct.unpack_from('<q', page, 6)[0]
+            if not header and granule != -1:
+                last_granule = granule
+                struct.pack_into('<q', page, 6, granule + offset)
+            page[5] &= ~_LAST_PAGE
+            struct.pack_into('<I', page, 14, serial)
+            pages.append(page)
+        offset += last_granule
+
+    if pages:
+        pages[-1][5] |= _LAST_PAGE
+    for sequence, page in enumerate(pages):
+        struct.pack_into('<I', page, 18, sequence)
+        struct.pack_into('<I', page, 22, 0)
+        struct.pack_into('<I', page, 22, _ogg_crc(page))
+    return b''.join(pages)
+
+
+def join_audio(chunks: Sequence[bytes], audio_format: str) -> bytes:
+    """Concatenate synthesized chunks in the format the audio cache holds ('mp3' or 'opus')"""
+    if len(chunks) == 1:
+        return chunks[0]
+    return concat_ogg_opus(chunks) if audio_format == 'opus' else concat_mp3(chunks)
@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from typing import Callable, Dict, List, Optional
+
+from telegram import Bot, Update
+from telegram.error import NetworkError, RetryAfter, TimedOut
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+# Sent to a worker's queue to ask it to drain and exit
+_STOP = None
+
+
+def chat_id_of(data: Dict) -> Optional[int]:
+    """Extract the chat (or user) an update belongs to from its raw JSON"""
+    for key in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if key in data:
+            return data[key]['chat']['id']
+    callback_query = data.get('callback_query')
+    if callback_query:
+        message = callback_query.get('message')
+        if message:
+            return message['chat']['id']
+        return callback_query['from']['id']
+    for key in ('inline_query', 'chosen_inline_result'):
+        if key in data:
+            return data[key]['from']['id']
+    return None
+
+
+def _worker_entry(index: int, updates, heartbeat, factory: Callable[[], Application]) -> None:
+    # The supervisor owns shutdown; Ctrl+C in the terminal must not kill workers mid-update
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Lets the factory give each worker its own ports (e.g. for metrics)
+    os.environ['BOT_WORKER_INDEX'] = str(index)
+    logging.basicConfig(
+        format=f'%(asctime)s - worker-{index} - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    asyncio.run(_worker_loop(index, updates, heartbeat, factory))
+
+
+async def _worker_loop(index: int, updates, heartbeat, factory: Callable[[], Application]) -> None:
+    application = factory()
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    logger.info(f"Worker {index} ready")
+
+    loop = asyncio.get_running_loop()
+    while True:
+        heartbeat.value = time.time()
+        try:
+            data = await loop.run_in_executor(None, updates.get, True, 1.0)
+        except queue.Empty:
+            continue
+        if data is _STOP:
+            break
+        await application.update_queue.put(Update.de_json(data, application.bot))
+
+    # Application.stop() finishes queued and running updates first
+    await application.stop()
+    if application.post_stop:
+        await application.post_stop(application)
+    await application.shutdown()
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+    logger.info(f"Worker {index} stopped")
+
+
+class Supervisor:
+    """Receive updates once and shard them across worker processes by chat
+
+    Every update for a chat goes to the same worker, so a chat's updates are
+    handled in the order they arrived while total throughput scales with
+    cores. Workers are spawned (not forked) and build their own Application
+    from factory, so they share no in-memory state. Workers that exit or stop
+    sending heartbeats are killed and restarted.
+    """
+
+    def __init__(self, token: str, factory: Callable[[], Application], workers: int = 4,
+                 base_url: Optional[str] = None, allowed_updates: Optional[List[str]] = None,
+                 poll_timeout: int = 30, heartbeat_timeout: float = 60.0, queue_size: int = 1000,
+                 drain_timeout: float = 30.0):
+        self.token = token
+        self.factory = factory
+        self.workers = workers
+        self.base_url = base_url
+        self.allowed_updates = allowed_updates
+        self.poll_timeout = poll_timeout
+        self.heartbeat_timeout = heartbeat_timeout
+        self.queue_size = queue_size
+        self.drain_timeout = drain_timeout
+        self._context = multiprocessing.get_context('spawn')
+        self._queues = [self._context.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._heartbeats = [self._context.Value('d', 0.0) for _ in range(workers)]
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self.restarts = 0
+        self.dispatched = 0
+        self.dropped = 0
+
+    def shard_for(self, data: Dict) -> int:
+        chat_id = chat_id_of(data)
+        key = chat_id if chat_id is not None else data.get('update_id', 0)
+        return key % self.workers
+
+    def _start_worker(self, index: int) -> None:
+        self._heartbeats[index].value = time.time()
+        process = self._context.Process(
+            target=_worker_entry,
+            args=(index, self._queues[index], self._heartbeats[index], self.factory),
+            name=f'bot-worker-{index}',
+            daemon=True
+        )
+        process.start()
+        self._processes[index] = process
+        logger.info(f"Started worker {index} (pid {process.pid})")
+
+    def check_workers(self) -> None:
+        """Restart workers that have exited or stopped sending heartbeats"""
+        now = time.time()
+        for index, process in enumerate(self._processes):
+            stale = now - self._heartbeats[index].value > self.heartbeat_timeout
+            if process is not None and process.is_alive() and not stale:
+                continue
+            if process is not None:
+                if process.is_alive():
+                    logger.error(f"Worker {index} unresponsive for {self.heartbeat_timeout}s, killing it")
+                    process.kill()
+                    process.join(5)
+                else:
+                    logger.error(f"Worker {index} exited with code {process.exitcode}, restarting")
+                self.restarts += 1
+                # A killed reader can die holding the queue's lock, so the
+                # replacement gets a fresh queue; updates queued for the
+                # crashed worker are lost.
+                self._queues[index] = self._context.Queue(maxsize=self.queue_size)
+            self._start_worker(index)
+
+    def dispatch(self, data: Dict) -> None:
+        """Queue an update for its worker without blocking the polling loop
+
+        A full queue usually means the worker is stuck; it is checked (and
+        restarted with an empty queue if it is) before the update is dropped.
+        """
+        index = self.shard_for(data)
+        for attempt in range(2):
+            try:
+                self._queues[index].put_nowait(data)
+                self.dispatched += 1
+                return
+            except queue.Full:
+                if attempt == 0:
+                    self.check_workers()
+        self.dropped += 1
+        logger.error(f"Worker {index} queue full, dropping update {data.get('update_id')}")
+
+    async def _poll(self) -> None:
+        bot = Bot(self.token, base_url=self.base_url) if self.base_url else Bot(self.token)
+        offset = None
+        async with bot:
+            try:
+                while True:
+                    self.check_workers()
+                    try:
+                        updates = await bot.get_updates(
+                            offset=offset,
+                            timeout=self.poll_timeout,
+                            allowed_updates=self.allowed_updates
+                        )
+                    except RetryAfter as e:
+                        await asyncio.sleep(float(e.retry_after))
+                        continue
+                    except (NetworkError, TimedOut) as e:
+                        logger.warning(f"getUpdates failed: {e}")
+                        await asyncio.sleep(1)
+                        continue
+
+                    for update in updates:
+                        self.dispatch(update.to_dict())
+                        offset = update.update_id + 1
+            finally:
+                if offset is not None:
+                    # Acknowledge what was dispatched so it is not delivered again
+                    try:
+                        await asyncio.wait_for(bot.get_updates(offset=offset, timeout=0), 5)
+                    except Exception as e:
+                        logger.warning(f"Could not acknowledge last updates: {e}")
+
+    async def _run(self) -> None:
+        task = asyncio.ensure_future(self._poll())
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, task.cancel)
+        try:
+            await task
+        except asyncio.CancelledError:
+            logger.info("Supervisor stopping")
+
+    def stop_workers(self) -> None:
+        """Ask every worker to drain, then terminate any that do not exit in time"""
+        for updates in self._queues:
+            try:
+                updates.put(_STOP, timeout=1)
+            except queue.Full:
+                pass
+        deadline = time.time() + self.drain_timeout
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            process.join(max(0.0, deadline - time.time()))
+            if process.is_alive():
+                logger.warning(f"Worker {index} did not drain in time, terminating")
+                process.terminate()
+                process.join(5)
+
+    def run(self) -> None:
+        """Start the workers and poll for updates until interrupted"""
+        logger.info(f"Starting supervisor with {self.workers} workers")
+        try:
+            asyncio.run(self._run())
+        finally:
+            self.stop_workers()
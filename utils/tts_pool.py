@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TTSWorkerPool:
+    """Bounded worker pool that runs blocking TTS synthesis off the event loop
+
+    At most max_workers jobs run at once and at most max_queue more may wait.
+    Jobs submitted beyond that are rejected (run returns None) so callers can
+    degrade to a text-only reply instead of piling up behind gTTS.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 16, job_timeout: float = 15.0,
+                 use_processes: bool = False):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self.use_processes = use_processes
+        self._executor: Optional[Executor] = None
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.failed = 0
+        self._latency = metrics.histogram('tts_seconds')
+
+    @property
+    def capacity(self) -> int:
+        """Maximum number of running plus queued jobs"""
+        return self.max_workers + self.max_queue
+
+    @property
+    def saturated(self) -> bool:
+        return self.in_flight >= self.capacity
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.use_processes:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='tts')
+        return self._executor
+
+    def _job_finished(self, future: asyncio.Future) -> None:
+        # Slots are released when the worker actually finishes, not when the
+        # caller stops waiting, so timed-out jobs still count against capacity.
+        self.in_flight -= 1
+        if not future.cancelled():
+            future.exception()  # mark as retrieved for abandoned jobs
+
+    async def run(self, func: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+        """Run func(*args) on the pool; return None when saturated, timed out or failed"""
+        if self.saturated:
+            self.rejected += 1
+            logger.warning(f"TTS pool saturated ({self.in_flight}/{self.capacity}), skipping audio")
+            return None
+
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        future = loop.run_in_executor(self._get_executor(), func, *args)
+        self.in_flight += 1
+        future.add_done_callback(self._job_finished)
+
+        try:
+            result = await asyncio.wait_for(
+                asyncio.shield(future),
+                timeout if timeout is not None else self.job_timeout
+            )
+            self.completed += 1
+            self._latency.observe(time.perf_counter() - started)
+            return result
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            logger.warning(f"TTS job timed out after {timeout or self.job_timeout}s")
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"TTS job failed: {e}")
+        return None
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': self.in_flight,
+            'capacity': self.capacity,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+            'failed': self.failed
+        }
+
+    def shutdown(self) -> None:
+        """Stop the workers, dropping queued jobs"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -1,22 +1,52 @@
 
+import asyncio
 import logging
 from io import BytesIO
-from gtts import gTTS
 import os
 import tempfile
-from typing import Optional
+from typing import AsyncIterator, Dict, Iterable, Optional
+
+from utils.audio_cache import AudioCache
+from utils.audio_encoder import OpusEncoder
+from utils.single_flight import SingleFlight
+from utils.speech_chunks import join_audio, split_sentences
+from utils.tts_pool import TTSWorkerPool
 
 logger = logging.getLogger(__name__)
 
+# Identical synthesis requests in flight at the same time share one gTTS job
+_tts_flights = SingleFlight()
+
+# gtts (and the requests stack under it) is imported on first synthesis by
+# load_gtts(); benchmarks may assign a stand-in class here instead
+gTTS = None
+
+def load_gtts():
+    """Import gTTS on first use and return the class"""
+    global gTTS
+    if gTTS is None:
+        from gtts import gTTS as engine
+        gTTS = engine
+    return gTTS
+
 class VoiceUtils:
     """Utilities for text-to-speech conversion"""
     
     @staticmethod
-    def text_to_speech(text: str, lang: str = 'fa', slow: bool = False) -> Optional[BytesIO]:
-        """Convert text to speech using gTTS"""
+    def text_to_speech(text: str, lang: str = 'fa', slow: bool = False, cache: Optional[AudioCache] = None,
+                       encoder: Optional[OpusEncoder] = None) -> Optional[BytesIO]:
+        """Convert text to speech using gTTS, consulting the audio cache first
+        
+        gTTS produces MP3; with an encoder the result is transcoded to OGG/Opus.
+        """
+        if cache is not None:
+            cached = cache.get(text, lang, slow)
+            if cached is not None:
+                return BytesIO(cached)
+        
         try:
             # Create TTS object
-            tts = gTTS(text=text, lang=lang, slow=slow)
+            tts = load_gtts()(text=text, lang=lang, slow=slow)
             
             # Create BytesIO buffer
             audio_buffer = BytesIO()
@@ -25,17 +55,124 @@ class VoiceUtils:
             tts.write_to_fp(audio_buffer)
             audio_buffer.seek(0)
             
+            if encoder is not None:
+                encoded = encoder.encode(audio_buffer.getvalue())
+                if encoded is None:
+                    return None
+                audio_buffer = BytesIO(encoded)
+            
+            if cache is not None:
+                cache.put(text, lang, slow, audio_buffer.getvalue())
+            
             return audio_buffer
             
         except Exception as e:
             logger.error(f"Text-to-speech conversion failed: {e}")
             return None
     
+    @staticmethod
+    async def text_to_speech_async(text: str, pool: TTSWorkerPool, lang: str = 'fa', slow: bool = False,
+                                   cache: Optional[AudioCache] = None,
+                                   encoder: Optional[OpusEncoder] = None) -> Optional[BytesIO]:
+        """Convert text to speech on a worker pool; None when the pool is saturated
+        
+        Cache hits are answered directly without taking a worker slot, and
+        concurrent requests for the same audio wait on a single job.
+        """
+        if cache is not None:
+            cached = await cache.get_async(text, lang, slow)
+            if cached is not None:
+                return BytesIO(cached)
+        
+        audio_bytes = await _tts_flights.do(
+            AudioCache.make_key(text, lang, slow, 'opus' if encoder is not None else 'mp3'),
+            lambda: VoiceUtils._synthesize_bytes(text, pool, lang, slow, cache, encoder)
+        )
+        # Each caller gets its own buffer over the shared bytes
+        return BytesIO(audio_bytes) if audio_bytes else None
+    
+    @staticmethod
+    async def _synthesize_bytes(text: str, pool: TTSWorkerPool, lang: str, slow: bool,
+                                cache: Optional[AudioCache], encoder: Optional[OpusEncoder]) -> Optional[bytes]:
+        # Encoding runs in the worker too, so the ffmpeg subprocess never blocks the event loop
+        audio_buffer = await pool.run(VoiceUtils.text_to_speech, text, lang, slow, None, encoder)
+        if audio_buffer is None:
+            return None
+        
+        audio_bytes = audio_buffer.getvalue()
+        if cache is not None:
+            await cache.put_async(text, lang, slow, audio_bytes)
+        return audio_bytes
+    
+    @staticmethod
+    async def text_to_speech_parts(text: str, pool: TTSWorkerPool, lang: str = 'fa',
+                                   cache: Optional[AudioCache] = None, encoder: Optional[OpusEncoder] = None,
+                                   chunk_chars: int = 200, first_chunk_chars: int = 100,
+                                   concurrency: int = 3) -> AsyncIterator[BytesIO]:
+        """Speech for text in at most two parts, the first as soon as it is ready
+        
+        Text longer than one chunk is split at sentence boundaries and the
+        chunks are synthesized in parallel (at most concurrency on the pool at
+        once). The first, short chunk is yielded as soon as it is done, so
+        time to first audio does not grow with the text; the others are joined
+        without re-encoding into a second part. Stops early if a chunk fails.
+        """
+        # Text that fits in one chunk is spoken in one message
+        chunks = split_sentences(text, chunk_chars, first_chunk_chars) if len(text) > chunk_chars else [text]
+        if len(chunks) <= 1:
+            audio_buffer = await VoiceUtils.text_to_speech_async(text, pool, lang=lang, cache=cache, encoder=encoder)
+            if audio_buffer:
+                yield audio_buffer
+            return
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def synthesize(chunk: str) -> Optional[BytesIO]:
+            async with semaphore:
+                return await VoiceUtils.text_to_speech_async(chunk, pool, lang=lang, cache=cache, encoder=encoder)
+        
+        # Chunks queue on the semaphore in order, so the first one starts first
+        tasks = [asyncio.ensure_future(synthesize(chunk)) for chunk in chunks]
+        try:
+            first = await tasks[0]
+            if first is None:
+                return
+            yield first
+            rest = await asyncio.gather(*tasks[1:])
+            if any(audio_buffer is None for audio_buffer in rest):
+                logger.warning(f"Speech for {len(chunks) - 1} chunks after the first is incomplete, not sent")
+                return
+            audio_format = 'opus' if encoder is not None else 'mp3'
+            yield BytesIO(join_audio([audio_buffer.getvalue() for audio_buffer in rest], audio_format))
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    @staticmethod
+    async def warm_up(texts: Iterable[str], pool: TTSWorkerPool, lang: str = 'fa', concurrency: int = 2,
+                      cache: Optional[AudioCache] = None,
+                      encoder: Optional[OpusEncoder] = None) -> Dict[str, bytes]:
+        """Synthesize phrases known in advance; returns the audio of those that succeeded
+        
+        At most concurrency jobs are on the pool at once so live requests
+        keep their slots. Phrases already in the cache cost a lookup.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def synthesize(text: str):
+            async with semaphore:
+                audio_buffer = await VoiceUtils.text_to_speech_async(text, pool, lang=lang, cache=cache,
+                                                                     encoder=encoder)
+            return text, audio_buffer.getvalue() if audio_buffer else None
+        
+        results = await asyncio.gather(*(synthesize(text) for text in dict.fromkeys(texts)))
+        return {text: audio for text, audio in results if audio}
+    
     @staticmethod
     def text_to_speech_file(text: str, filename: str, lang: str = 'fa', slow: bool = False) -> bool:
         """Convert text to speech and save to file"""
         try:
-            tts = gTTS(text=text, lang=lang, slow=slow)
+            tts = load_gtts()(text=text, lang=lang, slow=slow)
             tts.save(filename)
             return True
             
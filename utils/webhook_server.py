@@ -0,0 +1,209 @@
+import asyncio
+import json
+import logging
+import secrets
+from typing import Iterable, List, Optional
+
+from telegram import Update
+from telegram.ext import (
+    Application, BaseHandler, CallbackQueryHandler, ChosenInlineResultHandler, CommandHandler,
+    InlineQueryHandler, MessageHandler
+)
+
+logger = logging.getLogger(__name__)
+
+# Addresses only this machine can reach; elsewhere the endpoint must check a secret
+_LOOPBACK = ('127.0.0.1', 'localhost', '::1')
+
+# Update types each handler class can react to
+_HANDLER_UPDATE_TYPES = {
+    CommandHandler: [Update.MESSAGE],
+    MessageHandler: [Update.MESSAGE],
+    CallbackQueryHandler: [Update.CALLBACK_QUERY],
+    InlineQueryHandler: [Update.INLINE_QUERY],
+    ChosenInlineResultHandler: [Update.CHOSEN_INLINE_RESULT],
+}
+
+
+def derive_allowed_updates(handlers: Iterable[BaseHandler]) -> List[str]:
+    """Return the update types the given handlers can actually handle
+
+    Takes the handlers rather than an Application, so a process that only
+    polls (the supervisor) need not build one. Falls back to every update
+    type if a handler of unknown kind is given.
+    """
+    allowed = set()
+    for handler in handlers:
+        update_types = _HANDLER_UPDATE_TYPES.get(type(handler))
+        if update_types is None:
+            logger.warning(f"Unknown handler {type(handler).__name__}, requesting all update types")
+            return list(Update.ALL_TYPES)
+        allowed.update(update_types)
+    return sorted(allowed)
+
+
+class WebhookApp:
+    """Minimal ASGI application that feeds Telegram webhook updates to a bot
+
+    Runs the PTB Application from the ASGI lifespan. On shutdown it stops
+    accepting updates (Telegram retries rejected deliveries), then waits up
+    to drain_timeout seconds for queued and in-flight updates to finish.
+    Request bodies over max_body_size bytes are rejected unread.
+    """
+
+    def __init__(self, application: Application, path: str = '/telegram', webhook_url: Optional[str] = None,
+                 secret_token: Optional[str] = None, allowed_updates: Optional[List[str]] = None,
+                 max_connections: int = 40, drain_timeout: float = 30.0, max_body_size: int = 1024 * 1024):
+        self.application = application
+        self.path = path
+        self.webhook_url = webhook_url
+        # When we register the webhook ourselves, always protect it with a secret
+        self.secret_token = secret_token or (secrets.token_urlsafe(32) if webhook_url else None)
+        self.allowed_updates = allowed_updates
+        self.max_connections = max_connections
+        self.drain_timeout = drain_timeout
+        self.max_body_size = max_body_size
+        self.accepting = False
+        self.received = 0
+        self.rejected = 0
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def startup(self) -> None:
+        application = self.application
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        if self.webhook_url:
+            await application.bot.set_webhook(
+                url=self.webhook_url,
+                allowed_updates=self.allowed_updates,
+                secret_token=self.secret_token,
+                max_connections=self.max_connections
+            )
+            logger.info(f"Webhook set to {self.webhook_url} for {self.allowed_updates}")
+        self.accepting = True
+
+    async def shutdown(self) -> None:
+        application = self.application
+        self.accepting = False
+        logger.info(f"Draining {application.update_queue.qsize()} queued updates")
+        try:
+            # stop() processes everything already queued and waits for running handlers
+            await asyncio.wait_for(application.stop(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Updates still running after {self.drain_timeout}s drain timeout")
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    logger.exception("Webhook startup failed")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send) -> None:
+        method = scope['method']
+        path = scope['path']
+        if method == 'GET' and path == '/healthz':
+            status = 200 if self.accepting else 503
+            await _respond(send, status, b'ok' if self.accepting else b'draining')
+            return
+        if path != self.path:
+            await _respond(send, 404, b'not found')
+            return
+        if method != 'POST':
+            await _respond(send, 405, b'method not allowed')
+            return
+
+        headers = dict(scope.get('headers') or [])
+        if self.secret_token:
+            token = headers.get(b'x-telegram-bot-api-secret-token', b'').decode('latin-1')
+            if not secrets.compare_digest(token, self.secret_token):
+                await _respond(send, 403, b'forbidden')
+                return
+        if not self.accepting:
+            # Telegram redelivers on non-2xx, so nothing is lost while draining
+            self.rejected += 1
+            await _respond(send, 503, b'draining')
+            return
+
+        content_length = headers.get(b'content-length', b'0')
+        if content_length.isdigit() and int(content_length) > self.max_body_size:
+            await _respond(send, 413, b'payload too large')
+            return
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if len(body) > self.max_body_size:
+                await _respond(send, 413, b'payload too large')
+                return
+            if not message.get('more_body'):
+                break
+
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Malformed webhook payload: {e}")
+            await _respond(send, 400, b'bad request')
+            return
+
+        self.received += 1
+        await self.application.update_queue.put(update)
+        await _respond(send, 200, b'ok')
+
+
+async def _respond(send, status: int, body: bytes) -> None:
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'text/plain'), (b'content-length', str(len(body)).encode())]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def run_webhook_server(webhook_app: WebhookApp, listen: str = '0.0.0.0', port: int = 8443) -> None:
+    """Serve the webhook app with uvicorn until interrupted
+
+    Refuses to serve an endpoint without a secret token on an address other
+    machines can reach, since anyone could then post updates to the bot.
+    """
+    if webhook_app.secret_token is None:
+        if listen not in _LOOPBACK:
+            raise RuntimeError(
+                f"Refusing to serve an unauthenticated webhook on {listen}: set WEBHOOK_SECRET "
+                "(or WEBHOOK_URL), or listen on 127.0.0.1 behind a proxy"
+            )
+        logger.warning(f"Webhook on {listen}:{port} has no secret token and accepts any local request")
+    try:
+        import uvicorn
+    except ImportError:
+        raise RuntimeError("Webhook mode needs uvicorn: pip install uvicorn")
+
+    config = uvicorn.Config(
+        webhook_app,
+        host=listen,
+        port=port,
+        lifespan='on',
+        timeout_graceful_shutdown=int(webhook_app.drain_timeout)
+    )
+    uvicorn.Server(config).run()